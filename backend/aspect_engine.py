@@ -0,0 +1,143 @@
+"""
+Векторизованный расчет аспектов на NumPy.
+
+Движок принимает массивы долгот, строит полную матрицу угловых расстояний,
+проверяет орбисы всех аспектов сразу и возвращает компактный структурированный
+массив ASPECT_DTYPE. Словари в привычном формате строятся только на границе
+(natal_aspects_to_dicts / transit_aspects_to_dicts).
+
+Первая ось входных массивов может быть пакетной: долготы формы (B, N)
+обрабатываются за один вызов (много карт или много дат).
+"""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+ASPECT_DTYPE = np.dtype([
+    ('batch', np.int32),      # индекс карты/даты в пакете
+    ('i', np.int16),          # индекс первой точки
+    ('j', np.int16),          # индекс второй точки
+    ('aspect', np.int8),      # индекс аспекта в таблице движка
+    ('actual_angle', np.float64),
+    ('orb', np.float64),
+    ('strength', np.float64)
+])
+
+
+class AspectEngine:
+    """Поиск аспектов по таблице {точный угол: (название, орбис)}"""
+
+    def __init__(self, aspects: Dict[int, Tuple[str, float]]):
+        # Порядок таблицы важен: при пересечении орбисов берется первый аспект, как в циклах по словарю
+        self.exact_angles = [angle for angle in aspects]
+        self.names = [name for name, _ in aspects.values()]
+        self.orb_limits = [orb for _, orb in aspects.values()]
+        self._angles = np.array(self.exact_angles, dtype=np.float64)
+        self._orbs = np.array(self.orb_limits, dtype=np.float64)
+
+    @staticmethod
+    def angle_matrix(lon_a: np.ndarray, lon_b: np.ndarray) -> np.ndarray:
+        """Кратчайшее угловое расстояние между всеми парами точек: (..., N, M)"""
+        distance = np.abs(lon_a[..., :, None] - lon_b[..., None, :])
+        return np.minimum(distance, 360 - distance)
+
+    def find(self, lon_a, lon_b=None, pair_mask: np.ndarray = None) -> np.ndarray:
+        """
+        Аспекты между точками lon_a и lon_b (или внутри lon_a, если lon_b не задан).
+
+        Args:
+            lon_a: долготы формы (N,) или (B, N)
+            lon_b: долготы формы (M,) или (B, M); None - пары i < j внутри lon_a
+            pair_mask: булева маска (N, M) допустимых пар
+
+        Returns:
+            Массив ASPECT_DTYPE, отсортированный по пакету и убыванию силы
+        """
+        lon_a = np.asarray(lon_a, dtype=np.float64)
+        if lon_a.ndim == 1:
+            lon_a = lon_a[None, :]
+
+        if lon_b is None:
+            lon_b = lon_a
+            n = lon_a.shape[-1]
+            upper = np.triu(np.ones((n, n), dtype=bool), k=1)
+            pair_mask = upper if pair_mask is None else (pair_mask & upper)
+        else:
+            lon_b = np.asarray(lon_b, dtype=np.float64)
+            if lon_b.ndim == 1:
+                lon_b = lon_b[None, :]
+
+        angles = self.angle_matrix(lon_a, lon_b)
+
+        # По одному проходу на аспект: память O(B*N*M) вместо O(B*N*M*число_аспектов)
+        aspect_index = np.full(angles.shape, -1, dtype=np.int8)
+        orb_matrix = np.zeros(angles.shape, dtype=np.float64)
+        for index, (exact, limit) in enumerate(zip(self._angles, self._orbs)):
+            deviation = np.abs(angles - exact)
+            hit = (deviation <= limit) & (aspect_index < 0)
+            aspect_index[hit] = index
+            np.copyto(orb_matrix, deviation, where=hit)
+
+        matched = aspect_index >= 0
+        if pair_mask is not None:
+            matched &= pair_mask
+
+        batch, i, j = np.nonzero(matched)
+        aspect = aspect_index[batch, i, j]
+        actual = angles[batch, i, j]
+        orb = orb_matrix[batch, i, j]
+
+        result = np.empty(len(batch), dtype=ASPECT_DTYPE)
+        result['batch'] = batch
+        result['i'] = i
+        result['j'] = j
+        result['aspect'] = aspect
+        result['actual_angle'] = actual
+        result['orb'] = orb
+        result['strength'] = 1.0 - orb / self._orbs[aspect]
+
+        # Устойчивая сортировка сохраняет порядок пар при равной силе, как list.sort
+        order = np.lexsort((-result['strength'], result['batch']))
+        return result[order]
+
+    def natal_aspects_to_dicts(self, records: np.ndarray, names: Sequence[str]) -> List[Dict]:
+        """Формат MLNatalChartCalculator.calculate_aspects_ml"""
+        return [
+            {
+                'point1': names[i],
+                'point2': names[j],
+                'aspect': self.names[aspect],
+                'exact_angle': self.exact_angles[aspect],
+                'actual_angle': round(actual, 4),
+                'orb': round(orb, 4),
+                'strength': strength
+            }
+            for i, j, aspect, actual, orb, strength in zip(
+                records['i'].tolist(), records['j'].tolist(), records['aspect'].tolist(),
+                records['actual_angle'].tolist(), records['orb'].tolist(), records['strength'].tolist()
+            )
+        ]
+
+    def transit_aspects_to_dicts(self, records: np.ndarray, transit_names: Sequence[str],
+                                 natal_names: Sequence[str]) -> List[Dict]:
+        """Формат AstroPredictor.analyze_aspects"""
+        return [
+            {
+                'transit_planet': transit_names[i],
+                'natal_planet': natal_names[j],
+                'aspect': self.names[aspect],
+                'exact_angle': self.exact_angles[aspect],
+                'actual_angle': actual,
+                'orb': orb,
+                'strength': strength
+            }
+            for i, j, aspect, actual, orb, strength in zip(
+                records['i'].tolist(), records['j'].tolist(), records['aspect'].tolist(),
+                records['actual_angle'].tolist(), records['orb'].tolist(), records['strength'].tolist()
+            )
+        ]
+
+
+def same_name_mask(names_a: Sequence[str], names_b: Sequence[str]) -> np.ndarray:
+    """Маска пар, исключающая одноименные точки (транзитное Солнце - натальное Солнце)"""
+    return np.array([[a != b for b in names_b] for a in names_a], dtype=bool).reshape(len(names_a), len(names_b))
@@ -1,10 +1,14 @@
 from backend.user_services import create_or_update_user, get_user_profile, update_user_profession, increment_request_count
-from backend.chart_services import create_and_save_natal_chart, get_user_natal_chart
+from backend.chart_services import create_and_save_natal_chart
 from backend.matrix_services import calculate_and_save_psyho_matrix, get_user_matrix
-from backend.prediction_services import generate_and_save_prediction, get_user_predictions, \
+from backend.prediction_services import get_user_predictions, \
     format_data_for_user, format_data_for_model
-from backend.biorhythm_services import calculate_and_save_biorhythms, get_user_biorhythms
+from backend.biorhythm_services import calculate_and_save_biorhythms
 from backend.database import async_session
+from backend.request_context import RequestContext
+from backend.data_status import get_data_status_mask, status_from_mask
+from backend.prediction_pipeline import run_prediction_pipeline
+from backend.prediction_cache import prediction_cache
 from datetime import datetime, date, timedelta
 from backend.moon import calculate_lunar_phase
 import logging
@@ -20,7 +24,8 @@ class PersonalAssistant:
 
     async def collect_user_data(self, telegram_id: int, birth_date: date, birth_time: datetime.time,
                                 birth_city: str, current_city: str = None, profession: str = None,
-                                job_position: str = None, gender: str = None):  # НОВЫЙ ПАРАМЕТР
+                                job_position: str = None, gender: str = None,  # НОВЫЙ ПАРАМЕТР
+                                ctx: RequestContext = None):
         """Сбор и сохранение всех данных пользователя"""
         try:
             logger.info(f"🔄 Начало сбора данных для пользователя {telegram_id}")
@@ -28,6 +33,13 @@ class PersonalAssistant:
             # Используем транзакцию для атомарности операций
             async with async_session() as session:
                 try:
+                    # Предыдущие данные нужны, чтобы не пересчитывать то, что от них не зависит
+                    previous_profile = await get_user_profile(telegram_id, ctx)
+                    birth_date_changed = previous_profile is None or previous_profile['birth_date'] != birth_date
+                    if ctx is not None:
+                        # Соединение не держится открытым во время расчета натальной карты
+                        await ctx.release()
+
                     # 1. Сохраняем основные данные пользователя
                     user = await create_or_update_user(
                         telegram_id=telegram_id,
@@ -39,28 +51,36 @@ class PersonalAssistant:
                         job_position=job_position,
                         gender=gender  # ПЕРЕДАЕМ ПОЛ
                     )
+                    if ctx is not None:
+                        ctx.forget_profile()
                     logger.info(f"✅ Данные пользователя сохранены")
 
-                    # 2. Создаем натальную карту
+                    # 2. Создаем натальную карту (пропускается, если данные рождения не изменились)
                     birth_datetime = datetime.combine(birth_date, birth_time)
                     natal_chart = await create_and_save_natal_chart(
                         telegram_id=telegram_id,
                         city=birth_city,
-                        birth_datetime=birth_datetime,
-                        timezone="Europe/Moscow"
+                        birth_datetime=birth_datetime
                     )
                     logger.info(f"✅ Натальная карта создана")
 
-                    # 3. Рассчитываем психоматрицу
-                    matrix_data = await calculate_and_save_psyho_matrix(telegram_id)
-                    logger.info(f"✅ Психоматрица рассчитана")
+                    # 3-4. Психоматрица и биоритмы зависят только от даты рождения
+                    if birth_date_changed or await get_user_matrix(telegram_id, ctx) is None:
+                        matrix_data = await calculate_and_save_psyho_matrix(telegram_id, ctx)
+                        logger.info(f"✅ Психоматрица рассчитана")
 
-                    # 4. Рассчитываем биоритмы на сегодня
-                    biorhythms = await calculate_and_save_biorhythms(telegram_id)
-                    logger.info(f"✅ Биоритмы рассчитаны")
+                        biorhythms = await calculate_and_save_biorhythms(telegram_id, ctx=ctx)
+                        logger.info(f"✅ Биоритмы рассчитаны")
+                    else:
+                        logger.info(f"⏭️ Дата рождения не изменилась, психоматрица и биоритмы актуальны")
 
                     await session.commit()
 
+                    # Данные на даты, рассчитанные по прежним данным рождения, больше не нужны
+                    prediction_cache.invalidate_user(telegram_id)
+                    if ctx is not None:
+                        await ctx.release()
+
                     return {
                         'success': True,
                         'message': "✅ Все данные успешно собраны и сохранены!",
@@ -84,27 +104,23 @@ class PersonalAssistant:
                 'message': f"❌ Ошибка при сборе данных: {str(e)}"
             }
 
-    async def get_recommendations(self, telegram_id: int, target_date: date):
+    async def get_recommendations(self, telegram_id: int, target_date: date, ctx: RequestContext = None):
         """Получение данных на выбранную дату"""
         try:
             logger.info(f"📅 Формирование данных на {target_date} для {telegram_id}")
 
-            # Увеличиваем счетчик обращений
-            await increment_request_count(telegram_id)
-            logger.info(f"📈 Счетчик обращений увеличен для {telegram_id}")
-
             # Проверяем что дата не в прошлом
             if target_date < date.today():
+                await increment_request_count(telegram_id)
                 return {
                     'success': False,
                     'message': "❌ Нельзя получить данные для прошедших дат"
                 }
 
-            # Генерируем и сохраняем данные для выбранной даты
-            prediction = await generate_and_save_prediction(telegram_id, target_date)
-
-            # Получаем профиль пользователя для модели
-            user_profile = await get_user_profile(telegram_id)
+            # Счетчик обращений, расчет и сохранение данных на дату - одна транзакция,
+            # профиль пользователя возвращается тем же запросом
+            prediction, user_profile = await run_prediction_pipeline(telegram_id, target_date, ctx)
+            logger.info(f"📈 Счетчик обращений увеличен для {telegram_id}")
 
             # 1. Данные для пользователя (через бот)
             user_data = await format_data_for_user(prediction)
@@ -141,13 +157,14 @@ class PersonalAssistant:
         return await self.get_recommendations(telegram_id, target_date)
 
     async def update_professional_info(self, telegram_id: int, current_city: str, profession: str,
-                                       job_position: str = None, gender: str = None):  # НОВЫЙ ПАРАМЕТР
+                                       job_position: str = None, gender: str = None,  # НОВЫЙ ПАРАМЕТР
+                                       ctx: RequestContext = None):
         """Обновление профессиональной информации"""
         try:
             await update_user_profession(telegram_id, profession, job_position)
 
-            # Обновляем город проживания и пол
-            user_profile = await get_user_profile(telegram_id)
+            # Обновляем город проживания и пол (данные рождения из профиля не менялись)
+            user_profile = await get_user_profile(telegram_id, ctx)
             if user_profile:
                 await create_or_update_user(
                     telegram_id=telegram_id,
@@ -159,6 +176,8 @@ class PersonalAssistant:
                     job_position=job_position,
                     gender=gender  # ПЕРЕДАЕМ ПОЛ
                 )
+            if ctx is not None:
+                ctx.forget_profile()
 
             logger.info(f"✅ Профессиональные данные обновлены для {telegram_id}")
             return {
@@ -173,27 +192,13 @@ class PersonalAssistant:
                 'message': f"❌ Ошибка обновления данных: {str(e)}"
             }
 
-    async def get_user_data_status(self, telegram_id: int):
-        """Проверка статуса собранных данных пользователя"""
+    async def get_user_data_status(self, telegram_id: int, ctx: RequestContext = None):
+        """
+        Проверка статуса собранных данных пользователя (backend/data_status.py):
+        маска полноты из кэша процесса или один запрос EXISTS, без расчетов и записи.
+        """
         try:
-            user_profile = await get_user_profile(telegram_id)
-            natal_chart = await get_user_natal_chart(telegram_id)
-            psyho_matrix = await get_user_matrix(telegram_id)
-            biorhythms = await get_user_biorhythms(telegram_id)
-
-            has_basic_data = user_profile is not None
-            has_natal_chart = natal_chart is not None
-            has_psyho_matrix = psyho_matrix is not None
-            has_biorhythms = biorhythms is not None
-
-            return {
-                'has_basic_data': has_basic_data,
-                'has_natal_chart': has_natal_chart,
-                'has_psyho_matrix': has_psyho_matrix,
-                'has_biorhythms': has_biorhythms,
-                'is_complete': has_basic_data and has_natal_chart and has_psyho_matrix and has_biorhythms,
-                'user_profile': user_profile
-            }
+            return status_from_mask(await get_data_status_mask(telegram_id, ctx))
 
         except Exception as e:
             logger.error(f"❌ Ошибка проверки статуса данных для {telegram_id}: {e}")
@@ -204,15 +209,19 @@ class PersonalAssistant:
                 'has_biorhythms': False,
                 'is_complete': False
             }
+        finally:
+            if ctx is not None:
+                # Соединение возвращается в пул до ответа пользователю
+                await ctx.release()
 
-    async def get_user_statistics(self, telegram_id: int):
+    async def get_user_statistics(self, telegram_id: int, ctx: RequestContext = None):
         """Получение статистики пользователя"""
         try:
             from backend.prediction_services import get_prediction_statistics
             from backend.biorhythm_services import get_biorhythm_statistics
             from backend.user_services import get_user_request_count
 
-            data_status = await self.get_user_data_status(telegram_id)
+            data_status = await self.get_user_data_status(telegram_id, ctx)
             prediction_stats = await get_prediction_statistics(telegram_id)
             biorhythm_stats = await get_biorhythm_statistics(telegram_id)
             request_count = await get_user_request_count(telegram_id)
@@ -247,9 +256,9 @@ class PersonalAssistant:
             logger.info(f"🧹 Очищены данные для пользователя {telegram_id}")
             return {
                 'success': True,
-                'biorhythm_records_cleaned': biorhythm_cleaned,
-                'prediction_records_cleaned': prediction_cleaned,
-                'message': f"✅ Очищено {biorhythm_cleaned} записей биоритмов и {prediction_cleaned} предсказаний"
+                'biorhythm_partitions_dropped': biorhythm_cleaned,
+                'prediction_partitions_dropped': prediction_cleaned,
+                'message': f"✅ Удалено {biorhythm_cleaned} секций истории биоритмов и {prediction_cleaned} секций предсказаний"
             }
 
         except Exception as e:
@@ -259,12 +268,12 @@ class PersonalAssistant:
                 'message': f"❌ Ошибка при очистке данных: {str(e)}"
             }
 
-    async def validate_user_data(self, telegram_id: int):
+    async def validate_user_data(self, telegram_id: int, ctx: RequestContext = None):
         """Проверка корректности данных пользователя"""
         try:
             from backend.prediction_services import validate_prediction_data
 
-            data_status = await self.get_user_data_status(telegram_id)
+            data_status = await self.get_user_data_status(telegram_id, ctx)
             prediction_valid = await validate_prediction_data(telegram_id)
 
             issues = []
@@ -0,0 +1,70 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Tuple
+import logging
+
+from backend.biorhythm_calculator import BiorhythmCalculator, read_only
+
+logger = logging.getLogger(__name__)
+
+BIORHYTHM_CACHE_SIZE = int(os.getenv('BIORHYTHM_CACHE_SIZE', '65536'))
+
+
+class BiorhythmCache:
+    """
+    Биоритмы - чистая функция (дата рождения, дата расчета), поэтому вместо
+    хранения в БД они вычисляются при чтении и держатся в памяти процесса.
+    Пользователи с одной датой рождения делят записи. Вытеснение по LRU.
+
+    Возвращаемые данные общие для всех вызывающих, поэтому хранятся только
+    для чтения (read_only): изменение на месте вызывает TypeError, для
+    изменяемой копии - copy.deepcopy(...). JSON и pickle видят обычные dict/list.
+    """
+
+    def __init__(self, max_size: int = BIORHYTHM_CACHE_SIZE):
+        self.max_size = max_size
+        self._calculator = BiorhythmCalculator()
+        self._entries: "OrderedDict[Tuple[date, date], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, birth_date: date, target_date: date) -> Dict:
+        key = (birth_date, target_date)
+        with self._lock:
+            biorhythm_data = self._entries.get(key)
+            if biorhythm_data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return biorhythm_data
+            self.misses += 1
+
+        # Расчет вне блокировки: при гонке обе копии одинаковы
+        biorhythm_data = read_only(self._calculator.calculate_biorhythms(birth_date, target_date))
+        with self._lock:
+            self._entries[key] = biorhythm_data
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return biorhythm_data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+
+# Глобальный кэш биоритмов процесса бота
+biorhythm_cache = BiorhythmCache()
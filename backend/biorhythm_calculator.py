@@ -1,10 +1,91 @@
+import copy
 import math
 from datetime import date, datetime, timedelta
-from typing import Dict, List, Tuple
+from itertools import combinations
+from typing import Dict, List, Sequence, Tuple
 import logging
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
+# Порядок циклов в массивах calculate_range (последняя ось) и их вес в общей энергии
+CYCLE_NAMES = ('physical', 'emotional', 'intellectual', 'intuitive')
+CYCLE_PERIODS = (23, 28, 33, 38)
+CYCLE_WEIGHTS = (0.3, 0.25, 0.25, 0.2)
+
+# Коды тренда в массиве calculate_range()['trend']
+TREND_NAMES = {1: "растет", -1: "падает", 0: "стабильно"}
+
+# Критические и пиковые дни определяются по трем основным циклам (как в _find_critical_days/_find_peak_days)
+EVENT_CYCLES = CYCLE_NAMES[:3]
+CYCLE_LABELS = {'physical': 'физический', 'emotional': 'эмоциональный',
+                'intellectual': 'интеллектуальный', 'intuitive': 'интуитивный'}
+CRITICAL_THRESHOLD = 0.9
+PEAK_THRESHOLD = 0.8
+
+
+def _round(values: np.ndarray, digits: int) -> np.ndarray:
+    """
+    Округление как у встроенного round(): np.round ошибается на значениях, близких к половине,
+    поэтому такие элементы (их единицы на тысячи) досчитываются через round().
+    """
+    scale = 10.0 ** digits
+    scaled = values * scale
+    result = np.round(values, digits)
+    near_half = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6
+    if near_half.any():
+        result[near_half] = [round(value, digits) for value in values[near_half].tolist()]
+    return result
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("Данные биоритмов общие и неизменяемы, используйте copy.deepcopy(...) для изменяемой копии")
+
+
+class _ReadOnlyDict(dict):
+    """Запись таблицы фаз или кэша: обычный dict для JSON и чтения, но без изменения на месте"""
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # При передаче в другой процесс (pickle) восстанавливается как обычный dict
+        return dict, (dict(self),)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+
+class _ReadOnlyList(list):
+    """Список внутри данных кэша биоритмов: обычный list для JSON и чтения, но без изменения на месте"""
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(value, memo) for value in self]
+
+
+def read_only(value):
+    """Неизменяемая версия данных биоритмов: вложенные dict и list заменяются на _ReadOnlyDict/_ReadOnlyList"""
+    if isinstance(value, dict):
+        if isinstance(value, _ReadOnlyDict) and all(not isinstance(item, (dict, list)) for item in value.values()):
+            return value
+        return _ReadOnlyDict((key, read_only(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return _ReadOnlyList(read_only(item) for item in value)
+    return value
+
 
 class BiorhythmCalculator:
     """
@@ -37,11 +118,11 @@ class BiorhythmCalculator:
             if days_lived < 0:
                 raise ValueError("Дата расчета не может быть раньше даты рождения")
 
-            # Рассчитываем фазы биоритмов
-            physical = self._calculate_cycle(days_lived, self.PHYSICAL_CYCLE)
-            emotional = self._calculate_cycle(days_lived, self.EMOTIONAL_CYCLE)
-            intellectual = self._calculate_cycle(days_lived, self.INTELLECTUAL_CYCLE)
-            intuitive = self._calculate_cycle(days_lived, self.INTUITIVE_CYCLE)
+            # Фазы биоритмов - готовые записи из таблиц по остатку от деления на период
+            physical = self._lookup_cycle(days_lived, self.PHYSICAL_CYCLE)
+            emotional = self._lookup_cycle(days_lived, self.EMOTIONAL_CYCLE)
+            intellectual = self._lookup_cycle(days_lived, self.INTELLECTUAL_CYCLE)
+            intuitive = self._lookup_cycle(days_lived, self.INTUITIVE_CYCLE)
 
             # Общий показатель энергии
             overall_energy = self._calculate_overall_energy(physical, emotional, intellectual, intuitive)
@@ -67,6 +148,13 @@ class BiorhythmCalculator:
             logger.error(f"❌ Ошибка расчета биоритмов: {e}")
             raise
 
+    def _lookup_cycle(self, days_lived: int, cycle_length: int) -> Dict:
+        """Запись цикла из CYCLE_TABLES (для нестандартного периода - прямой расчет)"""
+        table = CYCLE_TABLES.get(cycle_length)
+        if table is None:
+            return self._calculate_cycle(days_lived, cycle_length)
+        return table[days_lived % cycle_length]
+
     def _calculate_cycle(self, days_lived: int, cycle_length: int) -> Dict:
         """
         Расчет одного цикла биоритма
@@ -185,22 +273,220 @@ class BiorhythmCalculator:
         if abs(intellectual['value']) > 0.9: critical.append('интеллектуальный')
         return critical
 
+    def calculate_range(self, birth_dates: Sequence[date], start_date: date, days: int) -> Dict[str, np.ndarray]:
+        """
+        Векторизованный расчет биоритмов для многих пользователей и дней за один проход
+
+        Args:
+            birth_dates: Даты рождения (U пользователей)
+            start_date: Первая дата диапазона
+            days: Количество дней (D)
+
+        Returns:
+            Словарь массивов (циклы - в порядке CYCLE_NAMES):
+                days_lived (U, D), value (U, D, 4), percentage (U, D, 4),
+                trend (U, D, 4) - коды TREND_NAMES, overall_value (U, D), overall_percentage (U, D)
+        """
+        birth_ordinals = np.fromiter((d.toordinal() for d in birth_dates), dtype=np.int64, count=len(birth_dates))
+        days_lived = (start_date.toordinal() - birth_ordinals)[:, None] + np.arange(days, dtype=np.int64)[None, :]
+        if days and days_lived[:, 0].min(initial=0) < 0:
+            raise ValueError("Дата расчета не может быть раньше даты рождения")
+
+        # Значения циклов - выборка из таблиц фаз по остатку от деления на период
+        shape = days_lived.shape + (len(CYCLE_PERIODS),)
+        value = np.empty(shape, dtype=np.float64)
+        percentage = np.empty(shape, dtype=np.float64)
+        trend = np.empty(shape, dtype=np.int8)
+        for cycle_index, period in enumerate(CYCLE_PERIODS):
+            residue = days_lived % period
+            value[..., cycle_index] = _TABLE_VALUES[period][residue]
+            percentage[..., cycle_index] = _TABLE_PERCENTAGES[period][residue]
+            trend[..., cycle_index] = _TABLE_TRENDS[period][residue]
+
+        # Общая энергия, как в _calculate_overall_energy, считается по округленным значениям циклов
+        # (поэлементно и в том же порядке слагаемых, чтобы округление совпадало)
+        total_energy = value[..., 0] * CYCLE_WEIGHTS[0]
+        for cycle_index in range(1, len(CYCLE_WEIGHTS)):
+            total_energy = total_energy + value[..., cycle_index] * CYCLE_WEIGHTS[cycle_index]
+
+        return {
+            'days_lived': days_lived,
+            'value': value,
+            'percentage': percentage,
+            'trend': trend,
+            'overall_value': _round(total_energy, 4),
+            'overall_percentage': _round((total_energy + 1) / 2 * 100, 2)
+        }
+
+    @staticmethod
+    def range_to_forecast(range_data: Dict[str, np.ndarray], start_date: date, user_index: int = 0) -> List[Dict]:
+        """Прогноз одного пользователя из calculate_range в формате calculate_weekly_forecast"""
+        value = range_data['value'][user_index]
+        percentage = range_data['percentage'][user_index].tolist()
+        overall = range_data['overall_percentage'][user_index].tolist()
+
+        # Критические и пиковые дни - по первым трем циклам, как в _find_critical_days/_find_peak_days
+        main_cycles = value[:, :3]
+        is_critical = (np.abs(main_cycles) > 0.9).any(axis=1).tolist()
+        is_peak = (main_cycles > 0.8).any(axis=1).tolist()
+
+        return [
+            {
+                'date': (start_date + timedelta(days=i)).isoformat(),
+                'overall_energy': overall[i],
+                'physical': percentage[i][0],
+                'emotional': percentage[i][1],
+                'intellectual': percentage[i][2],
+                'is_critical': is_critical[i],
+                'is_peak': is_peak[i]
+            }
+            for i in range(len(overall))
+        ]
+
     def calculate_weekly_forecast(self, birth_date: date, start_date: date, days: int = 7) -> List[Dict]:
         """Расчет прогноза биоритмов на несколько дней"""
-        forecast = []
-
-        for i in range(days):
-            current_date = start_date + timedelta(days=i)
-            biorhythms = self.calculate_biorhythms(birth_date, current_date)
-
-            forecast.append({
-                'date': current_date.isoformat(),
-                'overall_energy': biorhythms['overall_energy']['percentage'],
-                'physical': biorhythms['cycles']['physical']['percentage'],
-                'emotional': biorhythms['cycles']['emotional']['percentage'],
-                'intellectual': biorhythms['cycles']['intellectual']['percentage'],
-                'is_critical': len(biorhythms['critical_days']) > 0,
-                'is_peak': len(biorhythms['peak_days']) > 0
-            })
+        return self.range_to_forecast(self.calculate_range([birth_date], start_date, days), start_date)
 
-        return forecast
\ No newline at end of file
+    def find_upcoming_events_batch(self, birth_dates: Sequence[date], start_date: date, horizon_days: int = 365,
+                                   limit: int = 5) -> Dict[str, np.ndarray]:
+        """
+        Ближайшие критические и пиковые дни для многих пользователей без перебора по дням.
+
+        Условие дня для цикла зависит только от days_lived % period, поэтому подходящие дни
+        образуют арифметические прогрессии, а совпадения двух циклов - прогрессии по модулю
+        произведения периодов (китайская теорема об остатках).
+
+        Returns:
+            Смещения в днях от start_date (-1 - нет события в пределах horizon_days):
+                critical, peak - (U, len(EVENT_CYCLES), limit);
+                critical_coincidences, peak_coincidences - (U, limit), дни, когда условие
+                выполняется сразу для двух и более циклов
+        """
+        birth_ordinals = np.fromiter((d.toordinal() for d in birth_dates), dtype=np.int64, count=len(birth_dates))
+        days_lived = start_date.toordinal() - birth_ordinals
+        if days_lived.min(initial=0) < 0:
+            raise ValueError("Дата расчета не может быть раньше даты рождения")
+
+        result = {}
+        for kind in ('critical', 'peak'):
+            result[kind] = np.stack([
+                _next_offsets(days_lived, period, EVENT_RESIDUES[kind][period], limit, horizon_days)
+                for period in (CYCLE_PERIODS[CYCLE_NAMES.index(name)] for name in EVENT_CYCLES)
+            ], axis=1)
+
+            # Совпадения: объединение прогрессий по всем парам циклов без повторов
+            pair_offsets = np.concatenate([
+                _next_offsets(days_lived, modulus, residues, limit, horizon_days)
+                for modulus, residues in EVENT_PAIR_RESIDUES[kind]
+            ], axis=1)
+            pair_offsets[pair_offsets < 0] = np.iinfo(np.int64).max
+            pair_offsets.sort(axis=1)
+            duplicate = np.zeros(pair_offsets.shape, dtype=bool)
+            duplicate[:, 1:] = pair_offsets[:, 1:] == pair_offsets[:, :-1]
+            pair_offsets[duplicate] = np.iinfo(np.int64).max
+            pair_offsets.sort(axis=1)
+            coincidences = pair_offsets[:, :limit]
+            coincidences[coincidences == np.iinfo(np.int64).max] = -1
+            result[f'{kind}_coincidences'] = coincidences
+        return result
+
+    def find_upcoming_events(self, birth_date: date, start_date: date, horizon_days: int = 30,
+                             limit: int = 5) -> Dict:
+        """Ближайшие критические и пиковые дни пользователя по каждому циклу и их совпадения"""
+        events = self.find_upcoming_events_batch([birth_date], start_date, horizon_days, limit)
+        days_lived = (start_date - birth_date).days
+
+        def to_date(offset: int) -> str:
+            return (start_date + timedelta(days=offset)).isoformat()
+
+        result = {'horizon_days': horizon_days}
+        for kind in ('critical', 'peak'):
+            result[f'{kind}_days'] = {
+                name: [to_date(offset) for offset in events[kind][0, cycle_index].tolist() if offset >= 0]
+                for cycle_index, name in enumerate(EVENT_CYCLES)
+            }
+            result[f'{kind}_coincidences'] = [
+                {
+                    'date': to_date(offset),
+                    'cycles': [
+                        CYCLE_LABELS[name] for name in EVENT_CYCLES
+                        if (days_lived + offset) % CYCLE_PERIODS[CYCLE_NAMES.index(name)]
+                        in EVENT_RESIDUE_SETS[kind][CYCLE_PERIODS[CYCLE_NAMES.index(name)]]
+                    ]
+                }
+                for offset in events[f'{kind}_coincidences'][0].tolist() if offset >= 0
+            ]
+        return result
+
+
+# Все четыре цикла имеют целые периоды, поэтому запись цикла зависит только от
+# days_lived % period: 23 + 28 + 33 + 38 = 122 записи, рассчитываются один раз при импорте
+CYCLE_TABLES = {
+    period: tuple(_ReadOnlyDict(BiorhythmCalculator()._calculate_cycle(residue, period)) for residue in range(period))
+    for period in CYCLE_PERIODS
+}
+
+_TREND_CODES = {name: code for code, name in TREND_NAMES.items()}
+_TABLE_VALUES = {period: np.array([entry['value'] for entry in table]) for period, table in CYCLE_TABLES.items()}
+_TABLE_PERCENTAGES = {period: np.array([entry['percentage'] for entry in table])
+                      for period, table in CYCLE_TABLES.items()}
+_TABLE_TRENDS = {period: np.array([_TREND_CODES[entry['trend']] for entry in table], dtype=np.int8)
+                 for period, table in CYCLE_TABLES.items()}
+for _array in (*_TABLE_VALUES.values(), *_TABLE_PERCENTAGES.values(), *_TABLE_TRENDS.values()):
+    _array.setflags(write=False)
+
+
+def _next_offsets(days_lived: np.ndarray, modulus: int, residues: np.ndarray, limit: int,
+                  horizon_days: int) -> np.ndarray:
+    """Первые limit смещений k >= 0, для которых (days_lived + k) % modulus входит в residues"""
+    offsets = np.full((len(days_lived), limit), -1, dtype=np.int64)
+    if len(residues) == 0 or limit <= 0:
+        return offsets
+    first = np.sort((residues[None, :] - days_lived[:, None]) % modulus, axis=1)
+    k = np.arange(limit)
+    offsets = first[:, k % len(residues)] + modulus * (k // len(residues))
+    offsets[offsets >= horizon_days] = -1
+    return offsets
+
+
+def _combined_residues(periods: Sequence[int], residue_sets: Sequence[np.ndarray]) -> Tuple[int, np.ndarray]:
+    """Остатки по модулю НОК периодов, при которых выполняются условия всех циклов сразу"""
+    modulus, residues = 1, [0]
+    for period, period_residues in zip(periods, residue_sets):
+        gcd = math.gcd(modulus, period)
+        step = period // gcd
+        inverse = pow(modulus // gcd, -1, step) if step > 1 else 0
+        combined = set()
+        for a in residues:
+            for r in period_residues.tolist():
+                if (r - a) % gcd:
+                    continue
+                t = ((r - a) // gcd * inverse) % step
+                combined.add(a + modulus * t)
+        modulus = modulus * step
+        residues = sorted(x % modulus for x in combined)
+    return modulus, np.array(residues, dtype=np.int64)
+
+
+def _event_residues(condition) -> Dict[int, np.ndarray]:
+    return {
+        period: np.array([residue for residue, entry in enumerate(table) if condition(entry['value'])], dtype=np.int64)
+        for period, table in CYCLE_TABLES.items()
+    }
+
+
+# Остатки days_lived % period, дающие критический (|value| > 0.9) или пиковый (value > 0.8) день
+EVENT_RESIDUES = {
+    'critical': _event_residues(lambda value: abs(value) > CRITICAL_THRESHOLD),
+    'peak': _event_residues(lambda value: value > PEAK_THRESHOLD)
+}
+EVENT_RESIDUE_SETS = {kind: {period: set(residues.tolist()) for period, residues in by_period.items()}
+                      for kind, by_period in EVENT_RESIDUES.items()}
+_EVENT_PERIODS = tuple(CYCLE_PERIODS[CYCLE_NAMES.index(name)] for name in EVENT_CYCLES)
+EVENT_PAIR_RESIDUES = {
+    kind: [
+        _combined_residues(pair, [EVENT_RESIDUES[kind][period] for period in pair])
+        for pair in combinations(_EVENT_PERIODS, 2)
+    ]
+    for kind in EVENT_RESIDUES
+}
@@ -0,0 +1,171 @@
+"""
+Типизированная история биоритмов в таблице biorhythm_history.
+
+Таблица секционирована по месяцам (db_biorhythm_history.sql), по строке на
+пользователя и дату. Значения циклов хранятся колонками, а не JSON, поэтому
+пакетный предрасчет пишется через COPY (asyncpg copy_records_to_table), а
+прогнозы и аналитика читают диапазоны дат по первичному ключу.
+"""
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Sequence, Tuple
+import logging
+
+import numpy as np
+from sqlalchemy.future import select
+
+from backend.database import async_engine, async_session, BiorhythmHistory
+from backend.biorhythm_calculator import BiorhythmCalculator, CYCLE_NAMES, TREND_NAMES
+from backend.partitions import ensure_monthly_partitions
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TABLE = BiorhythmHistory.__tablename__
+
+# Порядок колонок для COPY
+HISTORY_COLUMNS = (
+    ('telegram_id', 'calculation_date', 'days_lived')
+    + tuple(f'{name}_{field}' for name in CYCLE_NAMES for field in ('value', 'percentage', 'trend'))
+    + ('overall_value', 'overall_percentage', 'is_critical', 'is_peak')
+)
+
+# Точность округления в calculate_biorhythms: REAL хранит 7 значащих цифр,
+# поэтому при чтении значения округляются обратно без потерь
+_VALUE_DIGITS = 4
+_PERCENTAGE_DIGITS = 2
+
+_TREND_CODES = {name: code for code, name in TREND_NAMES.items()}
+
+
+async def ensure_history_partitions(start_date: date, end_date: date):
+    """Создание недостающих месячных секций biorhythm_history для диапазона [start_date, end_date]"""
+    await ensure_monthly_partitions(HISTORY_TABLE, start_date, end_date)
+
+
+def history_row(telegram_id: int, biorhythm_data: Dict) -> Dict:
+    """Строка biorhythm_history из результата calculate_biorhythms"""
+    cycles = biorhythm_data['cycles']
+    row = {
+        'telegram_id': telegram_id,
+        'calculation_date': date.fromisoformat(biorhythm_data['calculation_date']),
+        'days_lived': biorhythm_data['days_lived']
+    }
+    for name in CYCLE_NAMES:
+        row[f'{name}_value'] = cycles[name]['value']
+        row[f'{name}_percentage'] = cycles[name]['percentage']
+        row[f'{name}_trend'] = _TREND_CODES[cycles[name]['trend']]
+    row.update({
+        'overall_value': biorhythm_data['overall_energy']['value'],
+        'overall_percentage': biorhythm_data['overall_energy']['percentage'],
+        'is_critical': bool(biorhythm_data['critical_days']),
+        'is_peak': bool(biorhythm_data['peak_days'])
+    })
+    return row
+
+
+def history_records(telegram_ids: Sequence[int], birth_dates: Sequence[date], start_date: date,
+                    days: int) -> List[Tuple]:
+    """Записи для COPY (в порядке HISTORY_COLUMNS) на days дней для группы пользователей"""
+    range_data = BiorhythmCalculator().calculate_range(birth_dates, start_date, days)
+    users = len(telegram_ids)
+
+    # Критические и пиковые дни - по первым трем циклам, как в range_to_forecast
+    main_cycles = range_data['value'][..., :3]
+    columns = [
+        np.repeat(np.asarray(telegram_ids, dtype=np.int64), days).tolist(),
+        [start_date + timedelta(days=i) for i in range(days)] * users,
+        range_data['days_lived'].ravel().tolist()
+    ]
+    for cycle_index in range(len(CYCLE_NAMES)):
+        columns.append(range_data['value'][..., cycle_index].ravel().tolist())
+        columns.append(range_data['percentage'][..., cycle_index].ravel().tolist())
+        columns.append(range_data['trend'][..., cycle_index].ravel().tolist())
+    columns += [
+        range_data['overall_value'].ravel().tolist(),
+        range_data['overall_percentage'].ravel().tolist(),
+        (np.abs(main_cycles) > 0.9).any(axis=-1).ravel().tolist(),
+        (main_cycles > 0.8).any(axis=-1).ravel().tolist()
+    ]
+    return list(zip(*columns))
+
+
+async def copy_history_records(records: Iterable[Tuple], telegram_ids: Sequence[int], start_date: date,
+                               end_date: date) -> int:
+    """
+    Запись готовых строк через COPY с заменой существующих строк этих
+    пользователей в диапазоне дат (повторный предрасчет идемпотентен).
+    DELETE и COPY выполняются одной транзакцией: при ошибке COPY прежняя
+    история сохраняется.
+    """
+    await ensure_history_partitions(start_date, end_date)
+    async with async_engine.connect() as conn:
+        raw_connection = await conn.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        # Адаптер SQLAlchemy открывает транзакцию только для своих запросов: запросы напрямую
+        # в asyncpg без явной транзакции фиксировались бы по отдельности, и DELETE
+        # оставался бы в силе после ошибки COPY
+        async with driver_connection.transaction():
+            await driver_connection.execute(
+                f"DELETE FROM {HISTORY_TABLE} WHERE telegram_id = ANY($1::bigint[]) "
+                f"AND calculation_date BETWEEN $2 AND $3",
+                list(telegram_ids), start_date, end_date
+            )
+            result = await driver_connection.copy_records_to_table(HISTORY_TABLE, records=records,
+                                                                   columns=HISTORY_COLUMNS)
+    # Ответ сервера вида "COPY 12345"
+    return int(result.split()[-1])
+
+
+async def write_biorhythm_history(users: Sequence[Tuple[int, date]], start_date: date, days: int,
+                                  batch_size: int = 1000) -> int:
+    """
+    Пакетный предрасчет истории биоритмов.
+
+    Args:
+        users: Пары (telegram_id, дата рождения)
+        start_date: Первая дата
+        days: Количество дней
+        batch_size: Пользователей в одном COPY
+
+    Returns:
+        Количество записанных строк
+    """
+    end_date = start_date + timedelta(days=days - 1)
+    written = 0
+    for offset in range(0, len(users), batch_size):
+        batch = users[offset:offset + batch_size]
+        telegram_ids = [telegram_id for telegram_id, _ in batch]
+        records = history_records(telegram_ids, [birth_date for _, birth_date in batch], start_date, days)
+        written += await copy_history_records(records, telegram_ids, start_date, end_date)
+
+    logger.info(f"💾 История биоритмов записана: {len(users)} пользователей x {days} дней ({written} строк)")
+    return written
+
+
+def _row_to_day(row) -> Dict:
+    return {
+        'date': row.calculation_date.isoformat(),
+        'overall_energy': round(row.overall_percentage, _PERCENTAGE_DIGITS),
+        'overall_value': round(row.overall_value, _VALUE_DIGITS),
+        **{name: round(getattr(row, f'{name}_percentage'), _PERCENTAGE_DIGITS) for name in CYCLE_NAMES},
+        'values': {name: round(getattr(row, f'{name}_value'), _VALUE_DIGITS) for name in CYCLE_NAMES},
+        'trends': {name: TREND_NAMES[getattr(row, f'{name}_trend')] for name in CYCLE_NAMES},
+        'is_critical': row.is_critical,
+        'is_peak': row.is_peak
+    }
+
+
+async def read_biorhythm_history(telegram_id: int, start_date: date, end_date: date) -> List[Dict]:
+    """
+    Чтение истории за [start_date, end_date] по первичному ключу.
+    Формат дня совместим с calculate_weekly_forecast (плюс intuitive, values и trends).
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            select(BiorhythmHistory)
+            .where(
+                BiorhythmHistory.telegram_id == telegram_id,
+                BiorhythmHistory.calculation_date.between(start_date, end_date)
+            )
+            .order_by(BiorhythmHistory.calculation_date)
+        )
+        return [_row_to_day(row) for row in result.scalars()]
@@ -1,62 +1,56 @@
-from backend.database import async_session, Biorhythms
+from backend.database import async_session, BiorhythmHistory
 from backend.biorhythm_calculator import BiorhythmCalculator
+from backend.biorhythm_cache import biorhythm_cache
+from backend.biorhythm_history import HISTORY_TABLE, ensure_history_partitions, history_row, read_biorhythm_history
+from backend.partitions import drop_partitions_before
 from backend.user_services import get_user_profile
+from backend.upserts import upsert
+from backend.request_context import RequestContext
 from sqlalchemy.future import select
-from sqlalchemy import func, and_
+from sqlalchemy import func
 from datetime import date, datetime, timedelta
+from typing import Optional
 import logging
 import asyncio
+import os
 
 logger = logging.getLogger(__name__)
 
+# Биоритмы вычисляются при чтении; история biorhythm_history пишется при расчете только для аудита
+BIORHYTHM_AUDIT = os.getenv('BIORHYTHM_AUDIT', '0') == '1'
 
-async def calculate_and_save_biorhythms(telegram_id: int, target_date: date = None):
-    """Расчет и сохранение биоритмов пользователя"""
+
+async def save_biorhythm_audit(telegram_id: int, target_date: date, biorhythm_data: dict):
+    """Запись рассчитанных биоритмов в историю biorhythm_history (только при BIORHYTHM_AUDIT=1)"""
+    await ensure_history_partitions(target_date, target_date)
+    row = history_row(telegram_id, biorhythm_data)
+    async with async_session() as session:
+        await session.execute(upsert(BiorhythmHistory, row))
+        await session.commit()
+    logger.info(f"💾 Биоритмы {telegram_id} на {target_date} записаны в историю")
+
+
+async def calculate_and_save_biorhythms(telegram_id: int, target_date: date = None,
+                                        ctx: Optional[RequestContext] = None):
+    """
+    Расчет биоритмов пользователя.
+
+    Биоритмы вычисляются при чтении через biorhythm_cache; в БД они пишутся
+    только для аудита, если включен BIORHYTHM_AUDIT.
+    """
     try:
         if target_date is None:
             target_date = date.today()
 
         # Получаем данные пользователя
-        user_profile = await get_user_profile(telegram_id)
+        user_profile = await get_user_profile(telegram_id, ctx)
         if not user_profile:
             raise ValueError(f"Пользователь {telegram_id} не найден")
 
-        # Рассчитываем биоритмы
-        calculator = BiorhythmCalculator()
-        biorhythm_data = calculator.calculate_biorhythms(
-            user_profile['birth_date'],
-            target_date
-        )
+        biorhythm_data = biorhythm_cache.get(user_profile['birth_date'], target_date)
 
-        # Сохраняем в БД с атомарной операцией
-        async with async_session() as session:
-            try:
-                # Сначала удаляем ВСЕ существующие записи для этой даты (на случай дублей)
-                await session.execute(
-                    Biorhythms.__table__.delete().where(
-                        and_(
-                            Biorhythms.telegram_id == telegram_id,
-                            Biorhythms.calculation_date == target_date
-                        )
-                    )
-                )
-
-                # Создаем новую запись
-                new_record = Biorhythms(
-                    telegram_id=telegram_id,
-                    biorhythm_data=biorhythm_data,
-                    calculation_date=target_date
-                )
-                session.add(new_record)
-                logger.info(f"🆕 Созданы новые биоритмы для {telegram_id} на {target_date}")
-
-                await session.commit()
-                logger.info(f"💾 Биоритмы успешно сохранены для {telegram_id}")
-
-            except Exception as db_error:
-                await session.rollback()
-                logger.error(f"❌ Ошибка БД при сохранении биоритмов {telegram_id}: {db_error}")
-                raise
+        if BIORHYTHM_AUDIT:
+            await save_biorhythm_audit(telegram_id, target_date, biorhythm_data)
 
         return biorhythm_data
 
@@ -65,30 +59,18 @@ async def calculate_and_save_biorhythms(telegram_id: int, target_date: date = No
         raise
 
 
-async def get_user_biorhythms(telegram_id: int, target_date: date = None):
-    """Получение биоритмов пользователя с улучшенной обработкой ошибок"""
+async def get_user_biorhythms(telegram_id: int, target_date: date = None, ctx: Optional[RequestContext] = None):
+    """Получение биоритмов пользователя (расчет при чтении, без обращения к таблице биоритмов)"""
     try:
         if target_date is None:
             target_date = date.today()
 
-        async with async_session() as session:
-            result = await session.execute(
-                select(Biorhythms).where(
-                    and_(
-                        Biorhythms.telegram_id == telegram_id,
-                        Biorhythms.calculation_date == target_date
-                    )
-                )
-            )
-            biorhythms = result.scalar_one_or_none()
-
-            if biorhythms:
-                logger.info(f"✅ Найдены сохраненные биоритмы для {telegram_id} на {target_date}")
-                return biorhythms.biorhythm_data
+        user_profile = await get_user_profile(telegram_id, ctx)
+        if not user_profile:
+            logger.info(f"⚠️ Пользователь {telegram_id} не найден, биоритмы недоступны")
+            return None
 
-            # Если запись не найдена, рассчитываем заново
-            logger.info(f"🔄 Биоритмы не найдены, рассчитываем заново для {telegram_id}")
-            return await calculate_and_save_biorhythms(telegram_id, target_date)
+        return biorhythm_cache.get(user_profile['birth_date'], target_date)
 
     except Exception as e:
         logger.error(f"❌ Ошибка при получении биоритмов {telegram_id}: {e}")
@@ -121,71 +103,84 @@ async def get_biorhythm_weekly_forecast(telegram_id: int, start_date: date = Non
         return None
 
 
-async def cleanup_duplicate_biorhythms():
-    """Очистка дублирующихся записей биоритмов"""
+async def get_biorhythm_history(telegram_id: int, start_date: date, end_date: date = None):
+    """История биоритмов пользователя за период из biorhythm_history"""
     try:
-        async with async_session() as session:
-            # Находим дублирующиеся записи
-            duplicate_query = """
-            DELETE FROM biorhythms 
-            WHERE ctid NOT IN (
-                SELECT MIN(ctid) 
-                FROM biorhythms 
-                GROUP BY telegram_id, calculation_date
-            )
-            """
+        if end_date is None:
+            end_date = start_date + timedelta(days=6)
 
-            result = await session.execute(duplicate_query)
-            deleted_count = result.rowcount
+        history = await read_biorhythm_history(telegram_id, start_date, end_date)
+        logger.info(f"📖 История биоритмов {telegram_id}: {len(history)} дней за {start_date} - {end_date}")
+        return history
 
-            await session.commit()
+    except Exception as e:
+        logger.error(f"❌ Ошибка при чтении истории биоритмов {telegram_id}: {e}")
+        return []
 
-            if deleted_count > 0:
-                logger.warning(f"🗑️ Удалено {deleted_count} дублирующихся записей биоритмов")
-            else:
-                logger.info("✅ Дублирующихся записей биоритмов не найдено")
 
-            return deleted_count
+async def get_upcoming_biorhythm_events(telegram_id: int, start_date: date = None, horizon_days: int = 30,
+                                        limit: int = 5):
+    """Ближайшие критические и пиковые дни пользователя и их совпадения по циклам"""
+    try:
+        if start_date is None:
+            start_date = date.today()
+
+        user_profile = await get_user_profile(telegram_id)
+        if not user_profile:
+            raise ValueError(f"Пользователь {telegram_id} не найден")
+
+        events = BiorhythmCalculator().find_upcoming_events(
+            user_profile['birth_date'],
+            start_date,
+            horizon_days,
+            limit
+        )
+
+        logger.info(f"✅ Ближайшие события биоритмов рассчитаны для {telegram_id} на {horizon_days} дней")
+        return events
 
     except Exception as e:
-        logger.error(f"❌ Ошибка при очистке дублирующихся биоритмов: {e}")
-        return 0
+        logger.error(f"❌ Ошибка при поиске событий биоритмов {telegram_id}: {e}")
+        return None
 
 
 async def get_biorhythm_statistics(telegram_id: int):
-    """Получение статистики по биоритмам пользователя"""
+    """
+    Статистика истории биоритмов пользователя (biorhythm_history) одним запросом.
+
+    Биоритмы вычисляются при чтении, а история пишется только при
+    BIORHYTHM_AUDIT=1 (и пакетной записью write_biorhythm_history), поэтому
+    history_enabled=False и нулевые значения означают, что история не ведется,
+    а не что биоритмов нет.
+    """
     try:
         async with async_session() as session:
-            # Количество записей биоритмов
-            count_result = await session.execute(
-                select(func.count(Biorhythms.telegram_id)).where(
-                    Biorhythms.telegram_id == telegram_id
-                )
-            )
-            total_records = count_result.scalar() or 0
-
-            # Самая старая и новая запись
-            dates_result = await session.execute(
+            result = await session.execute(
                 select(
-                    func.min(Biorhythms.calculation_date),
-                    func.max(Biorhythms.calculation_date)
-                ).where(Biorhythms.telegram_id == telegram_id)
+                    func.count(),
+                    func.min(BiorhythmHistory.calculation_date),
+                    func.max(BiorhythmHistory.calculation_date)
+                ).where(BiorhythmHistory.telegram_id == telegram_id)
             )
-            min_date, max_date = dates_result.first() or (None, None)
-
-            statistics = {
-                'total_records': total_records,
-                'first_calculation': min_date.isoformat() if min_date else None,
-                'last_calculation': max_date.isoformat() if max_date else None,
-                'calculation_range_days': (max_date - min_date).days if min_date and max_date else 0
-            }
-
+            total_records, min_date, max_date = result.one()
+
+        statistics = {
+            'history_enabled': BIORHYTHM_AUDIT,
+            'total_records': total_records or 0,
+            'first_calculation': min_date.isoformat() if min_date else None,
+            'last_calculation': max_date.isoformat() if max_date else None,
+            'calculation_range_days': (max_date - min_date).days if min_date and max_date else 0
+        }
+        if not BIORHYTHM_AUDIT and not total_records:
+            logger.info(f"📊 История биоритмов не ведется (BIORHYTHM_AUDIT=0), статистика {telegram_id} пуста")
+        else:
             logger.info(f"📊 Статистика биоритмов получена для {telegram_id}")
-            return statistics
+        return statistics
 
     except Exception as e:
         logger.error(f"❌ Ошибка при получении статистики биоритмов {telegram_id}: {e}")
         return {
+            'history_enabled': BIORHYTHM_AUDIT,
             'total_records': 0,
             'first_calculation': None,
             'last_calculation': None,
@@ -194,27 +189,23 @@ async def get_biorhythm_statistics(telegram_id: int):
 
 
 async def cleanup_old_biorhythms(days_old: int = 30):
-    """Очистка старых записей биоритмов"""
+    """
+    Очистка старой истории биоритмов: удаляются целые месячные секции
+    biorhythm_history, все даты которых старше days_old дней.
+
+    Returns:
+        Количество удаленных секций
+    """
     try:
         cutoff_date = date.today() - timedelta(days=days_old)
+        dropped = await drop_partitions_before(HISTORY_TABLE, cutoff_date)
 
-        async with async_session() as session:
-            result = await session.execute(
-                Biorhythms.__table__.delete().where(
-                    Biorhythms.calculation_date < cutoff_date
-                )
-            )
-            deleted_count = result.rowcount
-
-            await session.commit()
-
-            if deleted_count > 0:
-                logger.info(f"🗑️ Удалено {deleted_count} старых записей биоритмов (старше {days_old} дней)")
-            else:
-                logger.info("✅ Старых записей биоритмов для удаления не найдено")
-
-            return deleted_count
+        if dropped:
+            logger.info(f"🗑️ Удалено {len(dropped)} секций истории биоритмов (старше {cutoff_date})")
+        else:
+            logger.info("✅ Устаревших секций истории биоритмов не найдено")
+        return len(dropped)
 
     except Exception as e:
         logger.error(f"❌ Ошибка при очистке старых биоритмов: {e}")
-        return 0
\ No newline at end of file
+        return 0
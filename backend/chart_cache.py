@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class NatalChartCache:
+    """
+    Общий для процесса кэш натальных карт по отпечатку входных данных
+    (natal_chart.chart_fingerprint). Пользователи с одинаковыми данными рождения
+    получают одну и ту же рассчитанную карту. Вытеснение по LRU.
+    """
+
+    def __init__(self, max_size: int = 2048):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint: str) -> Optional[Dict]:
+        with self._lock:
+            natal_data = self._entries.get(fingerprint)
+            if natal_data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return natal_data
+
+    def put(self, fingerprint: str, natal_data: Dict):
+        with self._lock:
+            self._entries[fingerprint] = natal_data
+            self._entries.move_to_end(fingerprint)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+
+def chart_version(input_fingerprint: Optional[str], updated_at) -> str:
+    """Версия натальной карты пользователя: отпечаток входных данных (у старых записей - время обновления)"""
+    return input_fingerprint or f"updated:{updated_at}"
+
+
+def user_chart_key(telegram_id: int, version: str) -> str:
+    return f"{telegram_id}:{version}"
+
+
+# Глобальный кэш натальных карт процесса бота
+natal_chart_cache = NatalChartCache()
+
+# Карты пользователей по (telegram_id, версия) для сборки данных модели по ссылкам
+# (в отличие от natal_chart_cache содержат город в написании пользователя)
+user_chart_cache = NatalChartCache(max_size=4096)
@@ -1,18 +1,35 @@
 from backend.database import async_session, UserNatalChart
-from backend.natal_chart import MLNatalChartCalculator
+from backend.compute_executor import compute_executor
+from backend.geocoding import geocoder
+from backend.natal_chart import DEFAULT_COORDINATES, MAJOR_CITIES, birth_to_utc, chart_fingerprint, \
+    known_or_estimated_elevation
+from backend.chart_cache import chart_version, natal_chart_cache, user_chart_cache, user_chart_key
+from backend.timezone_index import timezone_at
+from backend.upserts import upsert_returning
+from backend.request_context import RequestContext, request_session
+from backend.data_status import data_status_cache
 from sqlalchemy.future import select
+from typing import Dict, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-async def create_and_save_natal_chart(telegram_id: int, city: str, birth_datetime, timezone: str):
-    """Создание и сохранение натальной карты"""
+async def create_and_save_natal_chart(telegram_id: int, city: str, birth_datetime, timezone: str = None):
+    """
+    Создание и сохранение натальной карты (часовой пояс по умолчанию - по координатам города).
+    Если отпечаток входных данных совпадает с сохраненным, пересчет не выполняется;
+    карты с одинаковыми входными данными берутся из общего кэша или у других пользователей.
+    """
     try:
-        calculator = MLNatalChartCalculator()
-        natal_data = calculator.calculate_natal_chart_ml(city, birth_datetime, timezone)
+        # Координаты ищутся асинхронно (кэш, газеттир, БД, Nominatim), расчет - в пуле процессов
+        coordinates = await resolve_birth_coordinates(city)
+        if timezone is None:
+            timezone = timezone_at(coordinates[0], coordinates[1])
+            logger.info(f"🕐 Часовой пояс для {city}: {timezone}")
 
-        logger.info(f"Создание натальной карты для пользователя {telegram_id}")
+        _, birth_utc = birth_to_utc(birth_datetime, timezone)
+        fingerprint = chart_fingerprint(birth_utc, coordinates[0], coordinates[1], timezone)
 
         async with async_session() as session:
             result = await session.execute(
@@ -20,32 +37,86 @@ async def create_and_save_natal_chart(telegram_id: int, city: str, birth_datetim
             )
             natal_chart = result.scalar_one_or_none()
 
-            if natal_chart:
-                # Обновляем существующую натальную карту
-                natal_chart.natal_data = natal_data
-                logger.info(f"📝 Обновлена натальная карта для {telegram_id}")
-            else:
-                # Создаем новую натальную карту
-                natal_chart = UserNatalChart(
-                    telegram_id=telegram_id,
-                    natal_data=natal_data
-                )
-                session.add(natal_chart)
-                logger.info(f"🆕 Создана новая натальная карта для {telegram_id}")
+        if natal_chart and natal_chart.input_fingerprint == fingerprint:
+            logger.info(f"⏭️ Данные рождения не изменились, натальная карта {telegram_id} актуальна")
+            return natal_chart
+
+        natal_data = await _get_or_calculate_natal_data(fingerprint, city, birth_datetime, timezone, coordinates)
 
+        logger.info(f"Создание натальной карты для пользователя {telegram_id}")
+
+        async with async_session() as session:
+            natal_chart, inserted = await upsert_returning(session, UserNatalChart, {
+                'telegram_id': telegram_id,
+                'natal_data': natal_data,
+                'input_fingerprint': fingerprint
+            })
             await session.commit()
-            logger.info(f"💾 Натальная карта успешно сохранена для {telegram_id}")
-            return natal_chart
+
+        if inserted:
+            data_status_cache.invalidate(telegram_id)
+            logger.info(f"🆕 Создана новая натальная карта для {telegram_id}")
+        else:
+            logger.info(f"📝 Обновлена натальная карта для {telegram_id}")
+        logger.info(f"💾 Натальная карта успешно сохранена для {telegram_id}")
+        return natal_chart
 
     except Exception as e:
         logger.error(f"❌ Ошибка при создании натальной карты для {telegram_id}: {e}")
         raise
 
 
-async def get_user_natal_chart(telegram_id: int):
+async def resolve_birth_coordinates(city: str) -> Tuple[float, float, float]:
+    """
+    Координаты города рождения: геокодер -> основные города -> Москва (как в
+    MLNatalChartCalculator.get_city_coordinates). Высоту, которую источник не
+    дал, берем из основных городов или оцениваем по координатам.
+    """
+    city_lower = city.strip().lower()
+    coordinates = await geocoder.resolve(city)
+    if coordinates is None:
+        coordinates = MAJOR_CITIES.get(city_lower)
+        if coordinates is not None:
+            logger.info(f"Координаты из базы основных городов для: {city}")
+    if coordinates is None:
+        logger.warning(f"Не удалось определить координаты для {city}, используем Москву")
+        return DEFAULT_COORDINATES
+
+    lat, lon, elevation = coordinates
+    if elevation is None:
+        elevation = known_or_estimated_elevation(city_lower, lat, lon)
+    return lat, lon, elevation
+
+
+async def _get_or_calculate_natal_data(fingerprint: str, city: str, birth_datetime, timezone: str,
+                                       coordinates) -> Dict:
+    """Карта по отпечатку: кэш процесса -> карта другого пользователя в БД -> расчет в пуле"""
+    natal_data = natal_chart_cache.get(fingerprint)
+    if natal_data is None:
+        async with async_session() as session:
+            result = await session.execute(
+                select(UserNatalChart.natal_data)
+                .where(UserNatalChart.input_fingerprint == fingerprint)
+                .limit(1)
+            )
+            natal_data = result.scalar_one_or_none()
+        if natal_data is not None:
+            logger.info(f"♻️ Натальная карта с теми же входными данными найдена в БД")
+        else:
+            natal_data = await compute_executor.calculate_natal_chart(city, birth_datetime, timezone, coordinates)
+        natal_chart_cache.put(fingerprint, natal_data)
+    else:
+        logger.info(f"♻️ Натальная карта с теми же входными данными взята из кэша")
+
+    # Название города в метаданных - как его ввел пользователь
+    location = {**natal_data['metadata']['location'], 'city': city}
+    return {**natal_data, 'metadata': {**natal_data['metadata'], 'location': location}}
+
+
+async def get_user_natal_chart(telegram_id: int, ctx: Optional[RequestContext] = None):
     """Получение натальной карты пользователя"""
     try:
-        async with async_session() as session:
+        async with request_session(ctx) as session:
             result = await session.execute(
                 select(UserNatalChart).where(UserNatalChart.telegram_id == telegram_id)
             )
@@ -57,4 +128,25 @@ async def get_user_natal_chart(telegram_id: int):
 
     except Exception as e:
         logger.error(f"❌ Ошибка при получении натальной карты {telegram_id}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+async def get_user_natal_chart_version(telegram_id: int) -> Tuple[Optional[Dict], Optional[str]]:
+    """Натальная карта пользователя и ее версия (chart_cache.chart_version)"""
+    try:
+        async with async_session() as session:
+            result = await session.execute(
+                select(UserNatalChart.natal_data, UserNatalChart.input_fingerprint, UserNatalChart.updated_at)
+                .where(UserNatalChart.telegram_id == telegram_id)
+            )
+            row = result.one_or_none()
+
+        if row is None:
+            return None, None
+        version = chart_version(row.input_fingerprint, row.updated_at)
+        user_chart_cache.put(user_chart_key(telegram_id, version), row.natal_data)
+        return row.natal_data, version
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка при получении натальной карты {telegram_id}: {e}")
+        return None, None
@@ -0,0 +1,214 @@
+"""
+Пул процессов для тяжелых астрологических расчетов.
+
+swisseph держит глобальное состояние (путь к эфемеридам, JPL-файл, внутренние
+кэши) и работает с удержанием GIL, поэтому расчеты выносятся из цикла событий
+в отдельные процессы. Каждый процесс настраивает эфемериды один раз при старте
+и далее выполняет задания последовательно - состояние swisseph никогда не
+разделяется между потоками.
+
+Кэш транзитов (transit_cache) у каждого рабочего процесса свой: транзиты на
+дату рассчитываются по разу в каждом процессе пула, а не один раз на бота.
+Счетчики кэшей собираются из всех процессов (collect_transit_cache_stats) и
+при остановке пула сохраняются в transit_cache_stats.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+COMPUTE_POOL_SIZE = int(os.getenv('COMPUTE_POOL_SIZE', max(1, (os.cpu_count() or 2) - 1)))
+COMPUTE_JOB_TIMEOUT = float(os.getenv('COMPUTE_JOB_TIMEOUT', '30'))
+
+# Сбор статистики кэшей транзитов: задание держит процесс занятым hold секунд,
+# раунды повторяются, пока не ответят все процессы пула
+TRANSIT_STATS_HOLD = 0.05
+TRANSIT_STATS_ROUNDS = 5
+
+# Калькулятор натальных карт, созданный один раз в каждом рабочем процессе
+_worker_calculator = None
+
+
+def _init_worker():
+    """Инициализация рабочего процесса: эфемериды и кэш транзитов"""
+    global _worker_calculator
+    from backend.natal_chart import MLNatalChartCalculator, configure_ephemeris
+    from backend.transit_cache import transit_cache
+
+    configure_ephemeris()
+    _worker_calculator = MLNatalChartCalculator()
+    transit_cache.prewarm()
+
+
+def _warmup_job() -> int:
+    return os.getpid()
+
+
+def _transit_cache_stats_job(hold: float) -> Tuple[int, Dict]:
+    from backend.transit_cache import transit_cache
+
+    # Процесс остается занятым, чтобы остальные задания раунда достались другим процессам
+    time.sleep(hold)
+    return os.getpid(), transit_cache.get_stats()
+
+
+def _natal_chart_job(city: str, birth_datetime: datetime, timezone: str,
+                     coordinates: Tuple[float, float, float] = None) -> Dict[str, Any]:
+    return _worker_calculator.calculate_natal_chart_ml(city, birth_datetime, timezone, coordinates)
+
+
+def _prediction_job(natal_data: Dict, target_date: date) -> Dict[str, Any]:
+    from backend.predictions import AstroPredictor
+
+    return AstroPredictor(natal_data).generate_prediction(target_date)
+
+
+class ComputeExecutor:
+    """Асинхронная обертка над пулом процессов с таймаутами и метриками очереди"""
+
+    def __init__(self, max_workers: int = COMPUTE_POOL_SIZE, job_timeout: float = COMPUTE_JOB_TIMEOUT):
+        self.max_workers = max_workers
+        self.job_timeout = job_timeout
+        self._pool = None
+        self._start_lock = asyncio.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total_job_seconds = 0.0
+        # Сводная статистика кэшей транзитов рабочих процессов на момент остановки пула
+        self.transit_cache_stats: Optional[Dict] = None
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        # spawn: рабочие процессы не наследуют цикл событий и соединения с БД родителя
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+
+    async def start(self):
+        """Запуск и прогрев всех рабочих процессов"""
+        async with self._start_lock:
+            if self._pool is not None:
+                return
+            pool = self._create_pool()
+            loop = asyncio.get_running_loop()
+            pids = await asyncio.gather(*(
+                loop.run_in_executor(pool, _warmup_job) for _ in range(self.max_workers)
+            ))
+            self._pool = pool
+            logger.info(f"⚙️ Пул расчетов запущен: {len(set(pids))} процессов")
+
+    async def shutdown(self):
+        """Остановка пула (ожидает завершения текущих заданий)"""
+        if self._pool is None:
+            return
+        try:
+            self.transit_cache_stats = await self.collect_transit_cache_stats()
+        except Exception as e:
+            logger.error(f"❌ Не удалось собрать статистику кэшей транзитов: {e}")
+        pool, self._pool = self._pool, None
+        await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+        logger.info(f"🛑 Пул расчетов остановлен: {self.get_stats()}")
+
+    async def collect_transit_cache_stats(self) -> Optional[Dict]:
+        """Сводная статистика кэшей транзитов всех рабочих процессов (None, если пул не запущен)"""
+        pool = self._pool
+        if pool is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        per_process: Dict[int, Dict] = {}
+        for _ in range(TRANSIT_STATS_ROUNDS):
+            results = await asyncio.wait_for(asyncio.gather(*(
+                loop.run_in_executor(pool, _transit_cache_stats_job, TRANSIT_STATS_HOLD)
+                for _ in range(self.max_workers)
+            )), self.job_timeout)
+            per_process.update(results)
+            if len(per_process) >= self.max_workers:
+                break
+
+        hits = sum(stats['hits'] for stats in per_process.values())
+        misses = sum(stats['misses'] for stats in per_process.values())
+        total = hits + misses
+        return {
+            'processes': len(per_process),
+            'pool_size': self.max_workers,
+            'size': sum(stats['size'] for stats in per_process.values()),
+            'hits': hits,
+            'misses': misses,
+            'evictions': sum(stats['evictions'] for stats in per_process.values()),
+            'hit_rate': round(hits / total, 4) if total else 0.0
+        }
+
+    async def run(self, func: Callable, *args, timeout: float = None):
+        """Выполнение функции в пуле с ожиданием результата не дольше timeout секунд"""
+        if self._pool is None:
+            await self.start()
+
+        self.submitted += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+            result = await asyncio.wait_for(future, timeout or self.job_timeout)
+            self.completed += 1
+            return result
+        except asyncio.TimeoutError:
+            # Процесс не прерывается: задание досчитается, но результат будет отброшен
+            self.timed_out += 1
+            logger.error(f"⏱️ Превышено время расчета {func.__name__} ({timeout or self.job_timeout} с)")
+            raise
+        except BrokenProcessPool:
+            self.failed += 1
+            logger.error("❌ Рабочий процесс пула аварийно завершился, пул будет пересоздан")
+            broken_pool, self._pool = self._pool, None
+            if broken_pool is not None:
+                broken_pool.shutdown(wait=False)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.total_job_seconds += time.perf_counter() - started
+
+    async def calculate_natal_chart(self, city: str, birth_datetime: datetime, timezone: str,
+                                    coordinates: Tuple[float, float, float] = None) -> Dict[str, Any]:
+        """MLNatalChartCalculator.calculate_natal_chart_ml в рабочем процессе"""
+        return await self.run(_natal_chart_job, city, birth_datetime, timezone, coordinates)
+
+    async def generate_prediction(self, natal_data: Dict, target_date: date) -> Dict[str, Any]:
+        """AstroPredictor.generate_prediction в рабочем процессе"""
+        return await self.run(_prediction_job, natal_data, target_date)
+
+    def get_stats(self) -> Dict:
+        """Метрики пула: глубина очереди, ошибки, среднее время ожидания результата"""
+        finished = self.completed + self.failed + self.timed_out
+        return {
+            'pool_size': self.max_workers,
+            'running': self._pool is not None,
+            'submitted': self.submitted,
+            'in_flight': self.in_flight,
+            'queue_depth': max(0, self.in_flight - self.max_workers),
+            'max_in_flight': self.max_in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'avg_latency_ms': round(self.total_job_seconds / finished * 1000, 2) if finished else 0.0
+        }
+
+
+# Глобальный экземпляр пула расчетов
+compute_executor = ComputeExecutor()
@@ -0,0 +1,149 @@
+"""
+Статус собранных данных пользователя (кнопки меню, /status).
+
+Прежняя проверка делала четыре запроса подряд - профиль, натальная карта,
+психоматрица и биоритмы, причем чтение биоритмов могло запустить их расчет
+и запись в журнал. Теперь статус - битовая маска полноты, которую дает один
+запрос из трех EXISTS по первичным ключам; ничего не рассчитывается и не
+пишется. Биоритмы вычисляются при чтении по дате рождения (biorhythm_cache),
+поэтому доступны у любого сохраненного пользователя.
+
+Маска хранится в памяти процесса (DataStatusCache). Сервисы, которые впервые
+создают пользователя, натальную карту или психоматрицу, сбрасывают запись
+пользователя; DATA_STATUS_CACHE_TTL ограничивает срок жизни записи на случай
+изменений вне процесса бота.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import logging
+
+from sqlalchemy import exists
+from sqlalchemy.future import select
+
+from backend.database import User, UserNatalChart, PsyhoMatrix
+from backend.request_context import RequestContext, request_session
+
+logger = logging.getLogger(__name__)
+
+DATA_STATUS_CACHE_SIZE = int(os.getenv('DATA_STATUS_CACHE_SIZE', '65536'))
+DATA_STATUS_CACHE_TTL = float(os.getenv('DATA_STATUS_CACHE_TTL', '300'))
+
+# Биты маски полноты данных
+HAS_BASIC_DATA = 1
+HAS_NATAL_CHART = 2
+HAS_PSYHO_MATRIX = 4
+HAS_BIORHYTHMS = 8
+COMPLETE_MASK = HAS_BASIC_DATA | HAS_NATAL_CHART | HAS_PSYHO_MATRIX | HAS_BIORHYTHMS
+
+
+class DataStatusCache:
+    """
+    Маски полноты данных по telegram_id с вытеснением по LRU и сроком жизни.
+
+    Сброс записи увеличивает поколение кэша: маска, прочитанная из БД до
+    сброса, не сохраняется (put с устаревшим поколением игнорируется).
+    """
+
+    def __init__(self, max_size: int = DATA_STATUS_CACHE_SIZE, ttl: float = DATA_STATUS_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, telegram_id: int) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(telegram_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, telegram_id: int, mask: int, generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[telegram_id] = (mask, time.monotonic() + self.ttl)
+            self._entries.move_to_end(telegram_id)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        """Сброс маски пользователя после создания его данных"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._entries.pop(telegram_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+
+def status_mask_query(telegram_id: int):
+    """Один запрос: EXISTS по users, user_natal_chart и psyho_matrix"""
+    return select(
+        exists().where(User.telegram_id == telegram_id).label('has_basic_data'),
+        exists().where(UserNatalChart.telegram_id == telegram_id).label('has_natal_chart'),
+        exists().where(PsyhoMatrix.telegram_id == telegram_id).label('has_psyho_matrix')
+    )
+
+
+async def get_data_status_mask(telegram_id: int, ctx: Optional[RequestContext] = None) -> int:
+    """Маска полноты данных пользователя: из кэша процесса или одним запросом"""
+    mask = data_status_cache.get(telegram_id)
+    if mask is not None:
+        return mask
+
+    generation = data_status_cache.generation
+    async with request_session(ctx) as session:
+        row = (await session.execute(status_mask_query(telegram_id))).one()
+
+    mask = 0
+    if row.has_basic_data:
+        # Биоритмы вычисляются по дате рождения, обязательной для пользователя
+        mask |= HAS_BASIC_DATA | HAS_BIORHYTHMS
+    if row.has_natal_chart:
+        mask |= HAS_NATAL_CHART
+    if row.has_psyho_matrix:
+        mask |= HAS_PSYHO_MATRIX
+    data_status_cache.put(telegram_id, mask, generation)
+    return mask
+
+
+def status_from_mask(mask: int) -> Dict:
+    """Статус в формате PersonalAssistant.get_user_data_status"""
+    return {
+        'has_basic_data': bool(mask & HAS_BASIC_DATA),
+        'has_natal_chart': bool(mask & HAS_NATAL_CHART),
+        'has_psyho_matrix': bool(mask & HAS_PSYHO_MATRIX),
+        'has_biorhythms': bool(mask & HAS_BIORHYTHMS),
+        'is_complete': mask & COMPLETE_MASK == COMPLETE_MASK,
+        'status_mask': mask
+    }
+
+
+# Глобальный кэш статусов процесса бота
+data_status_cache = DataStatusCache()
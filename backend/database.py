@@ -4,7 +4,8 @@ from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy import Column, BigInteger, JSON, TIMESTAMP, String, Date, Time, Text
 from sqlalchemy.sql import func
 from sqlalchemy import ForeignKey
-from sqlalchemy import Column, BigInteger, JSON, TIMESTAMP, String, Date, Time, Text, ForeignKey, Integer
+from sqlalchemy import Column, BigInteger, JSON, TIMESTAMP, String, Date, Time, Text, ForeignKey, Integer, Float, \
+    SmallInteger, Boolean, REAL
 from sqlalchemy.sql import func
 import logging
 
@@ -55,6 +56,7 @@ class UserNatalChart(Base):
 
     telegram_id = Column(BigInteger, ForeignKey('users.telegram_id', ondelete='CASCADE'), primary_key=True, index=True)
     natal_data = Column(JSON, nullable=False)
+    input_fingerprint = Column(String(64), nullable=True, index=True)  # sha256 входных данных карты
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
@@ -98,6 +100,110 @@ class Biorhythms(Base):
         return f"<Biorhythms(telegram_id={self.telegram_id}, date={self.calculation_date})>"
 
 
+class BiorhythmHistory(Base):
+    """
+    Типизированная история биоритмов, секционированная по месяцам (db_biorhythm_history.sql).
+    Секции создаются backend/biorhythm_history.py: ensure_history_partitions.
+    """
+    __tablename__ = 'biorhythm_history'
+    __table_args__ = {'postgresql_partition_by': 'RANGE (calculation_date)'}
+
+    telegram_id = Column(BigInteger, ForeignKey('users.telegram_id', ondelete='CASCADE'), primary_key=True)
+    calculation_date = Column(Date, primary_key=True)
+    days_lived = Column(Integer, nullable=False)
+    physical_value = Column(REAL, nullable=False)
+    physical_percentage = Column(REAL, nullable=False)
+    physical_trend = Column(SmallInteger, nullable=False)  # коды TREND_NAMES: 1 растет, -1 падает, 0 стабильно
+    emotional_value = Column(REAL, nullable=False)
+    emotional_percentage = Column(REAL, nullable=False)
+    emotional_trend = Column(SmallInteger, nullable=False)
+    intellectual_value = Column(REAL, nullable=False)
+    intellectual_percentage = Column(REAL, nullable=False)
+    intellectual_trend = Column(SmallInteger, nullable=False)
+    intuitive_value = Column(REAL, nullable=False)
+    intuitive_percentage = Column(REAL, nullable=False)
+    intuitive_trend = Column(SmallInteger, nullable=False)
+    overall_value = Column(REAL, nullable=False)
+    overall_percentage = Column(REAL, nullable=False)
+    is_critical = Column(Boolean, nullable=False)
+    is_peak = Column(Boolean, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+    def __repr__(self):
+        return f"<BiorhythmHistory(telegram_id={self.telegram_id}, date={self.calculation_date})>"
+
+
+class PredictionHistory(Base):
+    """
+    Данные на дату по пользователю и дате, секционированные по месяцам (db_prediction_history.sql).
+    Секции создаются backend/partitions.py: ensure_monthly_partitions, старые удаляются целиком.
+    """
+    __tablename__ = 'prediction_history'
+    __table_args__ = {'postgresql_partition_by': 'RANGE (target_date)'}
+
+    telegram_id = Column(BigInteger, ForeignKey('users.telegram_id', ondelete='CASCADE'), primary_key=True)
+    target_date = Column(Date, primary_key=True)
+    predictions = Column(JSON, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<PredictionHistory(telegram_id={self.telegram_id}, date={self.target_date})>"
+
+
+class PrecomputeCheckpoint(Base):
+    """
+    Точка продолжения ночного предрасчета (backend/precompute_scheduler.py, db_precompute_checkpoint.sql):
+    последний обработанный telegram_id для задания и даты, фиксируется вместе с пакетом данных.
+    """
+    __tablename__ = 'precompute_checkpoints'
+
+    job_name = Column(String(50), primary_key=True)
+    target_date = Column(Date, primary_key=True)
+    last_telegram_id = Column(BigInteger, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    completed = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<PrecomputeCheckpoint(job_name={self.job_name}, date={self.target_date}, " \
+               f"last_telegram_id={self.last_telegram_id})>"
+
+
+class UserStatsCounter(Base):
+    """
+    Сегмент счетчиков статистики пользователей (telegram_id % 16), поддерживается
+    триггерами на users (db_user_statistics.sql). Без строк - счетчики не установлены.
+    """
+    __tablename__ = 'user_stats_counters'
+
+    shard = Column(SmallInteger, primary_key=True)
+    total_users = Column(BigInteger, nullable=False, default=0)
+    users_with_gender = Column(BigInteger, nullable=False, default=0)
+    active_users = Column(BigInteger, nullable=False, default=0)  # request_count > 0
+    total_requests = Column(BigInteger, nullable=False, default=0)  # сумма request_count активных
+    updated_at = Column(TIMESTAMP, server_default=func.now())
+
+    def __repr__(self):
+        return f"<UserStatsCounter(shard={self.shard}, total_users={self.total_users})>"
+
+
+class GeocodeCache(Base):
+    __tablename__ = 'geocode_cache'
+
+    query_key = Column(String(200), primary_key=True)  # нормализованное название города
+    lat = Column(Float, nullable=True)  # NULL - город не найден (отрицательная запись)
+    lon = Column(Float, nullable=True)
+    elevation = Column(Float, nullable=True)
+    source = Column(String(20), nullable=False)
+    expires_at = Column(TIMESTAMP, nullable=True)  # NULL - запись бессрочная
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<GeocodeCache(query_key={self.query_key}, lat={self.lat}, lon={self.lon})>"
+
+
 
 async def get_db():
     async with async_session() as session:
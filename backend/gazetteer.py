@@ -0,0 +1,336 @@
+"""
+Офлайн-справочник городов (газеттир) для определения координат без сети.
+
+Набор данных backend/data/cities.tsv.gz собран из выгрузки GeoNames cities1000
+(https://www.geonames.org, CC BY 4.0): города России и СНГ с населением от 1000
+человек и города мира от 100 000. Для каждого города хранятся название,
+русские альтернативные названия, координаты, высота, часовой пояс, страна
+и население.
+
+Индекс (отсортированные нормализованные названия и триграммы) хранится в .npy
+файлах и открывается через memory-map. Строится при установке командой
+    python -m backend.gazetteer build-index
+или при первом обращении, если его нет или он старше набора данных. Сборка
+идет во временный каталог, который затем подменяет индекс; сборка и открытие
+индекса выполняются под файловой блокировкой, поэтому бот и процессы пула
+расчетов не строят его одновременно и не открывают недописанные файлы. Поиск:
+    - точный - бинарный поиск по отсортированным ключам, единицы микросекунд;
+    - по префиксу - диапазон в отсортированных ключах;
+    - с опечатками - кандидаты по общим триграммам, затем расстояние Левенштейна.
+
+Пересборка набора данных из свежей выгрузки GeoNames:
+    python -m backend.gazetteer build-dataset cities1000.txt
+"""
+import gzip
+import json
+import math
+import fcntl
+import os
+import re
+import shutil
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import List, NamedTuple, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+GAZETTEER_DATASET = os.getenv('GAZETTEER_DATASET', os.path.join(DATA_DIR, 'cities.tsv.gz'))
+GAZETTEER_INDEX_PATH = os.getenv('GAZETTEER_INDEX_PATH', os.path.join(DATA_DIR, 'gazetteer_index'))
+
+# Страны, для которых берутся все населенные пункты от 1000 жителей
+CIS_COUNTRIES = {'RU', 'UA', 'BY', 'KZ', 'UZ', 'KG', 'TJ', 'TM', 'AM', 'AZ', 'GE', 'MD', 'LV', 'LT', 'EE'}
+WORLD_MIN_POPULATION = 100000
+
+KEY_BYTES = 64
+CITY_DTYPE = np.dtype([
+    ('lat', np.float64),
+    ('lon', np.float64),
+    ('elevation', np.float32),   # NaN, если высота неизвестна
+    ('timezone', np.int16),      # индекс в timezones.json
+    ('population', np.int32)
+])
+
+_CYRILLIC_NAME = re.compile(r"^[А-Яа-яЁё0-9\- .'’]+$")
+_SEPARATORS = re.compile(r"[\-‐–—_.,'’`]+")
+_CITY_PREFIX = re.compile(r"^(г\.|г |гор\. |город |пгт |пос\. |поселок |село |с\. )")
+
+
+class City(NamedTuple):
+    name: str
+    lat: float
+    lon: float
+    elevation: float
+    timezone: str
+    population: int
+
+
+def normalize_city_name(name: str) -> str:
+    """Нормализация названия: регистр, ё -> е, дефисы и точки -> пробелы, префиксы 'г.'/'город'"""
+    name = name.strip().lower().replace('ё', 'е')
+    name = _CITY_PREFIX.sub('', name)
+    name = _SEPARATORS.sub(' ', name)
+    return ' '.join(name.split())
+
+
+def _trigrams(key: str) -> List[int]:
+    padded = f"  {key} "
+    return list({zlib.crc32(padded[i:i + 3].encode('utf-8')) for i in range(len(padded) - 2)})
+
+
+def _levenshtein(a: str, b: str, limit: int) -> int:
+    """Расстояние Левенштейна с отсечением: при превышении limit возвращает limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class Gazetteer:
+    """Поиск городов по memory-mapped индексу"""
+
+    def __init__(self, index_dir: str = None):
+        self.index_dir = index_dir or GAZETTEER_INDEX_PATH
+        self.keys = np.load(os.path.join(self.index_dir, 'keys.npy'), mmap_mode='r')
+        self.key_city = np.load(os.path.join(self.index_dir, 'key_city.npy'), mmap_mode='r')
+        self.cities = np.load(os.path.join(self.index_dir, 'cities.npy'), mmap_mode='r')
+        # Пары (код триграммы, индекс названия) в двух непрерывных массивах, отсортированы по коду
+        self.trigram_codes = np.load(os.path.join(self.index_dir, 'trigram_codes.npy'), mmap_mode='r')
+        self.trigram_keys = np.load(os.path.join(self.index_dir, 'trigram_keys.npy'), mmap_mode='r')
+        with open(os.path.join(self.index_dir, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.names = meta['names']
+        self.timezones = meta['timezones']
+
+    def _city(self, city_index: int) -> City:
+        row = self.cities[city_index]
+        return City(
+            name=self.names[city_index],
+            lat=float(row['lat']),
+            lon=float(row['lon']),
+            elevation=float(row['elevation']),
+            timezone=self.timezones[row['timezone']],
+            population=int(row['population'])
+        )
+
+    def _encode(self, key: str) -> bytes:
+        return key.encode('utf-8')[:KEY_BYTES]
+
+    def lookup_exact(self, name: str) -> Optional[City]:
+        """Точное совпадение нормализованного названия (при омонимах - самый крупный город)"""
+        key = self._encode(normalize_city_name(name))
+        position = int(np.searchsorted(self.keys, key, side='left'))
+        if position < len(self.keys) and self.keys[position] == key:
+            return self._city(int(self.key_city[position]))
+        return None
+
+    def search_prefix(self, prefix: str, limit: int = 10) -> List[City]:
+        """Города, название которых начинается с prefix, по убыванию населения"""
+        key = self._encode(normalize_city_name(prefix))
+        if not key:
+            return []
+        left = int(np.searchsorted(self.keys, key, side='left'))
+        right = int(np.searchsorted(self.keys, key + b'\xff', side='left'))
+        city_indexes = np.unique(self.key_city[left:right])
+        populations = self.cities['population'][city_indexes]
+        best = city_indexes[np.argsort(-populations, kind='stable')[:limit]]
+        return [self._city(int(index)) for index in best]
+
+    def search_fuzzy(self, name: str, max_distance: int = None) -> Optional[City]:
+        """Поиск с опечатками: кандидаты по общим триграммам, выбор по расстоянию Левенштейна"""
+        key = normalize_city_name(name)
+        if not key:
+            return None
+        if max_distance is None:
+            max_distance = max(1, len(key) // 5)
+
+        codes = np.array(_trigrams(key), dtype=np.uint32)
+        lefts = np.searchsorted(self.trigram_codes, codes, side='left')
+        rights = np.searchsorted(self.trigram_codes, codes, side='right')
+        postings = [self.trigram_keys[left:right] for left, right in zip(lefts.tolist(), rights.tolist())]
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.keys))
+
+        # Каждая правка портит не более трех триграмм - остальные названия заведомо дальше max_distance
+        candidates = np.nonzero(shared >= len(codes) - 3 * max_distance)[0]
+        top = candidates[np.argsort(-shared[candidates], kind='stable')[:30]]
+
+        best = None
+        for key_index in top.tolist():
+            candidate = bytes(self.keys[key_index]).decode('utf-8', errors='ignore')
+            distance = _levenshtein(key, candidate, max_distance)
+            if distance > max_distance:
+                continue
+            city_index = int(self.key_city[key_index])
+            rank = (distance, -int(self.cities['population'][city_index]))
+            if best is None or rank < best[0]:
+                best = (rank, city_index)
+        return self._city(best[1]) if best else None
+
+    def lookup(self, name: str) -> Optional[City]:
+        """Точный поиск, при неудаче - поиск с опечатками"""
+        return self.lookup_exact(name) or self.search_fuzzy(name)
+
+
+def _read_dataset(dataset_path: str):
+    with gzip.open(dataset_path, 'rt', encoding='utf-8') as f:
+        next(f)  # заголовок
+        for line in f:
+            name, alt_names, lat, lon, elevation, timezone, country, population = line.rstrip('\n').split('\t')
+            yield (name, [a for a in alt_names.split('|') if a], float(lat), float(lon),
+                   float(elevation) if elevation else math.nan, timezone, country, int(population))
+
+
+@contextmanager
+def _index_lock(index_dir: str):
+    """Межпроцессная блокировка сборки и открытия индекса (файл <index_dir>.lock)"""
+    os.makedirs(os.path.dirname(os.path.abspath(index_dir)), exist_ok=True)
+    with open(f"{index_dir}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _index_is_current(index_dir: str, dataset_path: str) -> bool:
+    # meta.json пишется последним, а каталог появляется только целиком
+    meta_file = os.path.join(index_dir, 'meta.json')
+    return os.path.exists(meta_file) and os.path.getmtime(meta_file) >= os.path.getmtime(dataset_path)
+
+
+def build_index(dataset_path: str = None, index_dir: str = None) -> str:
+    """Построение индекса во временном каталоге и атомарная подмена под файловой блокировкой"""
+    index_dir = index_dir or GAZETTEER_INDEX_PATH
+    with _index_lock(index_dir):
+        return _build_index_locked(dataset_path or GAZETTEER_DATASET, index_dir)
+
+
+def _build_index_locked(dataset_path: str, index_dir: str) -> str:
+    build_dir = f"{index_dir}.build-{os.getpid()}"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    try:
+        _write_index(dataset_path, build_dir)
+        # Каталог нельзя заменить непустым через os.replace: старый индекс сначала убирается в сторону.
+        # Читатели открывают индекс под той же блокировкой, а уже открытые mmap старых файлов остаются целы
+        old_dir = f"{index_dir}.old-{os.getpid()}"
+        if os.path.exists(index_dir):
+            os.replace(index_dir, old_dir)
+        os.replace(build_dir, index_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    return index_dir
+
+
+def _write_index(dataset_path: str, index_dir: str):
+    """Отсортированный индекс названий и триграмм в .npy файлы каталога index_dir"""
+    os.makedirs(index_dir, exist_ok=True)
+
+    rows = list(_read_dataset(dataset_path))
+    timezones = sorted({row[5] for row in rows})
+    timezone_ids = {tz: i for i, tz in enumerate(timezones)}
+
+    cities = np.empty(len(rows), dtype=CITY_DTYPE)
+    entries = []
+    for city_index, (name, alt_names, lat, lon, elevation, timezone, _, population) in enumerate(rows):
+        cities[city_index] = (lat, lon, elevation, timezone_ids[timezone], population)
+        for key in {normalize_city_name(n) for n in [name] + alt_names}:
+            if key:
+                entries.append((key.encode('utf-8')[:KEY_BYTES], -population, city_index))
+
+    # При одинаковом названии первым идет самый крупный город
+    entries.sort()
+    keys = np.array([entry[0] for entry in entries], dtype=f'S{KEY_BYTES}')
+    key_city = np.array([entry[2] for entry in entries], dtype=np.int32)
+
+    trigram_pairs = np.array([
+        (code, key_index)
+        for key_index, entry in enumerate(entries)
+        for code in _trigrams(entry[0].decode('utf-8', errors='ignore'))
+    ], dtype=np.int64)
+    order = np.lexsort((trigram_pairs[:, 1], trigram_pairs[:, 0]))
+    trigram_codes = trigram_pairs[order, 0].astype(np.uint32)
+    trigram_keys = trigram_pairs[order, 1].astype(np.int32)
+
+    np.save(os.path.join(index_dir, 'keys.npy'), keys)
+    np.save(os.path.join(index_dir, 'key_city.npy'), key_city)
+    np.save(os.path.join(index_dir, 'cities.npy'), cities)
+    np.save(os.path.join(index_dir, 'trigram_codes.npy'), trigram_codes)
+    np.save(os.path.join(index_dir, 'trigram_keys.npy'), trigram_keys)
+    with open(os.path.join(index_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'names': [row[0] for row in rows], 'timezones': timezones}, f, ensure_ascii=False)
+
+    logger.info(f"✅ Индекс газеттира построен: {len(rows)} городов, {len(keys)} названий")
+
+
+def build_dataset(geonames_path: str, dataset_path: str = None) -> int:
+    """
+    Сборка cities.tsv.gz из выгрузки GeoNames (cities1000.txt).
+    Альтернативные названия сохраняются только кириллические.
+    """
+    dataset_path = dataset_path or GAZETTEER_DATASET
+    rows = []
+    with open(geonames_path, encoding='utf-8') as f:
+        for line in f:
+            columns = line.rstrip('\n').split('\t')
+            country, population = columns[8], int(columns[14] or 0)
+            if country not in CIS_COUNTRIES and population < WORLD_MIN_POPULATION:
+                continue
+            alt_names = sorted({a for a in columns[3].split(',') if _CYRILLIC_NAME.match(a)})
+            elevation = columns[15] or (columns[16] if columns[16] not in ('', '-9999') else '')
+            rows.append((columns[1], '|'.join(alt_names), columns[4], columns[5],
+                         elevation, columns[17], country, str(population)))
+
+    with gzip.open(dataset_path, 'wt', encoding='utf-8') as f:
+        f.write('name\talt_names\tlat\tlon\televation\ttimezone\tcountry\tpopulation\n')
+        for row in rows:
+            f.write('\t'.join(row) + '\n')
+
+    logger.info(f"✅ Набор данных газеттира сохранен: {dataset_path} ({len(rows)} городов)")
+    return len(rows)
+
+
+_gazetteer = None
+_gazetteer_loaded = False
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Общий экземпляр газеттира; отсутствующий или устаревший индекс строится при первом обращении"""
+    global _gazetteer, _gazetteer_loaded
+    if not _gazetteer_loaded:
+        with _gazetteer_lock:
+            if not _gazetteer_loaded:
+                try:
+                    with _index_lock(GAZETTEER_INDEX_PATH):
+                        if not _index_is_current(GAZETTEER_INDEX_PATH, GAZETTEER_DATASET):
+                            _build_index_locked(GAZETTEER_DATASET, GAZETTEER_INDEX_PATH)
+                        _gazetteer = Gazetteer()
+                except (OSError, ValueError) as e:
+                    logger.warning(f"⚠️ Газеттир недоступен: {e}")
+                _gazetteer_loaded = True
+    return _gazetteer
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build-index'
+    if command == 'build-dataset' and len(sys.argv) > 2:
+        build_dataset(sys.argv[2])
+        build_index()
+    elif command == 'build-index':
+        build_index()
+    else:
+        print("Использование: python -m backend.gazetteer [build-index | build-dataset cities1000.txt]")
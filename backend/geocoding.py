@@ -0,0 +1,265 @@
+"""
+Асинхронный геокодинг городов с многоуровневым кэшем.
+
+Порядок поиска:
+    1. LRU в памяти процесса (включая отрицательные записи с TTL);
+    2. офлайн-газеттир (backend/gazetteer.py);
+    3. таблица geocode_cache в БД;
+    4. удаленный сервис (по умолчанию Nominatim) с ограничением 1 запрос/с.
+
+Одновременные запросы одного и того же города объединяются в один поиск.
+Адрес сервиса задается через GEOCODER_URL, поэтому для проверки можно
+поднять локальную заглушку с тем же API /search.
+"""
+import asyncio
+import math
+from abc import ABC, abstractmethod
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+import logging
+
+import aiohttp
+from sqlalchemy.future import select
+
+from backend.database import async_session, GeocodeCache
+from backend.upserts import upsert
+from backend.gazetteer import get_gazetteer, normalize_city_name
+
+logger = logging.getLogger(__name__)
+
+GEOCODER_URL = os.getenv('GEOCODER_URL', 'https://nominatim.openstreetmap.org')
+GEOCODER_USER_AGENT = os.getenv('GEOCODER_USER_AGENT', 'AstrologyBot/1.0 (leostuchchi@example.com)')
+GEOCODER_MIN_INTERVAL = float(os.getenv('GEOCODER_MIN_INTERVAL', '1.0'))
+GEOCODE_CACHE_SIZE = int(os.getenv('GEOCODE_CACHE_SIZE', '4096'))
+GEOCODE_NEGATIVE_TTL = timedelta(hours=float(os.getenv('GEOCODE_NEGATIVE_TTL_HOURS', '24')))
+
+# (широта, долгота, высота); высота None, если источник ее не дает
+Coordinates = Tuple[float, float, Optional[float]]
+
+_MISSING = object()
+
+
+class GeocodingError(Exception):
+    """Сбой удаленного сервиса (сеть, HTTP-ошибка) - такой результат не кэшируется"""
+
+
+class GeocodingBackend(ABC):
+    """Базовый класс удаленного геокодера"""
+
+    name = 'remote'
+
+    @abstractmethod
+    async def geocode(self, query: str) -> Optional[Coordinates]:
+        """Координаты города или None, если сервис его не знает"""
+
+    async def close(self):
+        pass
+
+
+class NominatimBackend(GeocodingBackend):
+    """Nominatim (OpenStreetMap) или совместимый сервис по адресу base_url"""
+
+    name = 'nominatim'
+
+    def __init__(self, base_url: str = GEOCODER_URL, user_agent: str = GEOCODER_USER_AGENT,
+                 timeout: float = 10, country_hint: str = 'Россия'):
+        self.base_url = base_url.rstrip('/')
+        self.user_agent = user_agent
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.country_hint = country_hint
+        self._session = None
+
+    async def geocode(self, query: str) -> Optional[Coordinates]:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                headers={'User-Agent': self.user_agent, 'Accept': 'application/json'}
+            )
+
+        params = {
+            'q': f"{query}, {self.country_hint}" if self.country_hint else query,
+            'format': 'json',
+            'limit': '1'
+        }
+        try:
+            async with self._session.get(f"{self.base_url}/search", params=params) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise GeocodingError(f"{self.name}: {e}") from e
+
+        if not data:
+            return None
+        try:
+            return float(data[0]['lat']), float(data[0]['lon']), None
+        except (KeyError, ValueError, IndexError, TypeError) as e:
+            raise GeocodingError(f"{self.name}: некорректный ответ: {e}") from e
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class RateLimiter:
+    """Не чаще одного вызова в min_interval секунд на процесс"""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._lock = asyncio.Lock()
+        self._next_allowed = 0.0
+
+    async def wait(self):
+        async with self._lock:
+            delay = self._next_allowed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_allowed = time.monotonic() + self.min_interval
+
+
+def _gazetteer_lookup(city_name: str):
+    gazetteer = get_gazetteer()
+    return gazetteer.lookup(city_name) if gazetteer else None
+
+
+class AsyncGeocoder:
+    """Геокодер с LRU, кэшем в БД, объединением одновременных запросов и лимитом частоты"""
+
+    def __init__(self, backend: GeocodingBackend = None, max_size: int = GEOCODE_CACHE_SIZE,
+                 min_interval: float = GEOCODER_MIN_INTERVAL, negative_ttl: timedelta = GEOCODE_NEGATIVE_TTL,
+                 use_db: bool = True):
+        self.backend = backend or NominatimBackend()
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.use_db = use_db
+        self._limiter = RateLimiter(min_interval)
+        self._entries = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            'lru_hits': 0, 'negative_hits': 0, 'coalesced': 0, 'gazetteer': 0,
+            'db_hits': 0, 'remote_requests': 0, 'remote_errors': 0, 'not_found': 0
+        }
+
+    def _lru_get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        coordinates, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return coordinates
+
+    def _lru_put(self, key: str, coordinates: Optional[Coordinates], ttl: timedelta = None):
+        expires_at = time.monotonic() + ttl.total_seconds() if ttl is not None else None
+        self._entries[key] = (coordinates, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def resolve(self, city_name: str) -> Optional[Coordinates]:
+        """Координаты города (широта, долгота, высота) или None, если город не найден"""
+        key = normalize_city_name(city_name)
+        if not key:
+            return None
+
+        coordinates = self._lru_get(key)
+        if coordinates is not _MISSING:
+            self.stats['lru_hits' if coordinates else 'negative_hits'] += 1
+            return coordinates
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+        else:
+            # Поиск идет отдельной задачей: отмена одного из ожидающих не прерывает его для остальных
+            task = asyncio.ensure_future(self._resolve_uncached(key, city_name))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _resolve_uncached(self, key: str, city_name: str) -> Optional[Coordinates]:
+        # Открытие (а при первом обращении и сборка) индекса и поиск с опечатками - вне цикла событий
+        city = await asyncio.to_thread(_gazetteer_lookup, city_name)
+        if city:
+            coordinates = (city.lat, city.lon, None if math.isnan(city.elevation) else city.elevation)
+            self.stats['gazetteer'] += 1
+            self._lru_put(key, coordinates)
+            return coordinates
+
+        cached = await self._db_get(key)
+        if cached is not _MISSING:
+            self.stats['db_hits'] += 1
+            self._lru_put(key, cached, None if cached else self.negative_ttl)
+            return cached
+
+        await self._limiter.wait()
+        self.stats['remote_requests'] += 1
+        try:
+            coordinates = await self.backend.geocode(city_name)
+        except GeocodingError as e:
+            self.stats['remote_errors'] += 1
+            logger.warning(f"⚠️ Ошибка геокодинга для {city_name}: {e}")
+            return None
+
+        if coordinates:
+            logger.info(f"🌍 Геокодинг успешен: {city_name} -> {coordinates[0]}, {coordinates[1]}")
+            self._lru_put(key, coordinates)
+        else:
+            self.stats['not_found'] += 1
+            logger.warning(f"⚠️ Город не найден: {city_name}")
+            self._lru_put(key, None, self.negative_ttl)
+        await self._db_put(key, coordinates)
+        return coordinates
+
+    async def _db_get(self, key: str):
+        if not self.use_db:
+            return _MISSING
+        try:
+            async with async_session() as session:
+                result = await session.execute(select(GeocodeCache).where(GeocodeCache.query_key == key))
+                row = result.scalar_one_or_none()
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш геокодинга в БД недоступен: {e}")
+            return _MISSING
+
+        if row is None or (row.expires_at is not None and row.expires_at < datetime.utcnow()):
+            return _MISSING
+        return (row.lat, row.lon, row.elevation) if row.lat is not None else None
+
+    async def _db_put(self, key: str, coordinates: Optional[Coordinates]):
+        if not self.use_db:
+            return
+        lat, lon, elevation = coordinates or (None, None, None)
+        values = {
+            'query_key': key,
+            'lat': lat,
+            'lon': lon,
+            'elevation': elevation,
+            'source': self.backend.name,
+            'expires_at': None if coordinates else datetime.utcnow() + self.negative_ttl
+        }
+        try:
+            async with async_session() as session:
+                await session.execute(upsert(GeocodeCache, values))
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить геокодинг {key} в БД: {e}")
+
+    async def preload(self):
+        """Открытие индекса газеттира до первого запроса (в потоке, не блокируя цикл событий)"""
+        await asyncio.to_thread(get_gazetteer)
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, 'size': len(self._entries), 'in_flight': len(self._inflight)}
+
+    async def close(self):
+        await self.backend.close()
+
+
+# Глобальный геокодер процесса бота
+geocoder = AsyncGeocoder()
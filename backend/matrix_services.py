@@ -1,45 +1,41 @@
 from backend.database import async_session, PsyhoMatrix
 from backend.psyho_matrix import PsyhoMatrixCalculator
 from backend.user_services import get_user_profile
+from backend.upserts import upsert_row
+from backend.request_context import RequestContext, request_session
+from backend.data_status import data_status_cache
 from sqlalchemy.future import select
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-async def calculate_and_save_psyho_matrix(telegram_id: int):
+async def calculate_and_save_psyho_matrix(telegram_id: int, ctx: Optional[RequestContext] = None):
     """Расчет и сохранение психоматрицы"""
     try:
         # Получаем данные пользователя
-        user_profile = await get_user_profile(telegram_id)
+        user_profile = await get_user_profile(telegram_id, ctx)
         if not user_profile:
             raise ValueError("Пользователь не найден")
 
         calculator = PsyhoMatrixCalculator()
         matrix_data = calculator.calculate_matrix(user_profile['birth_date'])
 
-        # Сохраняем психоматрицу
+        # Сохраняем психоматрицу одним upsert
         async with async_session() as session:
-            result = await session.execute(
-                select(PsyhoMatrix).where(PsyhoMatrix.telegram_id == telegram_id)
-            )
-            psyho_matrix = result.scalar_one_or_none()
-
-            if psyho_matrix:
-                # Обновляем существующую психоматрицу
-                psyho_matrix.matrix_data = matrix_data
-                logger.info(f"📝 Обновлена психоматрица для {telegram_id}")
-            else:
-                # Создаем новую психоматрицу
-                psyho_matrix = PsyhoMatrix(
-                    telegram_id=telegram_id,
-                    matrix_data=matrix_data
-                )
-                session.add(psyho_matrix)
-                logger.info(f"🆕 Создана новая психоматрица для {telegram_id}")
-
+            inserted = await upsert_row(session, PsyhoMatrix, {
+                'telegram_id': telegram_id,
+                'matrix_data': matrix_data
+            })
             await session.commit()
-            logger.info(f"✅ Психоматрица рассчитана и сохранена для {telegram_id}")
+
+        if inserted:
+            data_status_cache.invalidate(telegram_id)
+            logger.info(f"🆕 Создана новая психоматрица для {telegram_id}")
+        else:
+            logger.info(f"📝 Обновлена психоматрица для {telegram_id}")
+        logger.info(f"✅ Психоматрица рассчитана и сохранена для {telegram_id}")
 
         return matrix_data
 
@@ -48,10 +44,10 @@ async def calculate_and_save_psyho_matrix(telegram_id: int):
         raise
 
 
-async def get_user_matrix(telegram_id: int):
+async def get_user_matrix(telegram_id: int, ctx: Optional[RequestContext] = None):
     """Получение психоматрицы пользователя"""
     try:
-        async with async_session() as session:
+        async with request_session(ctx) as session:
             result = await session.execute(
                 select(PsyhoMatrix).where(PsyhoMatrix.telegram_id == telegram_id)
             )
@@ -1,3 +1,5 @@
+import hashlib
+import math
 import os
 import pytz
 from datetime import datetime
@@ -10,50 +12,147 @@ import time
 from urllib.parse import quote
 
 from backend.database import async_session, UserNatalChart
+from backend.chebyshev_ephemeris import EPHEMERIS_BACKEND, get_ephemeris
+from backend.aspect_engine import AspectEngine
+from backend.gazetteer import get_gazetteer
+from backend.timezone_index import get_zone
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+_ephemeris_configured = False
+
+
+def configure_ephemeris(force: bool = False):
+    """
+    Настройка путей эфемерид swisseph (глобальное состояние процесса).
+    Выполняется один раз на процесс, повторные вызовы ничего не делают.
+    """
+    global _ephemeris_configured
+    if _ephemeris_configured and not force:
+        return
+    current_dir = os.getcwd()
+    ephe_path = os.path.join(current_dir, 'ephe')
+    swe.set_ephe_path(ephe_path)
+    swe.set_jpl_file('de441.eph')
+    _ephemeris_configured = True
+
+
+# Версия формата натальной карты: увеличивается при изменении состава или алгоритма расчета
+CHART_FORMAT_VERSION = 1
+HOUSE_SYSTEM = b'P'
+
+
+def ephemeris_version(backend: str = EPHEMERIS_BACKEND, jd_ut: float = None) -> str:
+    """
+    Идентификатор источника эфемерид, участвующий в отпечатке входных данных карты.
+    С jd_ut - источник, фактически давший позиции на этот момент (вне диапазона
+    эфемерид Чебышёва позиции считает swisseph).
+    """
+    if backend == 'chebyshev':
+        ephemeris = get_ephemeris()
+        if ephemeris is not None and (jd_ut is None or ephemeris.covers(jd_ut)):
+            return f"chebyshev-{ephemeris.version}"
+    return f"swisseph-{swe.version}"
+
+
+def birth_to_utc(birth_datetime_local: datetime, timezone_str: str) -> Tuple[datetime, datetime]:
+    """Локальное время рождения -> (локальное с поясом, UTC)"""
+    birth_local = get_zone(timezone_str).localize(birth_datetime_local)
+    return birth_local, birth_local.astimezone(pytz.utc)
+
+
+def chart_fingerprint(birth_utc: datetime, lat: float, lon: float, timezone_str: str,
+                      backend: str = EPHEMERIS_BACKEND) -> str:
+    """
+    Отпечаток входных данных натальной карты (sha256).
+    Одинаковые момент рождения, место, пояс, система домов и эфемериды дают одинаковую карту.
+    """
+    payload = "|".join((
+        str(CHART_FORMAT_VERSION),
+        birth_utc.strftime('%Y-%m-%dT%H:%M:%S'),
+        f"{lat:.4f}",
+        f"{lon:.4f}",
+        timezone_str,
+        HOUSE_SYSTEM.decode(),
+        ephemeris_version(backend)
+    ))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Координаты по умолчанию (Москва), если город не удалось найти
+DEFAULT_COORDINATES = (55.7558, 37.6173, 156)
+
+# Основные города России: (широта, долгота, высота)
+MAJOR_CITIES = {
+    "москва": (55.7558, 37.6173, 156),
+    "санкт-петербург": (59.9343, 30.3351, 3),
+    "новосибирск": (55.0084, 82.9357, 150),
+    "екатеринбург": (56.8389, 60.6057, 237),
+    "нижний новгород": (56.3269, 44.0075, 78),
+    "казань": (55.8304, 49.0661, 60),
+    "челябинск": (55.1644, 61.4368, 228),
+    "омск": (54.9884, 73.3242, 85),
+    "самара": (53.2415, 50.2212, 87),
+    "ростов-на-дону": (47.2225, 39.7187, 70),
+    "уфа": (54.7355, 55.9587, 158),
+    "красноярск": (56.0153, 92.8932, 136),
+    "пермь": (58.0105, 56.2502, 149),
+    "воронеж": (51.6720, 39.1843, 104),
+    "волгоград": (48.7080, 44.5133, 80),
+    "краснодар": (45.0355, 38.9750, 25),
+    "саратов": (51.5924, 45.9608, 50),
+    "тюмень": (57.1613, 65.5250, 70),
+    "тольятти": (53.5088, 49.4192, 90),
+    "ижевск": (56.8527, 53.2115, 140),
+    "ульяновск": (54.3282, 48.3866, 80),
+    "иркутск": (52.2864, 104.2806, 440),
+    "хабаровск": (48.4802, 135.0719, 72),
+    "ярославль": (57.6261, 39.8845, 100),
+    "владивосток": (43.1332, 131.9113, 8),
+    "мга": (59.7569, 31.0609, 33)
+}
+
+
+def estimate_elevation(lat: float, lon: float) -> float:
+    """
+    Примерная оценка высоты над уровнем моря.
+    Для точных данных лучше использовать специализированные API.
+    """
+    # Простая логика: прибрежные города ~0м, горные ~500м, равнинные ~100-200м
+    if 43 <= lat <= 49 and 131 <= lon <= 142:  # Дальний Восток
+        return 200
+    elif 53 <= lat <= 58 and 48 <= lon <= 56:  # Поволжье
+        return 100
+    elif 55 <= lat <= 57 and 37 <= lon <= 40:  # Центральная Россия
+        return 150
+    elif 44 <= lat <= 46 and 38 <= lon <= 40:  # Юг России
+        return 50
+    elif 51 <= lat <= 53 and 103 <= lon <= 108:  # Байкал
+        return 500
+    else:
+        return 100  # Средняя высота по умолчанию
+
+
+def known_or_estimated_elevation(city_lower: str, lat: float, lon: float) -> float:
+    """Высота из базы основных городов, иначе примерная оценка"""
+    known = MAJOR_CITIES.get(city_lower)
+    return known[2] if known else estimate_elevation(lat, lon)
+
+
 class MLNatalChartCalculator:
-    def __init__(self):
-        current_dir = os.getcwd()
-        ephe_path = os.path.join(current_dir, 'ephe')
-        swe.set_ephe_path(ephe_path)
-        swe.set_jpl_file('de441.eph')
+    def __init__(self, ephemeris_backend: str = None):
+        configure_ephemeris()
+
+        # Бэкенд расчета позиций планет: 'swisseph' или 'chebyshev'
+        self.ephemeris_backend = ephemeris_backend or EPHEMERIS_BACKEND
 
         # Кэш для координат городов
         self.coordinates_cache = {}
 
         # Основные города России для быстрого доступа
-        self.major_cities = {
-            "москва": (55.7558, 37.6173, 156),
-            "санкт-петербург": (59.9343, 30.3351, 3),
-            "новосибирск": (55.0084, 82.9357, 150),
-            "екатеринбург": (56.8389, 60.6057, 237),
-            "нижний новгород": (56.3269, 44.0075, 78),
-            "казань": (55.8304, 49.0661, 60),
-            "челябинск": (55.1644, 61.4368, 228),
-            "омск": (54.9884, 73.3242, 85),
-            "самара": (53.2415, 50.2212, 87),
-            "ростов-на-дону": (47.2225, 39.7187, 70),
-            "уфа": (54.7355, 55.9587, 158),
-            "красноярск": (56.0153, 92.8932, 136),
-            "пермь": (58.0105, 56.2502, 149),
-            "воронеж": (51.6720, 39.1843, 104),
-            "волгоград": (48.7080, 44.5133, 80),
-            "краснодар": (45.0355, 38.9750, 25),
-            "саратов": (51.5924, 45.9608, 50),
-            "тюмень": (57.1613, 65.5250, 70),
-            "тольятти": (53.5088, 49.4192, 90),
-            "ижевск": (56.8527, 53.2115, 140),
-            "ульяновск": (54.3282, 48.3866, 80),
-            "иркутск": (52.2864, 104.2806, 440),
-            "хабаровск": (48.4802, 135.0719, 72),
-            "ярославль": (57.6261, 39.8845, 100),
-            "владивосток": (43.1332, 131.9113, 8),
-            "мга": (59.7569, 31.0609, 33)
-        }
+        self.major_cities = MAJOR_CITIES
 
         self.ORBS = {
             'conjunction': 8, 'opposition': 8, 'square': 8, 'trine': 8, 'sextile': 6,
@@ -86,11 +185,12 @@ class MLNatalChartCalculator:
             120: ('trine', self.ORBS['trine']),
             180: ('opposition', self.ORBS['opposition'])
         }
+        self.aspect_engine = AspectEngine(self.aspects_ml)
 
     def get_city_coordinates(self, city_name: str) -> Tuple[float, float, float]:
         """
         Надежное определение координат города.
-        Сначала проверяет кэш, затем основные города, затем геокодинг.
+        Сначала проверяет кэш, затем офлайн-газеттир, затем основные города, затем геокодинг.
         """
         city_lower = city_name.strip().lower()
 
@@ -99,7 +199,19 @@ class MLNatalChartCalculator:
             logger.info(f"Координаты из кэша для: {city_name}")
             return self.coordinates_cache[city_lower]
 
-        # 2. Проверяем основные города России
+        # 2. Офлайн-газеттир (точный поиск и поиск с опечатками, без сети)
+        gazetteer = get_gazetteer()
+        city = gazetteer.lookup(city_name) if gazetteer else None
+        if city:
+            elevation = city.elevation
+            if math.isnan(elevation):
+                elevation = self._known_or_estimated_elevation(city_lower, city.lat, city.lon)
+            coords = (city.lat, city.lon, elevation)
+            self.coordinates_cache[city_lower] = coords
+            logger.info(f"Координаты из газеттира для: {city_name} -> {city.name}")
+            return coords
+
+        # 2.1. Основные города России (если газеттир недоступен)
         if city_lower in self.major_cities:
             coords = self.major_cities[city_lower]
             self.coordinates_cache[city_lower] = coords
@@ -118,7 +230,7 @@ class MLNatalChartCalculator:
 
         # 4. Резервный вариант - Москва
         logger.warning(f"Не удалось определить координаты для {city_name}, используем Москву")
-        return (55.7558, 37.6173, 156)
+        return DEFAULT_COORDINATES
 
     def _geocode_city(self, city_name: str) -> Tuple[float, float, float]:
         """
@@ -158,24 +270,13 @@ class MLNatalChartCalculator:
 
         return None
 
+    def _known_or_estimated_elevation(self, city_lower: str, lat: float, lon: float) -> float:
+        """Высота из базы основных городов, иначе примерная оценка"""
+        return known_or_estimated_elevation(city_lower, lat, lon)
+
     def _estimate_elevation(self, lat: float, lon: float) -> float:
-        """
-        Примерная оценка высоты над уровнем моря.
-        Для точных данных лучше использовать специализированные API.
-        """
-        # Простая логика: прибрежные города ~0м, горные ~500м, равнинные ~100-200м
-        if 43 <= lat <= 49 and 131 <= lon <= 142:  # Дальний Восток
-            return 200
-        elif 53 <= lat <= 58 and 48 <= lon <= 56:  # Поволжье
-            return 100
-        elif 55 <= lat <= 57 and 37 <= lon <= 40:  # Центральная Россия
-            return 150
-        elif 44 <= lat <= 46 and 38 <= lon <= 40:  # Юг России
-            return 50
-        elif 51 <= lat <= 53 and 103 <= lon <= 108:  # Байкал
-            return 500
-        else:
-            return 100  # Средняя высота по умолчанию
+        """Примерная оценка высоты над уровнем моря (estimate_elevation)"""
+        return estimate_elevation(lat, lon)
 
     def _geocode_fallback(self, city_name: str) -> Tuple[float, float, float]:
         """
@@ -206,30 +307,46 @@ class MLNatalChartCalculator:
 
     # Остальные методы класса остаются без изменений
     def calculate_planet_positions(self, jd_ut: float) -> Dict[str, Dict]:
+        raw_positions = self._calculate_raw_positions(jd_ut)
         positions = {}
+        for name, (lon, speed) in raw_positions.items():
+            lon = lon % 360
+            sign_index = floor(lon / 30)
+            positions[name] = {
+                'longitude': round(lon, 6),
+                'sign': self.zodiac_signs[sign_index],
+                'sign_index': sign_index,
+                'position_in_sign': round(lon % 30, 4),
+                'retrograde': speed < 0,
+                'speed': round(speed, 6)
+            }
+        return positions
+
+    def _calculate_raw_positions(self, jd_ut: float) -> Dict[str, Tuple[float, float]]:
+        """Долгота и скорость планет выбранным бэкендом эфемерид"""
+        if self.ephemeris_backend == 'chebyshev':
+            ephemeris = get_ephemeris()
+            if ephemeris is not None and ephemeris.covers(jd_ut):
+                positions = ephemeris.positions(jd_ut, self.planets_ml.keys())
+                return {
+                    self.planets_ml[planet_id]: (lon, speed)
+                    for planet_id, (lon, speed) in positions.items()
+                }
+
+        raw_positions = {}
         for planet_id, name in self.planets_ml.items():
             try:
                 flags = swe.FLG_SWIEPH | swe.FLG_SPEED
                 pos, ret_flags = swe.calc_ut(jd_ut, planet_id, flags)
-                lon = pos[0] % 360
-                sign_index = floor(lon / 30)
-                positions[name] = {
-                    'longitude': round(lon, 6),
-                    'sign': self.zodiac_signs[sign_index],
-                    'sign_index': sign_index,
-                    'position_in_sign': round(lon % 30, 4),
-                    'retrograde': pos[3] < 0,
-                    'speed': round(pos[3], 6)
-                }
+                raw_positions[name] = (pos[0], pos[3])
             except Exception as e:
                 logger.warning(f"Ошибка расчета для {name}: {e}")
                 continue
-        return positions
+        return raw_positions
 
     def calculate_houses_ml(self, jd_ut: float, lat: float, lon: float) -> Dict:
         try:
-            hsys = b'P'
-            cusps, ascmc = swe.houses(jd_ut, lat, lon, hsys)
+            cusps, ascmc = swe.houses(jd_ut, lat, lon, HOUSE_SYSTEM)
             houses = {}
             for i, cusp in enumerate(cusps[:12]):
                 cusp_deg = cusp % 360
@@ -267,31 +384,10 @@ class MLNatalChartCalculator:
         }
 
     def calculate_aspects_ml(self, planets: Dict, asc: float, mc: float) -> List[Dict]:
-        aspects = []
-        all_points = {**planets}
-        all_points['Ascendant'] = {'longitude': asc}
-        all_points['Midheaven'] = {'longitude': mc}
-        point_names = list(all_points.keys())
-        for i in range(len(point_names)):
-            for j in range(i + 1, len(point_names)):
-                p1, p2 = point_names[i], point_names[j]
-                lon1, lon2 = all_points[p1]['longitude'], all_points[p2]['longitude']
-                distance = abs(lon1 - lon2)
-                angle = min(distance, 360 - distance)
-                for aspect_angle, (aspect_name, orb) in self.aspects_ml.items():
-                    if abs(angle - aspect_angle) <= orb:
-                        aspects.append({
-                            'point1': p1,
-                            'point2': p2,
-                            'aspect': aspect_name,
-                            'exact_angle': aspect_angle,
-                            'actual_angle': round(angle, 4),
-                            'orb': round(abs(angle - aspect_angle), 4),
-                            'strength': 1.0 - (abs(angle - aspect_angle) / orb)
-                        })
-                        break
-        aspects.sort(key=lambda x: x['strength'], reverse=True)
-        return aspects
+        point_names = list(planets) + ['Ascendant', 'Midheaven']
+        longitudes = [data['longitude'] for data in planets.values()] + [asc, mc]
+        records = self.aspect_engine.find(longitudes)
+        return self.aspect_engine.natal_aspects_to_dicts(records, point_names)
 
     def get_planet_house_placement(self, planets: Dict, houses: Dict) -> Dict:
         house_placement = {}
@@ -313,13 +409,17 @@ class MLNatalChartCalculator:
                 house_placement[planet_name] = 1
         return house_placement
 
-    def calculate_natal_chart_ml(self, city_name: str, birth_datetime_local: datetime, timezone_str: str) -> Dict[
-        str, Any]:
+    def calculate_natal_chart_ml(self, city_name: str, birth_datetime_local: datetime, timezone_str: str,
+                                 coordinates: Tuple[float, float, float] = None) -> Dict[str, Any]:
         try:
-            lat, lon, elevation = self.get_city_coordinates(city_name)
-            local_tz = pytz.timezone(timezone_str)
-            birth_local = local_tz.localize(birth_datetime_local)
-            birth_utc = birth_local.astimezone(pytz.utc)
+            # Координаты, заранее найденные асинхронным геокодером, избавляют от поиска в расчете
+            if coordinates:
+                lat, lon, elevation = coordinates
+                if elevation is None:
+                    elevation = self._known_or_estimated_elevation(city_name.strip().lower(), lat, lon)
+            else:
+                lat, lon, elevation = self.get_city_coordinates(city_name)
+            birth_local, birth_utc = birth_to_utc(birth_datetime_local, timezone_str)
             jd_ut = swe.julday(
                 birth_utc.year,
                 birth_utc.month,
@@ -341,11 +441,12 @@ class MLNatalChartCalculator:
                     'datetime': {
                         'local': birth_local.isoformat(),
                         'utc': birth_utc.isoformat(),
-                        'jd': round(jd_ut, 6)
+                        'jd': round(jd_ut, 6),
+                        'timezone': timezone_str
                     },
                     'calculation': {
                         'house_system': houses_data['house_system'],
-                        'ephemeris': 'DE441'
+                        'ephemeris': ephemeris_version(self.ephemeris_backend, jd_ut)
                     }
                 },
                 'planets': planets,
@@ -0,0 +1,103 @@
+"""
+Месячные секции таблиц, секционированных по RANGE (дата).
+
+Секция таблицы <table> за месяц называется <table>_ГГГГ_ММ и покрывает
+[первое число месяца, первое число следующего месяца). Секции создаются
+по мере надобности перед записью (для конвейера - заранее, см.
+prediction_pipeline.prepare_pipeline_partitions), а хранение ограничивается
+удалением целых секций вместо DELETE по строкам.
+"""
+from datetime import date, timedelta
+from typing import List, Set, Tuple
+import logging
+
+from sqlalchemy import text
+
+from backend.database import async_engine
+
+logger = logging.getLogger(__name__)
+
+# (таблица, месяц) секций, существование которых уже проверено в этом процессе
+_known_partitions: Set[Tuple[str, date]] = set()
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def missing_months(table: str, start_date: date, end_date: date) -> List[date]:
+    """Месяцы диапазона [start_date, end_date], секции которых еще не проверены в этом процессе"""
+    months = []
+    month = month_start(start_date)
+    while month <= end_date:
+        if (table, month) not in _known_partitions:
+            months.append(month)
+        month = next_month(month)
+    return months
+
+
+def partition_ddl(table: str, month: date) -> str:
+    """CREATE TABLE IF NOT EXISTS для секции месяца"""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    )
+
+
+def mark_partitions_known(table: str, months: List[date]):
+    """Учет созданных секций; вызывается после фиксации транзакции с их DDL"""
+    _known_partitions.update((table, month) for month in months)
+    if months:
+        logger.info(f"🗂️ Секции {table} готовы: {partition_name(table, months[0])} ... "
+                    f"{partition_name(table, months[-1])}")
+
+
+async def ensure_monthly_partitions(table: str, start_date: date, end_date: date):
+    """Создание недостающих месячных секций таблицы для диапазона [start_date, end_date]"""
+    months = missing_months(table, start_date, end_date)
+    if not months:
+        return
+
+    async with async_engine.begin() as conn:
+        for month in months:
+            await conn.execute(text(partition_ddl(table, month)))
+    mark_partitions_known(table, months)
+
+
+async def drop_partitions_before(table: str, cutoff_date: date) -> List[str]:
+    """
+    Удаление секций, все даты которых раньше cutoff_date.
+    Секция удаляется целиком (DROP TABLE), без построчного DELETE и последующего VACUUM.
+    """
+    async with async_engine.begin() as conn:
+        result = await conn.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+        ), {'table': table})
+
+        dropped = []
+        prefix = f"{table}_"
+        for (name,) in result:
+            suffix = name[len(prefix):] if name.startswith(prefix) else ''
+            try:
+                month = date(int(suffix[:4]), int(suffix[5:7]), 1)
+            except ValueError:
+                logger.warning(f"⚠️ Секция {name} не соответствует шаблону {table}_ГГГГ_ММ, пропускаем")
+                continue
+            if next_month(month) <= cutoff_date:
+                await conn.execute(text(f"DROP TABLE {name}"))
+                _known_partitions.discard((table, month))
+                dropped.append(name)
+
+    if dropped:
+        logger.info(f"🗑️ Удалены секции {table} до {cutoff_date}: {', '.join(sorted(dropped))}")
+    return sorted(dropped)
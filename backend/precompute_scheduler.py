@@ -0,0 +1,351 @@
+"""
+Ночной предрасчет данных на дату (сегодня и завтра) для активных пользователей.
+
+Днем первое за дату нажатие "📅 Сегодня"/"📅 Завтра" считает транзиты, аспекты
+и биоритмы прямо в конвейере. Планировщик в часы низкой нагрузки
+(PRECOMPUTE_START_HOUR..PRECOMPUTE_END_HOUR) обходит активных пользователей
+пакетами по первичному ключу (telegram_id > последний обработанный) и для
+каждого пакета:
+    - транзиты на дату считаются один раз, аспекты ко всем картам пакета -
+      одним векторным проходом (predictions.batch_generate_predictions);
+    - биоритмы берутся из biorhythm_cache;
+    - данные на дату пишутся одним upsert в prediction_history с теми же
+      версиями, что и в конвейере, поэтому днем конвейер отдает их через
+      prediction_cache.get_persisted без расчета и без записи.
+Последний обработанный telegram_id фиксируется в precompute_checkpoints
+(db_precompute_checkpoint.sql) в той же транзакции, что и пакет: после падения
+или остановки бота обход продолжается с места остановки. Перед каждым пакетом
+планировщик ждет, пока занятость пула соединений БД не опустится ниже
+PRECOMPUTE_MAX_POOL_USAGE, чтобы не мешать запросам пользователей.
+
+Разовый запуск вне окна:
+    python -m backend.precompute_scheduler [YYYY-MM-DD ...]
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from backend.database import async_engine, async_session, User, UserNatalChart, PredictionHistory, \
+    PrecomputeCheckpoint
+from backend.biorhythm_cache import biorhythm_cache
+from backend.chart_cache import chart_version
+from backend.partitions import ensure_monthly_partitions
+from backend.prediction_pipeline import prepare_pipeline_partitions
+from backend.prediction_cache import PREDICTION_CACHE_PERSIST, key_versions, prediction_key
+from backend.prediction_services import PREDICTION_HISTORY_TABLE, build_prediction_data
+from backend.predictions import batch_generate_predictions
+from backend.upserts import upsert, upsert_many
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_ENABLED = os.getenv('PRECOMPUTE_ENABLED', '1') == '1'
+# Окно низкой нагрузки по местному времени сервера: [START_HOUR, END_HOUR)
+PRECOMPUTE_START_HOUR = int(os.getenv('PRECOMPUTE_START_HOUR', '2'))
+PRECOMPUTE_END_HOUR = int(os.getenv('PRECOMPUTE_END_HOUR', '6'))
+PRECOMPUTE_BATCH_SIZE = int(os.getenv('PRECOMPUTE_BATCH_SIZE', '500'))
+# Активные пользователи - обращавшиеся к боту за последние N дней (users.updated_at)
+PRECOMPUTE_ACTIVE_DAYS = int(os.getenv('PRECOMPUTE_ACTIVE_DAYS', '30'))
+# Доля занятых соединений пула, выше которой следующий пакет откладывается
+PRECOMPUTE_MAX_POOL_USAGE = float(os.getenv('PRECOMPUTE_MAX_POOL_USAGE', '0.5'))
+PRECOMPUTE_THROTTLE_SECONDS = 1.0
+
+PRECOMPUTE_JOB = 'predictions'
+
+
+class PrecomputeScheduler:
+    """Фоновая задача ночного предрасчета с точками продолжения и метриками"""
+
+    def __init__(self, batch_size: int = PRECOMPUTE_BATCH_SIZE, active_days: int = PRECOMPUTE_ACTIVE_DAYS,
+                 start_hour: int = PRECOMPUTE_START_HOUR, end_hour: int = PRECOMPUTE_END_HOUR,
+                 max_pool_usage: float = PRECOMPUTE_MAX_POOL_USAGE):
+        self.batch_size = batch_size
+        self.active_days = active_days
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.max_pool_usage = max_pool_usage
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.batches = 0
+        self.processed = 0
+        self.written = 0
+        self.skipped = 0
+        self.failed_runs = 0
+        self.throttled_seconds = 0.0
+        self.compute_seconds = 0.0
+        self.write_seconds = 0.0
+        self.last_run: Dict = {}
+
+    # --- Окно низкой нагрузки ---
+
+    def in_window(self, now: datetime = None) -> bool:
+        hour = (now or datetime.now()).hour
+        if self.start_hour <= self.end_hour:
+            return self.start_hour <= hour < self.end_hour
+        # Окно через полночь, например 23..5
+        return hour >= self.start_hour or hour < self.end_hour
+
+    def window_end(self, now: datetime = None) -> datetime:
+        """Конец текущего окна (для окна через полночь - на следующие сутки)"""
+        now = now or datetime.now()
+        end = now.replace(hour=self.end_hour, minute=0, second=0, microsecond=0)
+        return end if end > now else end + timedelta(days=1)
+
+    def seconds_until_window(self, now: datetime = None) -> float:
+        now = now or datetime.now()
+        if self.in_window(now):
+            return 0.0
+        start = now.replace(hour=self.start_hour, minute=0, second=0, microsecond=0)
+        if start <= now:
+            start += timedelta(days=1)
+        return (start - now).total_seconds()
+
+    # --- Ограничение нагрузки на БД ---
+
+    def pool_usage(self) -> float:
+        """Доля занятых соединений пула async_engine"""
+        pool = async_engine.pool
+        return pool.checkedout() / max(1, pool.size())
+
+    async def _wait_for_pool(self):
+        while self.pool_usage() > self.max_pool_usage:
+            await asyncio.sleep(PRECOMPUTE_THROTTLE_SECONDS)
+            self.throttled_seconds += PRECOMPUTE_THROTTLE_SECONDS
+
+    # --- Пакеты ---
+
+    def _active_filter(self):
+        return User.updated_at >= datetime.now() - timedelta(days=self.active_days)
+
+    async def _load_checkpoint(self, target_date: date) -> Tuple[int, int, bool]:
+        async with async_session() as session:
+            checkpoint = await session.get(PrecomputeCheckpoint, (PRECOMPUTE_JOB, target_date))
+        if checkpoint is None:
+            return 0, 0, False
+        return checkpoint.last_telegram_id, checkpoint.processed, checkpoint.completed
+
+    async def _count_remaining(self, last_telegram_id: int) -> int:
+        async with async_session() as session:
+            result = await session.execute(
+                select(func.count())
+                .select_from(User)
+                .join(UserNatalChart, UserNatalChart.telegram_id == User.telegram_id)
+                .where(User.telegram_id > last_telegram_id, self._active_filter())
+            )
+            return result.scalar_one()
+
+    async def _fetch_batch(self, target_date: date, last_telegram_id: int) -> List:
+        """Следующий пакет по ключу вместе с версией уже сохраненных данных на дату"""
+        async with async_session() as session:
+            result = await session.execute(
+                select(User.telegram_id, User.birth_date, UserNatalChart.natal_data,
+                       UserNatalChart.input_fingerprint, UserNatalChart.updated_at.label('natal_updated_at'),
+                       PredictionHistory.predictions['versions'].label('stored_versions'))
+                .join(UserNatalChart, UserNatalChart.telegram_id == User.telegram_id)
+                .outerjoin(PredictionHistory,
+                           (PredictionHistory.telegram_id == User.telegram_id)
+                           & (PredictionHistory.target_date == target_date))
+                .where(User.telegram_id > last_telegram_id, self._active_filter())
+                .order_by(User.telegram_id)
+                .limit(self.batch_size)
+            )
+            return result.all()
+
+    def _compute_batch(self, rows: Sequence, target_date: date) -> List[Dict]:
+        """Строки prediction_history для пользователей пакета без актуальных данных на дату"""
+        pending = []
+        for row in rows:
+            key = prediction_key(row.telegram_id, target_date,
+                                 chart_version(row.input_fingerprint, row.natal_updated_at))
+            if row.stored_versions == key_versions(key):
+                self.skipped += 1
+            elif row.natal_data:
+                pending.append((row, key))
+        if not pending:
+            return []
+
+        astro_predictions = batch_generate_predictions([row.natal_data for row, _ in pending], target_date)
+        updated_at = datetime.now()
+        return [
+            {
+                'telegram_id': row.telegram_id,
+                'target_date': target_date,
+                'predictions': build_prediction_data(key, row.birth_date, astro_prediction,
+                                                     biorhythm_cache.get(row.birth_date, target_date)),
+                'updated_at': updated_at
+            }
+            for (row, key), astro_prediction in zip(pending, astro_predictions)
+        ]
+
+    async def _write_batch(self, values: List[Dict], target_date: date, last_telegram_id: int, processed: int,
+                           completed: bool = False):
+        """Пакет данных на дату и точка продолжения - одной транзакцией"""
+        async with async_session() as session:
+            async with session.begin():
+                if values:
+                    await session.execute(upsert_many(PredictionHistory, values))
+                await session.execute(upsert(PrecomputeCheckpoint, {
+                    'job_name': PRECOMPUTE_JOB,
+                    'target_date': target_date,
+                    'last_telegram_id': last_telegram_id,
+                    'processed': processed,
+                    'completed': completed
+                }))
+
+    async def precompute_date(self, target_date: date, deadline: datetime = None) -> Dict:
+        """
+        Предрасчет данных на дату для всех активных пользователей с продолжением
+        с последней точки. Останавливается после пакета, закончившегося после deadline.
+        """
+        last_telegram_id, processed, completed = await self._load_checkpoint(target_date)
+        if completed:
+            logger.info(f"🌙 Предрасчет на {target_date} уже выполнен ({processed} пользователей)")
+            return {'target_date': target_date.isoformat(), 'processed': processed, 'completed': True}
+
+        await ensure_monthly_partitions(PREDICTION_HISTORY_TABLE, target_date, target_date)
+        total = processed + await self._count_remaining(last_telegram_id)
+        if last_telegram_id:
+            logger.info(f"🌙 Предрасчет на {target_date} продолжается после {last_telegram_id}: "
+                        f"{processed}/{total} пользователей")
+        else:
+            logger.info(f"🌙 Предрасчет на {target_date}: {total} активных пользователей")
+
+        started = time.perf_counter()
+        run_processed = 0
+        while True:
+            if deadline is not None and datetime.now() >= deadline:
+                logger.info(f"⏸️ Окно предрасчета закончилось на {processed}/{total}, продолжение в следующее окно")
+                break
+            await self._wait_for_pool()
+
+            rows = await self._fetch_batch(target_date, last_telegram_id)
+            if not rows:
+                await self._write_batch([], target_date, last_telegram_id, processed, completed=True)
+                completed = True
+                break
+
+            compute_started = time.perf_counter()
+            values = self._compute_batch(rows, target_date)
+            write_started = time.perf_counter()
+            last_telegram_id = rows[-1].telegram_id
+            await self._write_batch(values, target_date, last_telegram_id, processed + len(rows))
+            self.compute_seconds += write_started - compute_started
+            self.write_seconds += time.perf_counter() - write_started
+
+            processed += len(rows)
+            run_processed += len(rows)
+            self.processed += len(rows)
+            self.written += len(values)
+            self.batches += 1
+            rate = run_processed / (time.perf_counter() - started)
+            logger.info(f"🌙 Предрасчет на {target_date}: {processed}/{total} пользователей, "
+                        f"записано {len(values)} из {len(rows)}, {rate:.0f} польз/с")
+            # Отдаем цикл событий обработчикам бота между пакетами
+            await asyncio.sleep(0)
+
+        elapsed = time.perf_counter() - started
+        summary = {
+            'target_date': target_date.isoformat(),
+            'processed': processed,
+            'total': total,
+            'completed': completed,
+            'seconds': round(elapsed, 2),
+            'users_per_second': round(run_processed / elapsed, 1) if elapsed else 0.0
+        }
+        if completed:
+            logger.info(f"✅ Предрасчет на {target_date} завершен: {summary}")
+        return summary
+
+    async def run_once(self, target_dates: Sequence[date] = None, deadline: datetime = None) -> List[Dict]:
+        """Предрасчет на сегодня и завтра (или на заданные даты)"""
+        if not PREDICTION_CACHE_PERSIST:
+            logger.warning("⚠️ PREDICTION_CACHE_PERSIST=0: конвейер не читает сохраненные данные, "
+                           "предрасчет не ускорит запросы")
+        if target_dates is None:
+            today = date.today()
+            target_dates = (today, today + timedelta(days=1))
+
+        self.runs += 1
+        # Секции на ближайшие недели готовятся заранее, чтобы конвейер днем не выполнял DDL
+        await prepare_pipeline_partitions()
+        summaries = []
+        for target_date in target_dates:
+            summary = await self.precompute_date(target_date, deadline)
+            summaries.append(summary)
+            if not summary['completed']:
+                break
+        self.last_run = {'finished_at': datetime.now().isoformat(), 'dates': summaries}
+        return summaries
+
+    # --- Фоновая задача ---
+
+    async def _run_forever(self):
+        while True:
+            delay = self.seconds_until_window()
+            if delay:
+                logger.info(f"🌙 Следующий предрасчет через {delay / 3600:.1f} ч")
+                await asyncio.sleep(delay)
+            deadline = self.window_end()
+            try:
+                await self.run_once(deadline=deadline)
+            except Exception as e:
+                self.failed_runs += 1
+                logger.error(f"❌ Ошибка ночного предрасчета: {e}")
+            # До конца окна: следующий запуск - в следующую ночь
+            await asyncio.sleep(max(0.0, (deadline - datetime.now()).total_seconds()))
+
+    def start(self):
+        """Запуск фоновой задачи в текущем цикле событий"""
+        if not PRECOMPUTE_ENABLED or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run_forever())
+        logger.info(f"🌙 Планировщик предрасчета запущен: окно {self.start_hour}:00-{self.end_hour}:00, "
+                    f"пакет {self.batch_size}")
+
+    async def stop(self):
+        """Остановка задачи; незафиксированный пакет будет пересчитан с последней точки"""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        logger.info(f"🛑 Планировщик предрасчета остановлен: {self.get_stats()}")
+
+    def get_stats(self) -> Dict:
+        return {
+            'running': self._task is not None,
+            'runs': self.runs,
+            'failed_runs': self.failed_runs,
+            'batches': self.batches,
+            'processed': self.processed,
+            'written': self.written,
+            'skipped': self.skipped,
+            'throttled_seconds': round(self.throttled_seconds, 1),
+            'compute_seconds': round(self.compute_seconds, 2),
+            'write_seconds': round(self.write_seconds, 2),
+            'last_run': self.last_run
+        }
+
+
+# Глобальный планировщик процесса бота
+precompute_scheduler = PrecomputeScheduler()
+
+
+async def _main(target_dates: Sequence[date]):
+    await precompute_scheduler.run_once(target_dates or None)
+    print(precompute_scheduler.get_stats())
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main([date.fromisoformat(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,146 @@
+"""
+Кэш данных на дату (результатов конвейера get_recommendations).
+
+Ключ - (telegram_id, дата, версия натальной карты, версия расчета):
+    - версия карты - отпечаток входных данных (user_natal_charts.input_fingerprint),
+      поэтому после изменения данных рождения старые записи не совпадают по ключу;
+    - версия расчета - predictions.ENGINE_VERSION и источник эфемерид.
+Уровни: LRU в памяти процесса и (при PREDICTION_CACHE_PERSIST=1, по умолчанию)
+сохраненная строка prediction_history на эту дату, если она рассчитана с теми же версиями.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Optional, Set, Tuple
+import logging
+
+from backend.natal_chart import ephemeris_version
+from backend.predictions import ENGINE_VERSION
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '10000'))
+PREDICTION_CACHE_PERSIST = os.getenv('PREDICTION_CACHE_PERSIST', '1') == '1'
+
+# (telegram_id, дата, версия натальной карты, версия расчета)
+PredictionKey = Tuple[int, date, str, str]
+
+
+@lru_cache(maxsize=None)
+def engine_version() -> str:
+    return f"{ENGINE_VERSION}:{ephemeris_version()}"
+
+
+def prediction_key(telegram_id: int, target_date: date, natal_version: str) -> PredictionKey:
+    return telegram_id, target_date, natal_version, engine_version()
+
+
+def key_versions(key: PredictionKey) -> Dict:
+    """Версии ключа для сохранения вместе с данными (проверка записи из БД)"""
+    return {'natal': key[2], 'engine': key[3]}
+
+
+class PredictionCache:
+    """
+    LRU данных на дату. Для каждой записи хранится время расчета, чтобы
+    статистика показывала сэкономленное попаданиями время.
+    """
+
+    def __init__(self, max_size: int = PREDICTION_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[PredictionKey, Tuple[Dict, float]]" = OrderedDict()
+        self._user_keys: Dict[int, Set[PredictionKey]] = {}
+        # Ключ, данные которого последними записаны в prediction_history для (пользователь, дата)
+        self._persisted: Dict[Tuple[int, date], PredictionKey] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+        self.compute_seconds = 0.0
+
+    def get(self, key: PredictionKey) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            prediction_data, elapsed = entry
+            self.hits += 1
+            self.saved_seconds += elapsed
+            return prediction_data
+
+    def get_persisted(self, key: PredictionKey, stored: Optional[Dict]) -> Optional[Dict]:
+        """Сохраненная строка prediction_history, если она рассчитана для этого ключа"""
+        if not stored or stored.get('target_date') != key[1].isoformat() or stored.get('versions') != key_versions(key):
+            return None
+        with self._lock:
+            self.db_hits += 1
+        self.put(key, stored, 0.0)
+        self.mark_persisted(key)
+        return stored
+
+    def put(self, key: PredictionKey, prediction_data: Dict, elapsed: float):
+        with self._lock:
+            self._entries[key] = (prediction_data, elapsed)
+            self._entries.move_to_end(key)
+            self._user_keys.setdefault(key[0], set()).add(key)
+            self.compute_seconds += elapsed
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._forget(evicted)
+
+    def is_persisted(self, key: PredictionKey) -> bool:
+        with self._lock:
+            return self._persisted.get(key[:2]) == key
+
+    def mark_persisted(self, key: PredictionKey):
+        with self._lock:
+            self._persisted[key[:2]] = key
+
+    def invalidate_user(self, telegram_id: int) -> int:
+        """Удаление всех записей пользователя (после изменения данных рождения)"""
+        with self._lock:
+            keys = self._user_keys.pop(telegram_id, set())
+            for key in keys:
+                self._entries.pop(key, None)
+                self._persisted.pop(key[:2], None)
+            self.invalidations += 1
+        if keys:
+            logger.info(f"🧹 Кэш данных на дату очищен для {telegram_id}: {len(keys)} записей")
+        return len(keys)
+
+    def _forget(self, key: PredictionKey):
+        if self._persisted.get(key[:2]) == key:
+            del self._persisted[key[:2]]
+        user_keys = self._user_keys.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._user_keys[key[0]]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            # Промахи LRU, закрытые сохраненной записью, тоже считаются попаданиями
+            total = self.hits + self.misses
+            computed = self.misses - self.db_hits
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.db_hits) / total, 3) if total else 0.0,
+                'invalidations': self.invalidations,
+                'saved_seconds': round(self.saved_seconds, 3),
+                'avg_compute_ms': round(self.compute_seconds / computed * 1000, 2) if computed else 0.0,
+                'engine_version': engine_version()
+            }
+
+
+# Глобальный кэш данных на дату процесса бота
+prediction_cache = PredictionCache()
@@ -0,0 +1,184 @@
+"""
+Конвейер получения данных на дату: чтение, расчет и запись.
+
+Раньше одно нажатие "📅 Сегодня" открывало около восьми сессий: счетчик
+обращений, натальная карта, психоматрица, два чтения профиля, удаление и
+вставка биоритмов, чтение и обновление предсказания. Конвейер делает то же
+самое двумя запросами в двух коротких транзакциях:
+    1. профиль пользователя, соединенный с натальной картой и сохраненными
+       данными на эту дату (транзакция фиксируется до расчета);
+    2. upsert данных на дату в prediction_history (строка на пользователя и дату).
+Расчет между ними (до COMPUTE_JOB_TIMEOUT) идет без соединения из пула, поэтому
+соединения не простаивают в открытой транзакции.
+Счетчик обращений увеличивается в буфере request_counters и пишется в users
+пакетно, вне запроса пользователя. Месячные секции таблиц конвейера создаются
+заранее (prepare_pipeline_partitions при старте бота и в ночном предрасчете);
+если секции даты еще нет, ее DDL выполняется в транзакции записи и входит в
+число запросов конвейера.
+ Биоритмы вычисляются при чтении (biorhythm_cache) и пишутся в историю
+biorhythm_history третьим запросом только при включенном BIORHYTHM_AUDIT.
+
+Повторный запрос той же даты с теми же версиями карты и расчета отдается из
+prediction_cache или из prediction_history без расчета и без записи.
+
+Данные на дату содержат только расчеты дня и ссылки на натальную карту и
+психоматрицу (prediction_services.prediction_references); полные данные для
+модели собирает resolve_prediction_payload.
+"""
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.future import select
+
+from backend.database import async_engine, User, UserNatalChart, BiorhythmHistory, PredictionHistory
+from backend.biorhythm_cache import biorhythm_cache
+from backend.biorhythm_history import HISTORY_TABLE, ensure_history_partitions, history_row
+from backend.biorhythm_services import BIORHYTHM_AUDIT
+from backend.chart_cache import chart_version, user_chart_cache, user_chart_key
+from backend.compute_executor import compute_executor
+from backend.prediction_cache import PREDICTION_CACHE_PERSIST, prediction_cache, prediction_key
+from backend.partitions import ensure_monthly_partitions, mark_partitions_known, missing_months, partition_ddl
+from backend.request_counters import request_counters
+from backend.request_context import RequestContext, request_session
+from backend.prediction_services import PREDICTION_HISTORY_TABLE, build_prediction_data, prediction_history_upsert
+from backend.upserts import upsert
+
+logger = logging.getLogger(__name__)
+
+# Предел числа SQL-запросов на один вызов конвейера (+1 при записи биоритмов в журнал)
+MAX_PIPELINE_STATEMENTS = 3 if BIORHYTHM_AUDIT else 2
+
+# На сколько дней вперед секции таблиц конвейера создаются заранее
+PARTITION_HORIZON_DAYS = int(os.getenv('PARTITION_HORIZON_DAYS', '45'))
+
+_PROFILE_FIELDS = ('telegram_id', 'birth_date', 'birth_time', 'birth_city', 'profession', 'job_position',
+                   'current_city', 'gender', 'request_count', 'created_at')
+
+
+@event.listens_for(async_engine.sync_engine, 'before_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    # Запросы считаются только на соединениях, где конвейер включил учет
+    statements = conn.info.get('pipeline_statements')
+    if statements is not None:
+        statements.append(statement)
+
+
+@asynccontextmanager
+async def _transaction(session, statements: List[str]):
+    """Короткая транзакция конвейера с учетом выполненных запросов"""
+    if session.in_transaction():
+        # Чтения обновления до конвейера завершаются - конвейер идет своими транзакциями
+        await session.commit()
+    async with session.begin():
+        connection = await session.connection()
+        connection.info['pipeline_statements'] = statements
+        try:
+            yield
+        finally:
+            connection.info.pop('pipeline_statements', None)
+
+
+async def prepare_pipeline_partitions(start_date: date = None, days: int = PARTITION_HORIZON_DAYS):
+    """Секции prediction_history (и biorhythm_history при BIORHYTHM_AUDIT) на days дней вперед"""
+    if start_date is None:
+        start_date = date.today()
+    end_date = start_date + timedelta(days=days)
+    await ensure_monthly_partitions(PREDICTION_HISTORY_TABLE, start_date, end_date)
+    if BIORHYTHM_AUDIT:
+        await ensure_history_partitions(start_date, end_date)
+
+
+async def run_prediction_pipeline(telegram_id: int, target_date: date,
+                                  ctx: Optional[RequestContext] = None) -> Tuple[Dict, Dict]:
+    """
+    Учет обращения, расчет и сохранение данных на дату.
+
+    С контекстом обновления запросы конвейера выполняются в его сессии, а
+    полученный профиль сохраняется в контексте.
+
+    Returns:
+        (данные на дату в формате generate_and_save_prediction, профиль пользователя)
+    """
+    statements: List[str] = []
+
+    # 1. Профиль + натальная карта + сохраненные данные одним запросом, транзакция фиксируется сразу
+    query = (
+        select(*(getattr(User, field) for field in _PROFILE_FIELDS), UserNatalChart.natal_data,
+               UserNatalChart.input_fingerprint, UserNatalChart.updated_at.label('natal_updated_at'))
+        .outerjoin(UserNatalChart, UserNatalChart.telegram_id == User.telegram_id)
+        .where(User.telegram_id == telegram_id)
+    )
+    if PREDICTION_CACHE_PERSIST:
+        query = query.add_columns(PredictionHistory.predictions.label('stored_predictions')).outerjoin(
+            PredictionHistory,
+            (PredictionHistory.telegram_id == User.telegram_id) & (PredictionHistory.target_date == target_date)
+        )
+    async with request_session(ctx) as session:
+        async with _transaction(session, statements):
+            result = await session.execute(query)
+            row = result.mappings().one_or_none()
+    if row is None:
+        raise ValueError("Пользователь не найден. Пройдите регистрацию с помощью /start")
+
+    # Счетчик обращений - в буфере, профиль показывает его с учетом еще не записанных
+    request_counters.increment(telegram_id)
+    user_profile = {field: row[field] for field in _PROFILE_FIELDS}
+    user_profile['request_count'] = (row['request_count'] or 0) + request_counters.pending(telegram_id)
+    if ctx is not None:
+        ctx.profile = user_profile
+    natal_data = row['natal_data']
+    if not natal_data:
+        logger.warning(f"⚠️ Натальная карта не найдена для пользователя {telegram_id}")
+        raise ValueError("Натальная карта не найдена. Сначала создайте натальную карту с помощью /start")
+
+    natal_version = chart_version(row['input_fingerprint'], row['natal_updated_at'])
+    # Карта уже загружена - сборка данных для модели по ссылке обойдется без запроса
+    user_chart_cache.put(user_chart_key(telegram_id, natal_version), natal_data)
+    key = prediction_key(telegram_id, target_date, natal_version)
+    prediction_data = prediction_cache.get(key)
+    if prediction_data is None and PREDICTION_CACHE_PERSIST:
+        prediction_data = prediction_cache.get_persisted(key, row['stored_predictions'])
+
+    computed = prediction_data is None
+    if computed:
+        # Расчеты без соединения с БД: биоритмы из кэша процесса, астрология - в пуле процессов
+        started = time.perf_counter()
+        biorhythm_data = biorhythm_cache.get(user_profile['birth_date'], target_date)
+        astro_prediction = await compute_executor.generate_prediction(natal_data, target_date)
+        prediction_data = build_prediction_data(key, user_profile['birth_date'], astro_prediction, biorhythm_data)
+        prediction_cache.put(key, prediction_data, time.perf_counter() - started)
+    else:
+        logger.info(f"⚡ Данные на {target_date} для {telegram_id} взяты из кэша")
+
+    # 2. Данные на дату, если в БД для этой даты другие данные; 3. история биоритмов для аудита
+    needs_write = not prediction_cache.is_persisted(key)
+    audit = BIORHYTHM_AUDIT and computed
+    if needs_write or audit:
+        tables = ([PREDICTION_HISTORY_TABLE] if needs_write else []) + ([HISTORY_TABLE] if audit else [])
+        new_partitions = {table: missing_months(table, target_date, target_date) for table in tables}
+        async with request_session(ctx) as session:
+            async with _transaction(session, statements):
+                # Секции, не подготовленные заранее, создаются здесь и учитываются в числе запросов
+                for table, months in new_partitions.items():
+                    for month in months:
+                        await session.execute(text(partition_ddl(table, month)))
+                if needs_write:
+                    await session.execute(prediction_history_upsert(telegram_id, target_date, prediction_data))
+                if audit:
+                    await session.execute(upsert(BiorhythmHistory, history_row(telegram_id, biorhythm_data)))
+
+        # Отмечается только после фиксации транзакции
+        for table, months in new_partitions.items():
+            mark_partitions_known(table, months)
+    if needs_write:
+        prediction_cache.mark_persisted(key)
+    if len(statements) > MAX_PIPELINE_STATEMENTS:
+        logger.warning(f"⚠️ Конвейер для {telegram_id} выполнил {len(statements)} запросов "
+                       f"(ожидалось не более {MAX_PIPELINE_STATEMENTS})")
+    logger.info(f"💾 Данные на {target_date} для {telegram_id} сохранены за {len(statements)} запроса")
+    return prediction_data, user_profile
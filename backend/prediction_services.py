@@ -1,16 +1,26 @@
-from backend.database import async_session, NatalPredictions
-from backend.predictions import AstroPredictor
-from backend.chart_services import get_user_natal_chart
-from backend.matrix_services import get_user_matrix
+from backend.database import async_session, PredictionHistory
+from backend.compute_executor import compute_executor
+from backend.partitions import drop_partitions_before, ensure_monthly_partitions
+from backend.chart_cache import user_chart_cache, user_chart_key
+from backend.chart_services import get_user_natal_chart_version
+from backend.prediction_cache import PredictionKey, key_versions
+from backend.natal_chart import ephemeris_version
+from backend.upserts import upsert
+from backend.psyho_matrix import PsyhoMatrixCalculator
+from backend.user_services import get_user_profile
 from backend.biorhythm_services import calculate_and_save_biorhythms
 from sqlalchemy.future import select
-from sqlalchemy import func, and_
 import logging
 import json
-from datetime import datetime, date
+import os
+from datetime import datetime, date, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Сколько дней хранится история данных на дату (удаляется целыми месячными секциями)
+PREDICTION_RETENTION_DAYS = int(os.getenv('PREDICTION_RETENTION_DAYS', '90'))
+PREDICTION_HISTORY_TABLE = PredictionHistory.__tablename__
+
 
 class DataCombiner:
     """Класс для объединения данных астрологии и биоритмов"""
@@ -42,7 +52,7 @@ class DataCombiner:
             'calculation_metadata': {
                 'calculation_timestamp': datetime.now().isoformat(),
                 'data_sources': ['astrology', 'biorhythms'],
-                'calculation_methods': ['swiss_ephemeris', 'sine_wave_analysis']
+                'calculation_methods': [astro_prediction.get('ephemeris') or ephemeris_version(), 'sine_wave_analysis']
             }
         }
 
@@ -52,25 +62,23 @@ async def generate_and_save_prediction(telegram_id: int, target_date: date):
     try:
         logger.info(f"🔮 Генерация данных для пользователя {telegram_id} на {target_date}")
 
-        # Получаем натальную карту пользователя
-        natal_data = await get_user_natal_chart(telegram_id)
+        # Получаем натальную карту пользователя и ее версию
+        natal_data, natal_version = await get_user_natal_chart_version(telegram_id)
         if not natal_data:
             logger.warning(f"⚠️ Натальная карта не найдена для пользователя {telegram_id}")
             raise ValueError("Натальная карта не найдена. Сначала создайте натальную карту с помощью /start")
 
         logger.info(f"✅ Натальная карта найдена для {telegram_id}")
 
-        # Получаем психоматрицу пользователя
-        matrix_data = await get_user_matrix(telegram_id)
-        logger.info(f"✅ Психоматрица получена для {telegram_id}")
+        # Психоматрица - функция даты рождения, в данных хранится только ссылка на нее
+        user_profile = await get_user_profile(telegram_id)
 
         # Рассчитываем биоритмы на целевую дату
         biorhythm_data = await calculate_and_save_biorhythms(telegram_id, target_date)
         logger.info(f"✅ Биоритмы рассчитаны для {telegram_id} на {target_date}")
 
         # Генерируем астрологические данные на целевую дату
-        predictor = AstroPredictor(natal_data)
-        astro_prediction = predictor.generate_prediction(target_date)
+        astro_prediction = await compute_executor.generate_prediction(natal_data, target_date)
         logger.info(f"✅ Астрологические данные сгенерированы для {telegram_id} на {target_date}")
 
         # Объединяем данные
@@ -79,39 +87,17 @@ async def generate_and_save_prediction(telegram_id: int, target_date: date):
 
         logger.info(f"✅ Комбинированные данные созданы для {telegram_id}")
 
-        # Сохраняем данные в БД с ПЕРЕЗАПИСЬЮ
-        async with async_session() as session:
-            result = await session.execute(
-                select(NatalPredictions).where(NatalPredictions.telegram_id == telegram_id)
-            )
-            existing_record = result.scalar_one_or_none()
-
-            # Структура данных для сохранения
-            prediction_data = {
-                'calculation_date': datetime.now().isoformat(),
-                'target_date': target_date.isoformat(),
-                'natal_chart': natal_data,
-                'psyho_matrix': matrix_data,
-                'daily_calculations': combined_data
-            }
-
-            if existing_record:
-                # ПЕРЕЗАПИСЫВАЕМ существующую запись
-                existing_record.predictions = prediction_data
-                existing_record.updated_at = func.now()
-                logger.info(f"📝 Перезаписаны данные для {telegram_id} на {target_date}")
-            else:
-                # Создаем новую запись
-                new_record = NatalPredictions(
-                    telegram_id=telegram_id,
-                    predictions=prediction_data,
-                    assistant_data={},
-                )
-                session.add(new_record)
-                logger.info(f"🆕 Созданы новые данные для {telegram_id} на {target_date}")
+        # Структура данных для сохранения
+        prediction_data = {
+            'calculation_date': datetime.now().isoformat(),
+            'target_date': target_date.isoformat(),
+            'references': prediction_references(telegram_id, natal_version, user_profile['birth_date']),
+            'daily_calculations': combined_data
+        }
 
-            await session.commit()
-            logger.info(f"💾 Данные успешно сохранены в БД для {telegram_id}")
+        # Сохраняем данные на дату: строка на пользователя и дату, повторный расчет ее перезаписывает
+        await save_prediction_history(telegram_id, target_date, prediction_data)
+        logger.info(f"💾 Данные успешно сохранены в БД для {telegram_id} на {target_date}")
 
         return prediction_data
 
@@ -123,18 +109,110 @@ async def generate_and_save_prediction(telegram_id: int, target_date: date):
         raise Exception(f"Не удалось сгенерировать данные на основе расчетов: {str(e)}")
 
 
+def prediction_references(telegram_id: int, natal_version: str, birth_date: date) -> dict:
+    """
+    Ссылки на исходные данные вместо их копий в каждой строке данных на дату:
+    натальная карта - по пользователю и версии, психоматрица - по дате рождения.
+    """
+    return {
+        'natal_chart': {'telegram_id': telegram_id, 'version': natal_version},
+        'psyho_matrix': {'birth_date': birth_date.isoformat()}
+    }
+
+
+def build_prediction_data(key: PredictionKey, birth_date: date, astro_prediction: dict,
+                          biorhythm_data: dict) -> dict:
+    """Данные на дату для ключа prediction_cache (формат конвейера и ночного предрасчета)"""
+    telegram_id, target_date, natal_version, _ = key
+    return {
+        'calculation_date': datetime.now().isoformat(),
+        'target_date': target_date.isoformat(),
+        'versions': key_versions(key),
+        'references': prediction_references(telegram_id, natal_version, birth_date),
+        'daily_calculations': DataCombiner().combine_calculation_data(astro_prediction, biorhythm_data)
+    }
+
+
+async def resolve_prediction_payload(prediction: dict) -> dict:
+    """
+    Полные данные на дату с натальной картой и психоматрицей, собранные по ссылкам.
+    Записи старого формата (с копиями карты и матрицы) возвращаются как есть.
+
+    Карта подставляется только той версии, по которой считались данные.
+    Если карта пользователя с тех пор изменилась, данные на дату возвращаются
+    без карты с natal_chart_status='stale' (их нужно пересчитать), а без
+    карты - с 'missing'; при совпадении версий - 'resolved'.
+    """
+    references = prediction.get('references')
+    if not references:
+        return prediction
+
+    natal_reference = references['natal_chart']
+    natal_data = user_chart_cache.get(user_chart_key(natal_reference['telegram_id'], natal_reference['version']))
+    natal_status = 'resolved'
+    if natal_data is None:
+        natal_data, version = await get_user_natal_chart_version(natal_reference['telegram_id'])
+        if natal_data is None:
+            natal_status = 'missing'
+        elif version != natal_reference['version']:
+            # Карта другой версии не подставляется: данные на дату считались не по ней
+            logger.warning(f"⚠️ Натальная карта {natal_reference['telegram_id']} изменилась после расчета данных "
+                           f"на {prediction.get('target_date')}, данные на дату устарели")
+            natal_data, natal_status = None, 'stale'
+
+    birth_date = date.fromisoformat(references['psyho_matrix']['birth_date'])
+    matrix_data = PsyhoMatrixCalculator().calculate_matrix(birth_date)
+
+    return {**prediction, 'natal_chart': natal_data or {}, 'natal_chart_status': natal_status,
+            'psyho_matrix': matrix_data}
+
+
+def prediction_history_upsert(telegram_id: int, target_date: date, prediction_data: dict):
+    """Upsert строки prediction_history по (telegram_id, target_date)"""
+    return upsert(PredictionHistory, {
+        'telegram_id': telegram_id,
+        'target_date': target_date,
+        'predictions': prediction_data,
+        'updated_at': datetime.now()
+    })
+
+
+async def save_prediction_history(telegram_id: int, target_date: date, prediction_data: dict):
+    """Сохранение данных на дату в prediction_history"""
+    await ensure_monthly_partitions(PREDICTION_HISTORY_TABLE, target_date, target_date)
+    async with async_session() as session:
+        await session.execute(prediction_history_upsert(telegram_id, target_date, prediction_data))
+        await session.commit()
+
+
+async def get_prediction_for_date(telegram_id: int, target_date: date):
+    """Сохраненные данные пользователя на дату (чтение по первичному ключу)"""
+    try:
+        async with async_session() as session:
+            result = await session.execute(
+                select(PredictionHistory.predictions).where(
+                    PredictionHistory.telegram_id == telegram_id,
+                    PredictionHistory.target_date == target_date
+                )
+            )
+            return result.scalar_one_or_none()
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка при получении данных {telegram_id} на {target_date}: {e}")
+        return None
+
+
 async def get_user_predictions(telegram_id: int):
     """Получение последних данных пользователя"""
     try:
         async with async_session() as session:
             result = await session.execute(
-                select(NatalPredictions).where(NatalPredictions.telegram_id == telegram_id)
+                select(PredictionHistory.predictions)
+                .where(PredictionHistory.telegram_id == telegram_id)
+                .order_by(PredictionHistory.updated_at.desc())
+                .limit(1)
             )
-            predictions = result.scalar_one_or_none()
-
-            if predictions:
-                return predictions.predictions
-            return None
+            return result.scalar_one_or_none()
 
     except Exception as e:
         logger.error(f"❌ Ошибка при получении данных {telegram_id}: {e}")
@@ -224,11 +302,12 @@ async def format_data_for_user(prediction: dict) -> str:
 
 
 async def format_data_for_model(telegram_id: int, user_profile: dict, prediction: dict) -> str:
-    """Форматирование данных для модели ИИ"""
+    """Форматирование данных для модели ИИ (натальная карта и психоматрица подставляются по ссылкам)"""
     if not prediction:
         return "❌ No calculation data available"
 
     try:
+        prediction = await resolve_prediction_payload(prediction)
         model_data = {
             'user_profile': {
                 'telegram_id': telegram_id,
@@ -240,6 +319,7 @@ async def format_data_for_model(telegram_id: int, user_profile: dict, prediction
                 'birth_city': user_profile.get('birth_city')
             },
             'natal_chart': prediction.get('natal_chart', {}),
+            'natal_chart_status': prediction.get('natal_chart_status', 'resolved'),
             'psyho_matrix': prediction.get('psyho_matrix', {}),
             'daily_calculations': prediction.get('daily_calculations', {}),
             'target_date': prediction.get('target_date'),
@@ -319,23 +399,37 @@ async def validate_prediction_data(telegram_id: int) -> bool:
             return False
 
         # Проверяем наличие обязательных полей
-        required_fields = ['natal_chart', 'psyho_matrix', 'daily_calculations', 'target_date']
+        required_fields = ['daily_calculations', 'target_date']
         for field in required_fields:
             if field not in prediction:
                 return False
 
-        return True
+        # Натальная карта и психоматрица - ссылками или (в старых записях) копиями
+        references = prediction.get('references', {})
+        return all(name in references or name in prediction for name in ('natal_chart', 'psyho_matrix'))
 
     except Exception as e:
         logger.error(f"❌ Ошибка валидации данных для {telegram_id}: {e}")
         return False
 
 
-async def cleanup_old_predictions():
-    """Очистка устаревших данных"""
+async def cleanup_old_predictions(days_old: int = PREDICTION_RETENTION_DAYS):
+    """
+    Очистка устаревших данных на дату: удаляются целые месячные секции
+    prediction_history, все даты которых старше days_old дней.
+
+    Returns:
+        Количество удаленных секций
+    """
     try:
-        logger.info("🔄 Очистка устаревших данных не требуется в текущей структуре")
-        return 0
+        cutoff_date = date.today() - timedelta(days=days_old)
+        dropped = await drop_partitions_before(PREDICTION_HISTORY_TABLE, cutoff_date)
+
+        if dropped:
+            logger.info(f"🗑️ Удалено {len(dropped)} секций данных на дату (старше {cutoff_date})")
+        else:
+            logger.info("✅ Устаревших секций данных на дату не найдено")
+        return len(dropped)
 
     except Exception as e:
         logger.error(f"❌ Ошибка при очистке данных: {e}")
@@ -1,15 +1,39 @@
 from math import floor
 import json
-from datetime import date, datetime
+from datetime import date
+import numpy as np
 import swisseph as swe
-from sqlalchemy.future import select
 
 from backend.database import async_session, NatalPredictions
+from backend.transit_cache import transit_cache
+from backend.chebyshev_ephemeris import EPHEMERIS_BACKEND
+from backend.natal_chart import ephemeris_version
+from backend.aspect_engine import AspectEngine, same_name_mask
+from backend.upserts import upsert
+
+# Версия расчета данных на дату (транзиты, аспекты, биоритмы, формат daily_calculations):
+# увеличивается при любом изменении, чтобы кэш предсказаний не отдавал устаревшие данные
+ENGINE_VERSION = 3
+
+# Аспекты транзитов: {угол: (название, точный угол, орбис)}
+TRANSIT_ASPECTS = {
+    0: ('conjunction', 0, 8),
+    60: ('sextile', 60, 6),
+    90: ('square', 90, 8),
+    120: ('trine', 120, 8),
+    180: ('opposition', 180, 8)
+}
+
+transit_aspect_engine = AspectEngine({
+    angle: (name, orb) for angle, (name, exact, orb) in TRANSIT_ASPECTS.items()
+})
 
 
 class AstroPredictor:
-    def __init__(self, natal_chart):
+    def __init__(self, natal_chart, ephemeris_backend: str = None):
         self.natal_chart = natal_chart
+        # Бэкенд расчета транзитов: 'swisseph' или 'chebyshev'
+        self.ephemeris_backend = ephemeris_backend or EPHEMERIS_BACKEND
         self.planets_ml = {
             swe.SUN: 'Sun', swe.MOON: 'Moon', swe.MERCURY: 'Mercury',
             swe.VENUS: 'Venus', swe.MARS: 'Mars', swe.JUPITER: 'Jupiter',
@@ -19,57 +43,46 @@ class AstroPredictor:
         self.planet_names_to_ids = {v: k for k, v in self.planets_ml.items()}
 
     def calculate_transits(self, target_date):
-        jd_target = swe.julday(target_date.year, target_date.month, target_date.day, 12.0)
+        # Позиции на дату одинаковы для всех пользователей - берем из общего кэша
+        positions = transit_cache.get_positions(
+            target_date, 12.0, swe.FLG_SWIEPH | swe.FLG_SPEED, self.ephemeris_backend
+        )
         transits = {}
         for planet_id, name in self.planets_ml.items():
-            pos, _ = swe.calc_ut(jd_target, planet_id, swe.FLG_SWIEPH)
-            lon = pos[0] % 360
+            lon, speed = positions[planet_id]
+            lon = lon % 360
             transits[name] = {
                 'longitude': lon,
                 'sign': self.get_sign_from_longitude(lon),
                 'position_in_sign': lon % 30,
-                'retrograde': pos[3] < 0
+                'retrograde': speed < 0
             }
         return transits
 
+    def ephemeris_source(self, target_date) -> str:
+        """Источник эфемерид транзитов на дату (момент расчета - 12:00 UT, как в calculate_transits)"""
+        jd_ut = swe.julday(target_date.year, target_date.month, target_date.day, 12.0)
+        return ephemeris_version(self.ephemeris_backend, jd_ut)
+
     def get_sign_from_longitude(self, longitude):
         signs = ["Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo",
                  "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"]
         return signs[floor(longitude / 30)]
 
     def analyze_aspects(self, transits, natal_positions):
-        aspects = []
-        for t_planet, t_data in transits.items():
-            for n_planet, n_data in natal_positions.items():
-                if t_planet == n_planet:
-                    continue
-                t_lon = t_data['longitude']
-                n_lon = n_data['longitude']
-                distance = abs(t_lon - n_lon)
-                angle = min(distance, 360 - distance)
-                aspect_info = self.check_aspect(angle)
-                if aspect_info:
-                    aspects.append({
-                        'transit_planet': t_planet,
-                        'natal_planet': n_planet,
-                        'aspect': aspect_info[0],
-                        'exact_angle': aspect_info[1],
-                        'actual_angle': angle,
-                        'orb': abs(angle - aspect_info[1]),
-                        'strength': 1.0 - (abs(angle - aspect_info[1]) / aspect_info[2])
-                    })
-        aspects.sort(key=lambda x: x['strength'], reverse=True)
-        return aspects
+        transit_names = list(transits)
+        natal_names = list(natal_positions)
+        transit_lon = np.array([transits[name]['longitude'] for name in transit_names], dtype=np.float64)
+        natal_lon = np.array([natal_positions[name]['longitude'] for name in natal_names], dtype=np.float64)
+
+        # Одноименные пары (транзит планеты к ее же натальной позиции) не рассматриваются
+        records = transit_aspect_engine.find(
+            transit_lon, natal_lon, same_name_mask(transit_names, natal_names)
+        )
+        return transit_aspect_engine.transit_aspects_to_dicts(records, transit_names, natal_names)
 
     def check_aspect(self, angle):
-        aspects = {
-            0: ('conjunction', 0, 8),
-            60: ('sextile', 60, 6),
-            90: ('square', 90, 8),
-            120: ('trine', 120, 8),
-            180: ('opposition', 180, 8)
-        }
-        for aspect_angle, (name, exact, orb) in aspects.items():
+        for aspect_angle, (name, exact, orb) in TRANSIT_ASPECTS.items():
             if abs(angle - aspect_angle) <= orb:
                 return (name, exact, orb)
         return None
@@ -103,6 +116,7 @@ class AstroPredictor:
 
             return {
                 'prediction_date': target_date.strftime('%Y-%m-%d'),
+                'ephemeris': self.ephemeris_source(target_date),
                 'transits': transits,
                 'aspects': aspects,
                 'aspects_count': len(aspects),
@@ -127,21 +141,94 @@ class AstroPredictor:
         """Сохранение предсказания в базу данных"""
         prediction = self.generate_prediction(prediction_date)
         async with async_session() as session:
-            result = await session.execute(
-                select(NatalPredictions).where(NatalPredictions.telegram_id == telegram_id)
-            )
-            existing_record = result.scalar_one_or_none()
-
-            if existing_record:
-                existing_record.predictions = prediction
-                existing_record.updated_at = datetime.utcnow()
-            else:
-                new_record = NatalPredictions(
-                    telegram_id=telegram_id,
-                    predictions=prediction,
-                    assistant_data={},
-                )
-                session.add(new_record)
-
+            # assistant_data задается только при создании записи
+            await session.execute(upsert(NatalPredictions, {
+                'telegram_id': telegram_id,
+                'predictions': prediction,
+                'assistant_data': {}
+            }, update_columns=['predictions']))
             await session.commit()
-        return prediction
\ No newline at end of file
+        return prediction
+
+
+# Натальные точки для пакетного расчета: планеты AstroPredictor и Асцендент
+TRANSIT_PLANET_NAMES = ('Sun', 'Moon', 'Mercury', 'Venus', 'Mars',
+                        'Jupiter', 'Saturn', 'Uranus', 'Neptune', 'Pluto')
+NATAL_POINT_NAMES = TRANSIT_PLANET_NAMES + ('Ascendant',)
+
+
+def natal_longitude_matrix(natal_charts) -> np.ndarray:
+    """
+    Матрица натальных долгот (пользователи x NATAL_POINT_NAMES).
+    Отсутствующие точки заполняются NaN и не образуют аспектов.
+    """
+    matrix = np.full((len(natal_charts), len(NATAL_POINT_NAMES)), np.nan, dtype=np.float64)
+    for row, natal_chart in enumerate(natal_charts):
+        planets = natal_chart.get('planets', {})
+        for column, name in enumerate(TRANSIT_PLANET_NAMES):
+            if name in planets:
+                matrix[row, column] = planets[name]['longitude']
+        if 'angles' in natal_chart:
+            matrix[row, -1] = natal_chart['angles']['ascendant']['longitude']
+    return matrix
+
+
+def batch_transit_aspects(natal_matrix: np.ndarray, transits: dict, chunk_size: int = 20000) -> np.ndarray:
+    """
+    Аспекты транзитов одной даты ко всем натальным картам за один векторный проход.
+
+    Args:
+        natal_matrix: долготы формы (N, len(NATAL_POINT_NAMES)), см. natal_longitude_matrix
+        transits: результат AstroPredictor.calculate_transits
+        chunk_size: число пользователей в одном блоке (ограничивает пиковую память)
+
+    Returns:
+        Массив ASPECT_DTYPE: batch - номер пользователя, i - транзитная планета
+        (TRANSIT_PLANET_NAMES), j - натальная точка (NATAL_POINT_NAMES)
+    """
+    transit_lon = np.array([transits[name]['longitude'] for name in TRANSIT_PLANET_NAMES], dtype=np.float64)
+    pair_mask = same_name_mask(TRANSIT_PLANET_NAMES, NATAL_POINT_NAMES)
+
+    chunks = []
+    for start in range(0, len(natal_matrix), chunk_size):
+        records = transit_aspect_engine.find(transit_lon, natal_matrix[start:start + chunk_size], pair_mask)
+        records['batch'] += start
+        chunks.append(records)
+    if not chunks:
+        return transit_aspect_engine.find(transit_lon, np.empty((0, len(NATAL_POINT_NAMES))), pair_mask)
+    return np.concatenate(chunks)
+
+
+def batch_aspects_to_dicts(records: np.ndarray, users_count: int):
+    """Разбиение пакетного результата на списки аспектов в формате analyze_aspects по пользователям"""
+    bounds = np.searchsorted(records['batch'], np.arange(users_count + 1))
+    return [
+        transit_aspect_engine.transit_aspects_to_dicts(
+            records[bounds[user]:bounds[user + 1]], TRANSIT_PLANET_NAMES, NATAL_POINT_NAMES
+        )
+        for user in range(users_count)
+    ]
+
+
+def batch_generate_predictions(natal_charts, target_date: date, ephemeris_backend=None):
+    """
+    generate_prediction для группы натальных карт на одну дату: транзиты
+    рассчитываются один раз, аспекты ко всем картам - одним векторным проходом.
+    """
+    predictor = AstroPredictor({}, ephemeris_backend)
+    transits = predictor.calculate_transits(target_date)
+    ephemeris = predictor.ephemeris_source(target_date)
+    records = batch_transit_aspects(natal_longitude_matrix(natal_charts), transits)
+    retrograde_planets = [p for p, data in transits.items() if data.get('retrograde')]
+    return [
+        {
+            'prediction_date': target_date.strftime('%Y-%m-%d'),
+            'ephemeris': ephemeris,
+            'transits': transits,
+            'aspects': aspects,
+            'aspects_count': len(aspects),
+            'strong_aspects_count': len([a for a in aspects if a['strength'] > 0.7]),
+            'retrograde_planets': retrograde_planets
+        }
+        for aspects in batch_aspects_to_dicts(records, len(natal_charts))
+    ]
@@ -1,8 +1,25 @@
-from datetime import datetime
+from datetime import date, datetime
+from typing import Dict, Sequence
+import threading
 import logging
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
+# Диапазон дат рождения, для которого психоматрицы рассчитаны заранее
+MATRIX_FIRST_DATE = date(1900, 1, 1)
+MATRIX_LAST_DATE = date(2100, 12, 31)
+
+# Запись таблицы: количество цифр 1-9, четыре основных числа,
+# битовые маски сильных (>= 2 раз) и отсутствующих цифр (бит i-1 - цифра i)
+MATRIX_DTYPE = np.dtype([
+    ('digits', np.uint8, 9),
+    ('basic', np.int16, 4),
+    ('strong', np.uint16),
+    ('missing', np.uint16)
+])
+
 
 class PsyhoMatrixCalculator:
     def __init__(self):
@@ -10,6 +27,30 @@ class PsyhoMatrixCalculator:
 
     def calculate_matrix(self, birth_date: datetime.date):
         """Расчет психоматрицы по дате рождения (нумерология Пифагора)"""
+        record = self.lookup(birth_date)
+        if record is None:
+            return self._calculate_matrix_direct(birth_date)
+        return matrix_to_dict(record)
+
+    def lookup(self, birth_date: date):
+        """Запись MATRIX_DTYPE из таблицы психоматриц (None - дата вне диапазона таблицы)"""
+        index = birth_date.toordinal() - MATRIX_FIRST_DATE.toordinal()
+        table = get_matrix_table()
+        if not 0 <= index < len(table):
+            return None
+        return table[index]
+
+    def lookup_batch(self, birth_dates: Sequence[date]) -> np.ndarray:
+        """Записи таблицы для группы дат (все даты должны входить в диапазон таблицы)"""
+        indices = np.fromiter((d.toordinal() for d in birth_dates), dtype=np.int64, count=len(birth_dates))
+        indices -= MATRIX_FIRST_DATE.toordinal()
+        table = get_matrix_table()
+        if len(indices) and (indices.min() < 0 or indices.max() >= len(table)):
+            raise ValueError(f"Дата рождения вне диапазона {MATRIX_FIRST_DATE} - {MATRIX_LAST_DATE}")
+        return table[indices]
+
+    def _calculate_matrix_direct(self, birth_date: datetime.date):
+        """Расчет психоматрицы по цифрам даты (для дат вне таблицы)"""
         day = birth_date.day
         month = birth_date.month
         year = birth_date.year
@@ -69,4 +110,70 @@ class PsyhoMatrixCalculator:
             'total_digits': sum(matrix.values()),
             'strong_digits': [digit for digit, count in matrix.items() if count >= 2],
             'missing_digits': [digit for digit in map(str, range(1, 10)) if matrix.get(digit, 0) == 0]
-        }
\ No newline at end of file
+        }
+
+
+def matrix_to_dict(record) -> Dict:
+    """Словарь психоматрицы в формате calculate_matrix из записи таблицы"""
+    digits, basic, strong, missing = record.item()
+    digits = digits.tolist()
+    first, second, third, fourth = basic.tolist()
+    return {
+        'basic_numbers': {
+            'first': first,
+            'second': second,
+            'third': third,
+            'fourth': fourth
+        },
+        'pythagoras_matrix': {str(digit): digits[digit - 1] for digit in range(1, 10)},
+        'digit_counts': {
+            'total_digits': sum(digits),
+            'strong_digits': [str(digit) for digit in range(1, 10) if strong >> (digit - 1) & 1],
+            'missing_digits': [str(digit) for digit in range(1, 10) if missing >> (digit - 1) & 1]
+        },
+        'calculated_at': datetime.now().isoformat()
+    }
+
+
+def build_matrix_table() -> np.ndarray:
+    """Психоматрицы всех дат MATRIX_FIRST_DATE..MATRIX_LAST_DATE (по индексу - дни от MATRIX_FIRST_DATE)"""
+    first_ordinal = MATRIX_FIRST_DATE.toordinal()
+    dates = np.arange(np.datetime64(MATRIX_FIRST_DATE), np.datetime64(MATRIX_LAST_DATE) + 1)
+    years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    months = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    days = (dates - dates.astype('datetime64[M]')).astype(np.int64) + 1
+    assert len(dates) == MATRIX_LAST_DATE.toordinal() - first_ordinal + 1
+
+    # Цифры даты ДДММГГГГ (ведущие нули не влияют на счет цифр 1-9 и суммы)
+    date_digits = np.stack([days // 10, days % 10, months // 10, months % 10,
+                            years // 1000, years // 100 % 10, years // 10 % 10, years % 10], axis=1)
+
+    table = np.zeros(len(dates), dtype=MATRIX_DTYPE)
+    for digit in range(1, 10):
+        count = (date_digits == digit).sum(axis=1)
+        table['digits'][:, digit - 1] = count
+        table['strong'] |= (count >= 2).astype(np.uint16) << (digit - 1)
+        table['missing'] |= (count == 0).astype(np.uint16) << (digit - 1)
+
+    # Основные числа: суммы не превышают двух цифр (8 цифр * 9 = 72)
+    first = date_digits.sum(axis=1)
+    third = first - 2 * (days // 10)
+    table['basic'] = np.stack([first, first // 10 + first % 10, third, third // 10 + third % 10], axis=1)
+    table.flags.writeable = False
+    return table
+
+
+_matrix_table = None
+_matrix_table_lock = threading.Lock()
+
+
+def get_matrix_table() -> np.ndarray:
+    """Таблица психоматриц процесса (строится при первом обращении, около 1.5 МБ)"""
+    global _matrix_table
+    if _matrix_table is None:
+        with _matrix_table_lock:
+            if _matrix_table is None:
+                _matrix_table = build_matrix_table()
+                logger.info(f"🔢 Таблица психоматриц построена: {len(_matrix_table)} дат "
+                            f"({_matrix_table.nbytes / 2 ** 20:.1f} МБ)")
+    return _matrix_table
@@ -0,0 +1,95 @@
+"""
+Контекст одного обновления бота: сессия БД и профиль пользователя.
+
+Без контекста каждая сервисная функция открывала свою сессию (отдельная
+выдача соединения из пула с pool_pre_ping) и заново читала строку users:
+проверка статуса данных - четыре сессии и два чтения профиля. С контекстом
+чтения одного обновления идут через одну сессию, а профиль загружается при
+первом обращении (user_services.get_user_profile) и дальше берется из
+контекста.
+
+Контекст создает RequestContextMiddleware (bot/middlewares.py) и передает
+обработчикам аргументом ctx; сервисные функции принимают его необязательным
+аргументом ctx и без него работают как раньше. Записи по-прежнему фиксируются
+в собственных сессиях сервисов; после записи профиля контекст нужно сбросить
+(forget_profile).
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import async_session
+
+logger = logging.getLogger(__name__)
+
+_NOT_LOADED = object()
+
+
+class RequestContext:
+    """Сессия БД и данные пользователя на время обработки одного обновления"""
+
+    def __init__(self, telegram_id: int):
+        self.telegram_id = telegram_id
+        self._session: Optional[AsyncSession] = None
+        self._profile = _NOT_LOADED
+
+    @property
+    def session(self) -> AsyncSession:
+        """Сессия обновления; создается при первом обращении, соединение - при первом запросе"""
+        if self._session is None:
+            self._session = async_session()
+        return self._session
+
+    @property
+    def profile_loaded(self) -> bool:
+        return self._profile is not _NOT_LOADED
+
+    @property
+    def profile(self) -> Optional[Dict]:
+        """Загруженный профиль (None - пользователь не найден)"""
+        if self._profile is _NOT_LOADED:
+            raise RuntimeError("Профиль еще не загружен: используйте get_user_profile(telegram_id, ctx)")
+        return self._profile
+
+    @profile.setter
+    def profile(self, profile: Optional[Dict]):
+        self._profile = profile
+
+    def forget_profile(self):
+        """Сброс профиля после его изменения: следующее чтение загрузит его заново"""
+        self._profile = _NOT_LOADED
+
+    async def release(self):
+        """
+        Возврат соединения в пул до конца обновления (например, перед ответом
+        пользователю); сессия остается рабочей и при следующем запросе возьмет
+        соединение снова.
+        """
+        if self._session is not None:
+            await self._session.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+@asynccontextmanager
+async def request_session(ctx: Optional[RequestContext] = None) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для чтения: сессия контекста (не закрывается по выходу из блока)
+    или новая сессия на время блока, если контекста нет.
+    """
+    if ctx is None:
+        async with async_session() as session:
+            yield session
+        return
+
+    try:
+        yield ctx.session
+    except Exception:
+        # Ошибка запроса прерывает транзакцию PostgreSQL - без отката сессия контекста непригодна
+        await ctx.session.rollback()
+        raise
@@ -0,0 +1,142 @@
+"""
+Отложенная запись счетчиков обращений (write-behind).
+
+Каждый запрос рекомендаций увеличивал users.request_count отдельной записью
+на горячем пути. Теперь обращения накапливаются в памяти процесса по
+telegram_id и записываются одним запросом
+    UPDATE users SET request_count = request_count + deltas.delta
+    FROM (VALUES (...), ...) AS deltas (telegram_id, delta)
+раз в REQUEST_COUNTER_FLUSH_SECONDS, при накоплении REQUEST_COUNTER_MAX_PENDING
+пользователей и при остановке бота. Чтение (get_user_request_count)
+складывает сохраненное значение и еще не записанные обращения.
+
+При аварийном завершении процесса теряются обращения за последний интервал
+записи; при ошибке записи они возвращаются в буфер.
+"""
+import asyncio
+import os
+from typing import Dict, Optional
+import logging
+
+from sqlalchemy import BigInteger, Integer, column, func, update, values
+
+from backend.database import async_engine, User
+
+logger = logging.getLogger(__name__)
+
+REQUEST_COUNTER_FLUSH_SECONDS = float(os.getenv('REQUEST_COUNTER_FLUSH_SECONDS', '10'))
+REQUEST_COUNTER_MAX_PENDING = int(os.getenv('REQUEST_COUNTER_MAX_PENDING', '5000'))
+# Строк VALUES в одном UPDATE (по 2 параметра на строку, предел asyncpg - 32767)
+REQUEST_COUNTER_FLUSH_BATCH = 10000
+
+
+class RequestCounterBuffer:
+    """Буфер приращений счетчиков обращений с периодической пакетной записью"""
+
+    def __init__(self, flush_seconds: float = REQUEST_COUNTER_FLUSH_SECONDS,
+                 max_pending: int = REQUEST_COUNTER_MAX_PENDING):
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._pending: Dict[int, int] = {}
+        # Приращения, которые записываются прямо сейчас (учитываются при чтении до фиксации)
+        self._flushing: Dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.increments = 0
+        self.flushes = 0
+        self.flushed_users = 0
+        self.failed_flushes = 0
+
+    def increment(self, telegram_id: int, count: int = 1):
+        """Учет обращения без обращения к БД"""
+        self._pending[telegram_id] = self._pending.get(telegram_id, 0) + count
+        self.increments += count
+        if len(self._pending) >= self.max_pending and self._flush_requested is not None:
+            self._flush_requested.set()
+
+    def pending(self, telegram_id: int) -> int:
+        """Обращения пользователя, еще не записанные в БД"""
+        return self._pending.get(telegram_id, 0) + self._flushing.get(telegram_id, 0)
+
+    async def flush(self) -> int:
+        """
+        Запись накопленных приращений пакетными UPDATE ... FROM (VALUES ...).
+
+        Returns:
+            Количество пользователей, счетчики которых записаны
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            # Новые обращения во время записи накапливаются в новом словаре
+            self._flushing, self._pending = self._pending, {}
+            items = list(self._flushing.items())
+            try:
+                async with async_engine.begin() as conn:
+                    for offset in range(0, len(items), REQUEST_COUNTER_FLUSH_BATCH):
+                        deltas = values(
+                            column('telegram_id', BigInteger), column('delta', Integer), name='deltas'
+                        ).data(items[offset:offset + REQUEST_COUNTER_FLUSH_BATCH])
+                        await conn.execute(
+                            update(User)
+                            .where(User.telegram_id == deltas.c.telegram_id)
+                            .values(request_count=func.coalesce(User.request_count, 0) + deltas.c.delta)
+                        )
+            except Exception as e:
+                for telegram_id, delta in items:
+                    self._pending[telegram_id] = self._pending.get(telegram_id, 0) + delta
+                self.failed_flushes += 1
+                logger.error(f"❌ Не удалось записать счетчики обращений ({len(items)} пользователей): {e}")
+                return 0
+            finally:
+                self._flushing = {}
+
+            self.flushes += 1
+            self.flushed_users += len(items)
+            logger.info(f"📈 Записаны счетчики обращений: {len(items)} пользователей, "
+                        f"{sum(delta for _, delta in items)} обращений")
+            return len(items)
+
+    async def _run(self):
+        # Задача не отменяется, а завершается по флагу: запись уже изъятых из буфера
+        # приращений не должна прерываться на середине
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    def start(self):
+        """Запуск периодической записи в текущем цикле событий"""
+        if self._task is not None:
+            return
+        self._flush_requested = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"📈 Отложенная запись счетчиков обращений: раз в {self.flush_seconds:g} с")
+
+    async def stop(self):
+        """Остановка периодической записи и запись оставшихся приращений"""
+        if self._task is not None:
+            self._stopping = True
+            self._flush_requested.set()
+            await self._task
+            self._task, self._flush_requested, self._stopping = None, None, False
+        await self.flush()
+
+    def get_stats(self) -> Dict:
+        return {
+            'pending_users': len(self._pending),
+            'pending_requests': sum(self._pending.values()),
+            'increments': self.increments,
+            'flushes': self.flushes,
+            'flushed_users': self.flushed_users,
+            'failed_flushes': self.failed_flushes
+        }
+
+
+# Глобальный буфер счетчиков процесса бота
+request_counters = RequestCounterBuffer()
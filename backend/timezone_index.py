@@ -0,0 +1,139 @@
+"""
+Определение часового пояса IANA по координатам без сети и без shapely.
+
+Границы часовых поясов заранее растеризуются в двухуровневую сетку
+(backend/data/timezone_grid.npz):
+    - грубая сетка 1° x 1°: для однородной ячейки хранится индекс пояса;
+    - ячейки, через которые проходит граница, ссылаются на подсетку 32 x 32
+      (шаг 1/32°, около 3.5 км).
+Поиск - два обращения к массивам, O(1).
+
+Сборка сетки (нужен пакет timezonefinder, только на этапе сборки):
+    python -m backend.timezone_index build
+"""
+import math
+import os
+import sys
+import threading
+from functools import lru_cache
+from typing import Optional
+import logging
+
+import numpy as np
+import pytz
+
+logger = logging.getLogger(__name__)
+
+TIMEZONE_GRID_PATH = os.getenv(
+    'TIMEZONE_GRID_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'timezone_grid.npz')
+)
+DEFAULT_TIMEZONE = 'Europe/Moscow'
+
+SUBGRID_SIZE = 32
+# Точки проверки однородности грубой ячейки (доли ячейки по каждой оси)
+_PROBE_FRACTIONS = (0.02, 0.25, 0.5, 0.75, 0.98)
+
+
+@lru_cache(maxsize=None)
+def get_zone(timezone_str: str):
+    """Объект часового пояса pytz (создается один раз на процесс)"""
+    return pytz.timezone(timezone_str)
+
+
+class TimezoneIndex:
+    """Двухуровневая сетка часовых поясов"""
+
+    def __init__(self, grid_path: str = None):
+        with np.load(grid_path or TIMEZONE_GRID_PATH) as data:
+            self.coarse = data['coarse']
+            self.subgrids = data['subgrids']
+            self.zones = data['zones'].tolist()
+        self.subgrid_size = self.subgrids.shape[1] if len(self.subgrids) else SUBGRID_SIZE
+
+    def timezone_at(self, lat: float, lon: float) -> Optional[str]:
+        """Часовой пояс IANA для точки (широта, долгота)"""
+        if not (-90 <= lat <= 90) or math.isnan(lon):
+            return None
+        size = self.subgrid_size
+        y = int(min((lat + 90) * size, 180 * size - 1))
+        x = int(((lon + 180) % 360) * size)
+
+        cell = int(self.coarse[y // size, x // size])
+        if cell < 0:
+            cell = int(self.subgrids[-cell - 1, y % size, x % size])
+        return self.zones[cell]
+
+
+def build_timezone_grid(grid_path: str = None) -> str:
+    """Растеризация границ часовых поясов из timezonefinder в timezone_grid.npz"""
+    try:
+        from timezonefinder import TimezoneFinder
+    except ImportError:
+        raise RuntimeError("Для сборки сетки часовых поясов установите timezonefinder")
+
+    grid_path = grid_path or TIMEZONE_GRID_PATH
+    finder = TimezoneFinder(in_memory=True)
+    zone_ids = {}
+
+    def zone_id(lat: float, lon: float) -> int:
+        name = finder.timezone_at(lat=lat, lng=lon) or finder.timezone_at_land(lat=lat, lng=lon) or 'Etc/UTC'
+        return zone_ids.setdefault(name, len(zone_ids))
+
+    coarse = np.empty((180, 360), dtype=np.int32)
+    subgrids = []
+    step = 1.0 / SUBGRID_SIZE
+    for row in range(180):
+        lat0 = row - 90
+        for col in range(360):
+            lon0 = col - 180
+            probes = {zone_id(lat0 + fy, lon0 + fx) for fy in _PROBE_FRACTIONS for fx in _PROBE_FRACTIONS}
+            if len(probes) == 1:
+                coarse[row, col] = probes.pop()
+                continue
+            subgrid = np.array([
+                [zone_id(lat0 + (i + 0.5) * step, lon0 + (j + 0.5) * step) for j in range(SUBGRID_SIZE)]
+                for i in range(SUBGRID_SIZE)
+            ], dtype=np.int16)
+            subgrids.append(subgrid)
+            coarse[row, col] = -len(subgrids)
+        if row % 30 == 0:
+            logger.info(f"⏳ Сетка часовых поясов: широта {lat0}°, подсеток {len(subgrids)}")
+
+    zones = np.array(sorted(zone_ids, key=zone_ids.get))
+    np.savez_compressed(grid_path, coarse=coarse, subgrids=np.array(subgrids, dtype=np.int16), zones=zones)
+    logger.info(f"✅ Сетка часовых поясов сохранена: {grid_path} ({len(zones)} поясов, {len(subgrids)} подсеток)")
+    return grid_path
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_timezone_index() -> Optional[TimezoneIndex]:
+    """Общий экземпляр сетки; None, если файл сетки отсутствует"""
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                try:
+                    _index = TimezoneIndex()
+                except (OSError, KeyError, ValueError) as e:
+                    logger.warning(f"⚠️ Сетка часовых поясов недоступна ({e}), используется {DEFAULT_TIMEZONE}")
+                _index_loaded = True
+    return _index
+
+
+def timezone_at(lat: float, lon: float, default: str = DEFAULT_TIMEZONE) -> str:
+    """Часовой пояс по координатам или default, если определить не удалось"""
+    index = get_timezone_index()
+    return (index.timezone_at(lat, lon) if index else None) or default
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == 'build':
+        build_timezone_grid()
+    else:
+        print("Использование: python -m backend.timezone_index build")
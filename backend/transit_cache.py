@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, Tuple
+import logging
+
+import swisseph as swe
+
+from backend.chebyshev_ephemeris import EPHEMERIS_BACKEND, get_ephemeris
+
+logger = logging.getLogger(__name__)
+
+# Планеты, для которых рассчитываются транзиты (совпадает с AstroPredictor.planets_ml)
+TRANSIT_PLANETS = (
+    swe.SUN, swe.MOON, swe.MERCURY, swe.VENUS, swe.MARS,
+    swe.JUPITER, swe.SATURN, swe.URANUS, swe.NEPTUNE, swe.PLUTO
+)
+
+
+class TransitCache:
+    """
+    Общий для процесса кэш транзитных позиций планет. У каждого процесса пула
+    расчетов (compute_executor) свой экземпляр.
+    Ключ - (дата, время суток UT, флаги swisseph, бэкенд эфемерид), вытеснение по LRU.
+    """
+
+    def __init__(self, max_size: int = 64):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_positions(self, target_date: date, hour: float = 12.0, flags: int = swe.FLG_SWIEPH | swe.FLG_SPEED,
+                      backend: str = EPHEMERIS_BACKEND) -> Dict[int, Tuple[float, float]]:
+        """Позиции планет на дату: {planet_id: (долгота, скорость)}"""
+        key = (target_date, hour, flags, backend)
+        with self._lock:
+            positions = self._entries.get(key)
+            if positions is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return positions
+
+            self.misses += 1
+            positions = self._calculate(target_date, hour, flags, backend)
+            self._entries[key] = positions
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return positions
+
+    def _calculate(self, target_date: date, hour: float, flags: int,
+                   backend: str) -> Dict[int, Tuple[float, float]]:
+        """Один проход эфемерид для всех планет"""
+        jd = swe.julday(target_date.year, target_date.month, target_date.day, hour)
+
+        if backend == 'chebyshev':
+            ephemeris = get_ephemeris()
+            if ephemeris is not None and ephemeris.covers(jd):
+                return {
+                    planet_id: (lon, speed)
+                    for planet_id, (lon, speed) in ephemeris.positions(jd, TRANSIT_PLANETS).items()
+                }
+
+        positions = {}
+        for planet_id in TRANSIT_PLANETS:
+            pos, _ = swe.calc_ut(jd, planet_id, flags)
+            positions[planet_id] = (pos[0], pos[3])
+        return positions
+
+    def prewarm(self, start_date: date = None, days: int = 2, hour: float = 12.0,
+                flags: int = swe.FLG_SWIEPH | swe.FLG_SPEED, backend: str = EPHEMERIS_BACKEND) -> int:
+        """Предварительный расчет транзитов (по умолчанию на сегодня и завтра)"""
+        if start_date is None:
+            start_date = date.today()
+        for offset in range(days):
+            self.get_positions(start_date + timedelta(days=offset), hour, flags, backend)
+        logger.info(f"🔥 Кэш транзитов прогрет на {days} дн. начиная с {start_date}")
+        return days
+
+    def clear(self):
+        """Очистка кэша и счетчиков"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get_stats(self) -> Dict:
+        """Статистика попаданий в кэш"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# Глобальный экземпляр кэша транзитов
+transit_cache = TransitCache()
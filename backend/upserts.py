@@ -0,0 +1,113 @@
+"""
+Атомарные upsert'ы PostgreSQL: INSERT ... ON CONFLICT DO UPDATE ... RETURNING.
+
+Раньше сервисы сохраняли данные в три шага: SELECT строки в ORM, изменение
+полей, commit. Это два обращения к БД, загрузка всего JSON строки только ради
+перезаписи и гонка при двойном нажатии (оба запроса не находят строку и
+второй INSERT падает на первичном ключе). Здесь запись - один запрос:
+    - upsert / upsert_many - выражение для одной строки или пакета;
+    - upsert_row - upsert с признаком вставки (RETURNING xmax = 0);
+    - upsert_returning - то же с возвратом ORM-объекта;
+    - bulk_upsert - пакетная запись в своей транзакции для фоновых задач.
+Колонка updated_at при обновлении выставляется в now() (onupdate моделей
+для ON CONFLICT DO UPDATE не срабатывает).
+
+Сравнение с прежним способом: python -m benchmarks.bench_upserts
+"""
+from typing import Dict, Iterable, List, Sequence, Tuple
+import logging
+
+from sqlalchemy import Boolean, func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.database import async_session
+
+logger = logging.getLogger(__name__)
+
+# Предел параметров одного запроса asyncpg
+MAX_QUERY_PARAMETERS = 32767
+
+# Признак вставки новой строки в RETURNING: у только что вставленной версии строки xmax = 0
+INSERTED = literal_column('xmax = 0', Boolean).label('inserted')
+
+
+def _conflict_columns(model, index_elements: Sequence[str] = None) -> List[str]:
+    return list(index_elements or [column.name for column in model.__table__.primary_key.columns])
+
+
+def _on_conflict(model, statement, columns: Iterable[str], index_elements: Sequence[str] = None,
+                 update_columns: Iterable[str] = None):
+    index_elements = _conflict_columns(model, index_elements)
+    if update_columns is None:
+        update_columns = [name for name in columns if name not in index_elements]
+
+    set_ = {name: statement.excluded[name] for name in update_columns}
+    if set_ and 'updated_at' in model.__table__.c and 'updated_at' not in set_:
+        set_['updated_at'] = func.now()
+    if not set_:
+        return statement.on_conflict_do_nothing(index_elements=index_elements)
+    return statement.on_conflict_do_update(index_elements=index_elements, set_=set_)
+
+
+def upsert(model, values: Dict, index_elements: Sequence[str] = None, update_columns: Iterable[str] = None):
+    """
+    INSERT ... ON CONFLICT DO UPDATE для одной строки.
+
+    Args:
+        model: ORM-модель
+        values: значения колонок
+        index_elements: колонки конфликта (по умолчанию - первичный ключ)
+        update_columns: колонки, обновляемые при конфликте (по умолчанию - все
+            переданные, кроме колонок конфликта); остальные задаются только при вставке
+    """
+    # values(**values), а не values([values]): такое выражение попадает в кэш компиляции SQLAlchemy
+    return _on_conflict(model, insert(model).values(**values), values, index_elements, update_columns)
+
+
+def upsert_many(model, rows: Sequence[Dict], index_elements: Sequence[str] = None,
+                update_columns: Iterable[str] = None):
+    """Многострочный INSERT ... ON CONFLICT DO UPDATE для строк с одинаковым набором ключей (см. upsert)"""
+    return _on_conflict(model, insert(model).values(list(rows)), rows[0], index_elements, update_columns)
+
+
+async def upsert_row(session, model, values: Dict, index_elements: Sequence[str] = None,
+                     update_columns: Iterable[str] = None) -> bool:
+    """Upsert одной строки в сессии; True - строка вставлена, False - обновлена"""
+    result = await session.execute(upsert(model, values, index_elements, update_columns).returning(INSERTED))
+    return result.scalar_one()
+
+
+async def upsert_returning(session, model, values: Dict, index_elements: Sequence[str] = None,
+                           update_columns: Iterable[str] = None) -> Tuple[object, bool]:
+    """
+    Upsert одной строки в сессии с возвратом записанного ORM-объекта
+    (загрузка объекта дороже upsert_row - только если объект нужен вызывающему).
+
+    Returns:
+        (объект модели, True - строка вставлена / False - обновлена)
+    """
+    statement = upsert(model, values, index_elements, update_columns).returning(model, INSERTED)
+    result = await session.execute(statement, execution_options={'populate_existing': True})
+    instance, inserted = result.one()
+    return instance, inserted
+
+
+async def bulk_upsert(model, rows: Sequence[Dict], index_elements: Sequence[str] = None,
+                      update_columns: Iterable[str] = None, batch_size: int = 1000) -> int:
+    """
+    Пакетный upsert в одной транзакции: по batch_size строк на запрос
+    (не больше предела параметров asyncpg).
+
+    Returns:
+        Количество записанных строк
+    """
+    if not rows:
+        return 0
+    batch_size = max(1, min(batch_size, MAX_QUERY_PARAMETERS // len(rows[0])))
+    async with async_session() as session:
+        async with session.begin():
+            for offset in range(0, len(rows), batch_size):
+                await session.execute(upsert_many(model, rows[offset:offset + batch_size], index_elements,
+                                                  update_columns))
+    logger.info(f"💾 {model.__tablename__}: записано {len(rows)} строк пакетами по {batch_size}")
+    return len(rows)
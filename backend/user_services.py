@@ -1,7 +1,12 @@
 from backend.database import async_session, User
+from backend.upserts import upsert_returning
+from backend.request_counters import request_counters
+from backend.request_context import RequestContext, request_session
+from backend.data_status import data_status_cache
+from backend import user_statistics
 from sqlalchemy.future import select
-from sqlalchemy import func  # ← ДОБАВИТЬ ЭТОТ ИМПОРТ
-from datetime import datetime  # ← ДОБАВИТЬ ДЛЯ calculated_at
+from sqlalchemy import update
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,63 +22,54 @@ async def create_or_update_user(
         current_city: str = None,
         gender: str = None
 ):
-    """Создание или обновление пользователя"""
+    """Создание или обновление пользователя (один атомарный upsert)"""
     try:
+        values = {
+            'telegram_id': telegram_id,
+            'birth_date': birth_date,
+            'birth_time': birth_time,
+            'birth_city': birth_city,
+            'request_count': 0
+        }
+        # Необязательные поля перезаписываются, только если переданы
+        optional = {'profession': profession, 'job_position': job_position, 'current_city': current_city}
+        values.update({name: value for name, value in optional.items() if value})
+        if gender is not None:
+            values['gender'] = gender
+
         async with async_session() as session:
-            result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
+            user, inserted = await upsert_returning(
+                session, User, values,
+                update_columns=[name for name in values if name not in ('telegram_id', 'request_count')]
             )
-            user = result.scalar_one_or_none()
-
-            if user:
-                # Обновляем существующего пользователя
-                user.birth_date = birth_date
-                user.birth_time = birth_time
-                user.birth_city = birth_city
-                if profession:
-                    user.profession = profession
-                if job_position:
-                    user.job_position = job_position
-                if current_city:
-                    user.current_city = current_city
-                if gender is not None:
-                    user.gender = gender
-                logger.info(f"📝 Обновлен пользователь {telegram_id}")
-            else:
-                # Создаем нового пользователя
-                user = User(
-                    telegram_id=telegram_id,
-                    birth_date=birth_date,
-                    birth_time=birth_time,
-                    birth_city=birth_city,
-                    profession=profession,
-                    job_position=job_position,
-                    current_city=current_city,
-                    gender=gender,
-                    request_count=0
-                )
-                session.add(user)
-                logger.info(f"🆕 Создан новый пользователь {telegram_id}")
-
             await session.commit()
-            return user
+
+        if inserted:
+            data_status_cache.invalidate(telegram_id)
+            logger.info(f"🆕 Создан новый пользователь {telegram_id}")
+        else:
+            logger.info(f"📝 Обновлен пользователь {telegram_id}")
+        return user
 
     except Exception as e:
         logger.error(f"❌ Ошибка при работе с пользователем {telegram_id}: {e}")
         raise
 
 
-async def get_user_profile(telegram_id: int):
-    """Получение профиля пользователя"""
+async def get_user_profile(telegram_id: int, ctx: Optional[RequestContext] = None):
+    """Получение профиля пользователя (с контекстом обновления - не более одного запроса на обновление)"""
+    if ctx is not None and ctx.profile_loaded:
+        return ctx.profile
     try:
-        async with async_session() as session:
+        async with request_session(ctx) as session:
             result = await session.execute(
                 select(User).where(User.telegram_id == telegram_id)
             )
             user = result.scalar_one_or_none()
 
+            profile = None
             if user:
-                return {
+                profile = {
                     'telegram_id': user.telegram_id,
                     'birth_date': user.birth_date,
                     'birth_time': user.birth_time,
@@ -82,10 +78,12 @@ async def get_user_profile(telegram_id: int):
                     'job_position': user.job_position,
                     'current_city': user.current_city,
                     'gender': user.gender,
-                    'request_count': user.request_count or 0,
+                    'request_count': (user.request_count or 0) + request_counters.pending(telegram_id),
                     'created_at': user.created_at
                 }
-            return None
+            if ctx is not None:
+                ctx.profile = profile
+            return profile
 
     except Exception as e:
         logger.error(f"❌ Ошибка при получении профиля {telegram_id}: {e}")
@@ -95,21 +93,21 @@ async def get_user_profile(telegram_id: int):
 async def update_user_profession(telegram_id: int, profession: str, job_position: str = None):
     """Обновление профессиональных данных пользователя"""
     try:
+        values = {'profession': profession}
+        if job_position:
+            values['job_position'] = job_position
         async with async_session() as session:
             result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
+                update(User).where(User.telegram_id == telegram_id).values(**values).returning(User),
+                execution_options={'populate_existing': True}
             )
             user = result.scalar_one_or_none()
-
-            if user:
-                user.profession = profession
-                if job_position:
-                    user.job_position = job_position
-                await session.commit()
-                logger.info(f"📝 Обновлены профессиональные данные для {telegram_id}")
-                return user
-            else:
+            if user is None:
                 raise ValueError("Пользователь не найден")
+            await session.commit()
+
+        logger.info(f"📝 Обновлены профессиональные данные для {telegram_id}")
+        return user
 
     except Exception as e:
         logger.error(f"❌ Ошибка при обновлении профессии {telegram_id}: {e}")
@@ -117,42 +115,27 @@ async def update_user_profession(telegram_id: int, profession: str, job_position
 
 
 async def increment_request_count(telegram_id: int):
-    """Увеличивает счетчик обращений пользователя"""
-    try:
-        async with async_session() as session:
-            result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
-            )
-            user = result.scalar_one_or_none()
-
-            if user:
-                current_count = user.request_count or 0
-                user.request_count = current_count + 1
-                await session.commit()
-                logger.info(f"📈 Увеличен счетчик обращений для {telegram_id}: {current_count} -> {user.request_count}")
-                return user.request_count
-            else:
-                logger.warning(f"⚠️ Пользователь {telegram_id} не найден при увеличении счетчика")
-                return None
-
-    except Exception as e:
-        logger.error(f"❌ Ошибка при увеличении счетчика обращений {telegram_id}: {e}")
-        return None
+    """
+    Учет обращения пользователя. Счетчик увеличивается в буфере процесса и
+    записывается в БД пакетно (backend/request_counters.py).
+    """
+    request_counters.increment(telegram_id)
+    logger.info(f"📈 Обращение {telegram_id} учтено, ожидают записи: {request_counters.pending(telegram_id)}")
 
 
 async def get_user_request_count(telegram_id: int):
-    """Получение текущего количества обращений пользователя"""
+    """Получение текущего количества обращений пользователя (сохраненные + еще не записанные)"""
     try:
         async with async_session() as session:
             result = await session.execute(
                 select(User.request_count).where(User.telegram_id == telegram_id)
             )
             count = result.scalar_one_or_none()
-            return count or 0
+            return (count or 0) + request_counters.pending(telegram_id)
 
     except Exception as e:
         logger.error(f"❌ Ошибка при получении счетчика обращений {telegram_id}: {e}")
-        return 0
+        return request_counters.pending(telegram_id)
 
 
 async def update_user_gender(telegram_id: int, gender: str):
@@ -160,52 +143,26 @@ async def update_user_gender(telegram_id: int, gender: str):
     try:
         async with async_session() as session:
             result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
+                update(User).where(User.telegram_id == telegram_id).values(gender=gender).returning(User),
+                execution_options={'populate_existing': True}
             )
             user = result.scalar_one_or_none()
-
-            if user:
-                user.gender = gender
-                await session.commit()
-                logger.info(f"📝 Обновлен пол пользователя {telegram_id}: {gender}")
-                return user
-            else:
+            if user is None:
                 raise ValueError("Пользователь не найден")
+            await session.commit()
+
+        logger.info(f"📝 Обновлен пол пользователя {telegram_id}: {gender}")
+        return user
 
     except Exception as e:
         logger.error(f"❌ Ошибка при обновлении пола {telegram_id}: {e}")
         raise
 
 
-async def get_users_statistics():
-    """Получение общей статистики пользователей"""
+async def get_users_statistics(exact: bool = False):
+    """Получение общей статистики пользователей (счетчики или один агрегирующий запрос)"""
     try:
-        async with async_session() as session:
-            # Общее количество пользователей
-            total_users_result = await session.execute(
-                select(User).where(User.telegram_id.isnot(None))
-            )
-            total_users = len(total_users_result.scalars().all())
-
-            # Пользователи с заполненным полом
-            users_with_gender_result = await session.execute(
-                select(User).where(User.gender.isnot(None))
-            )
-            users_with_gender = len(users_with_gender_result.scalars().all())
-
-            # Среднее количество обращений
-            avg_requests_result = await session.execute(
-                select(func.avg(User.request_count)).where(User.request_count > 0)
-            )
-            avg_requests = avg_requests_result.scalar() or 0
-
-            return {
-                'total_users': total_users,
-                'users_with_gender': users_with_gender,
-                'gender_fill_rate': round((users_with_gender / total_users * 100) if total_users > 0 else 0, 2),
-                'average_requests': round(avg_requests, 2),
-                'calculated_at': datetime.now().isoformat()
-            }
+        return await user_statistics.get_users_statistics(exact)
 
     except Exception as e:
         logger.error(f"❌ Ошибка при получении статистики пользователей: {e}")
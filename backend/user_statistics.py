@@ -0,0 +1,90 @@
+"""
+Статистика пользователей без загрузки строк users.
+
+Два источника с одинаковым результатом:
+    - счетчики user_stats_counters, которые поддерживают триггеры на users
+      (db_user_statistics.sql): чтение - сумма 16 строк, не зависит от числа
+      пользователей;
+    - один агрегирующий запрос COUNT/AVG ... FILTER по users - точный расчет,
+      если счетчики не установлены или нужна сверка.
+
+Сравнение с прежним способом: python -m benchmarks.bench_user_statistics
+"""
+from datetime import datetime
+from typing import Dict, Optional
+import logging
+
+from sqlalchemy import func
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.future import select
+
+from backend.database import async_session, User, UserStatsCounter
+
+logger = logging.getLogger(__name__)
+
+
+def _statistics(total_users: int, users_with_gender: int, average_requests: float, source: str) -> Dict:
+    return {
+        'total_users': total_users,
+        'users_with_gender': users_with_gender,
+        'gender_fill_rate': round((users_with_gender / total_users * 100) if total_users > 0 else 0, 2),
+        'average_requests': round(average_requests, 2),
+        'source': source,
+        'calculated_at': datetime.now().isoformat()
+    }
+
+
+async def aggregate_user_statistics() -> Dict:
+    """Точная статистика одним запросом COUNT/AVG ... FILTER по users"""
+    async with async_session() as session:
+        result = await session.execute(
+            select(
+                func.count().label('total_users'),
+                func.count().filter(User.gender.isnot(None)).label('users_with_gender'),
+                func.avg(User.request_count).filter(User.request_count > 0).label('average_requests')
+            ).select_from(User)
+        )
+        row = result.one()
+    return _statistics(row.total_users, row.users_with_gender, float(row.average_requests or 0), 'aggregate')
+
+
+async def counter_user_statistics() -> Optional[Dict]:
+    """
+    Статистика из счетчиков user_stats_counters; None, если счетчики не
+    установлены (нет таблицы или она не заполнена скриптом db_user_statistics.sql)
+    """
+    try:
+        async with async_session() as session:
+            result = await session.execute(
+                select(
+                    func.count().label('shards'),
+                    func.sum(UserStatsCounter.total_users).label('total_users'),
+                    func.sum(UserStatsCounter.users_with_gender).label('users_with_gender'),
+                    func.sum(UserStatsCounter.active_users).label('active_users'),
+                    func.sum(UserStatsCounter.total_requests).label('total_requests')
+                )
+            )
+            row = result.one()
+    except ProgrammingError as e:
+        # Таблицы нет (UndefinedTable) - считаем, что счетчики не установлены
+        logger.warning(f"⚠️ Счетчики статистики недоступны: {e.orig}")
+        return None
+    if not row.shards:
+        return None
+    average_requests = row.total_requests / row.active_users if row.active_users else 0.0
+    return _statistics(int(row.total_users), int(row.users_with_gender), float(average_requests), 'counters')
+
+
+async def get_users_statistics(exact: bool = False) -> Dict:
+    """
+    Общая статистика пользователей.
+
+    Args:
+        exact: считать по users, а не по счетчикам
+    """
+    if not exact:
+        statistics = await counter_user_statistics()
+        if statistics is not None:
+            return statistics
+        logger.info("ℹ️ Счетчики статистики не установлены (db_user_statistics.sql), считаем по users")
+    return await aggregate_user_statistics()
@@ -0,0 +1,64 @@
+"""
+Пакетный расчет транзитных аспектов для всех пользователей одной даты.
+
+Генерирует N синтетических натальных карт, сверяет результат пакетного
+расчета с AstroPredictor.generate_prediction на выборке и замеряет время.
+
+Запуск:
+    python -m benchmarks.bench_batch_transits [N]
+"""
+import random
+import sys
+import time
+from datetime import date
+
+from backend.predictions import (
+    AstroPredictor, TRANSIT_PLANET_NAMES, natal_longitude_matrix,
+    batch_transit_aspects, batch_aspects_to_dicts
+)
+
+
+def _random_chart(rng: random.Random) -> dict:
+    planets = {name: {'longitude': round(rng.uniform(0, 360), 6), 'sign': '', 'position_in_sign': 0.0}
+               for name in TRANSIT_PLANET_NAMES + ('North_Node',)}
+    return {
+        'planets': planets,
+        'angles': {'ascendant': {'longitude': round(rng.uniform(0, 360), 6), 'sign': ''}}
+    }
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(0)
+    charts = [_random_chart(rng) for _ in range(users)]
+    target_date = date.today()
+    transits = AstroPredictor({}).calculate_transits(target_date)
+
+    started = time.perf_counter()
+    matrix = natal_longitude_matrix(charts)
+    matrix_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    records = batch_transit_aspects(matrix, transits)
+    batch_seconds = time.perf_counter() - started
+
+    sample = range(0, users, max(1, users // 200))
+    per_user = batch_aspects_to_dicts(records, users)
+    for index in sample:
+        expected = AstroPredictor(charts[index]).generate_prediction(target_date)['aspects']
+        assert per_user[index] == expected, f"Расхождение для пользователя {index}"
+
+    started = time.perf_counter()
+    for index in sample:
+        AstroPredictor(charts[index]).generate_prediction(target_date)
+    per_user_seconds = (time.perf_counter() - started) / len(sample)
+
+    print(f"Пользователей: {users}, аспектов: {len(records)}")
+    print(f"Матрица натальных долгот:  {matrix_seconds:8.3f} с")
+    print(f"Пакетный расчет аспектов:  {batch_seconds:8.3f} с")
+    print(f"Поштучный расчет (оценка): {per_user_seconds * users:8.3f} с")
+    print(f"Сверка с generate_prediction: {len(sample)} пользователей совпали")
+
+
+if __name__ == '__main__':
+    main()
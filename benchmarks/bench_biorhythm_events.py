@@ -0,0 +1,70 @@
+"""
+Поиск ближайших критических и пиковых дней без перебора по дням.
+
+Сверяет find_upcoming_events с посуточным перебором calculate_biorhythms
+на выборке и замеряет пакетный поиск на год вперед для всех пользователей.
+
+Запуск:
+    python -m benchmarks.bench_biorhythm_events [число_пользователей]
+"""
+import logging
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from backend.biorhythm_calculator import BiorhythmCalculator, CYCLE_LABELS, EVENT_CYCLES
+
+
+def scan_events(calculator: BiorhythmCalculator, birth_date: date, start_date: date, horizon_days: int, limit: int):
+    """Эталон: посуточный перебор с теми же порогами, что в calculate_biorhythms"""
+    events = {'critical_days': {name: [] for name in EVENT_CYCLES}, 'peak_days': {name: [] for name in EVENT_CYCLES},
+              'critical_coincidences': [], 'peak_coincidences': []}
+    for day in range(horizon_days):
+        current = start_date + timedelta(days=day)
+        cycles = calculator.calculate_biorhythms(birth_date, current)['cycles']
+        hits = {
+            'critical': [name for name in EVENT_CYCLES if abs(cycles[name]['value']) > 0.9],
+            'peak': [name for name in EVENT_CYCLES if cycles[name]['value'] > 0.8]
+        }
+        for kind, names in hits.items():
+            for name in names:
+                if len(events[f'{kind}_days'][name]) < limit:
+                    events[f'{kind}_days'][name].append(current.isoformat())
+            if len(names) >= 2 and len(events[f'{kind}_coincidences']) < limit:
+                events[f'{kind}_coincidences'].append(
+                    {'date': current.isoformat(), 'cycles': [CYCLE_LABELS[name] for name in names]})
+    return events
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logging.disable(logging.INFO)
+    rng = random.Random(0)
+    birth_dates = [date(1940, 1, 1) + timedelta(days=rng.randrange(30000)) for _ in range(users)]
+    start_date = date.today()
+    calculator = BiorhythmCalculator()
+
+    checked = 0
+    for user_index in range(0, users, max(1, users // 50)):
+        for horizon_days, limit in ((30, 3), (365, 10)):
+            expected = scan_events(calculator, birth_dates[user_index], start_date, horizon_days, limit)
+            actual = calculator.find_upcoming_events(birth_dates[user_index], start_date, horizon_days, limit)
+            assert {key: actual[key] for key in expected} == expected, birth_dates[user_index]
+        checked += 1
+    print(f"Сверка с посуточным перебором: {checked} пользователей совпали")
+
+    for horizon_days, limit in ((30, 3), (365, 10)):
+        started = time.perf_counter()
+        calculator.find_upcoming_events_batch(birth_dates, start_date, horizon_days, limit)
+        elapsed = time.perf_counter() - started
+        print(f"{users} пользователей, горизонт {horizon_days} дней, до {limit} событий: {elapsed * 1e3:8.1f} мс")
+
+    started = time.perf_counter()
+    calculator.calculate_range(birth_dates[:users // 10], start_date, 365)
+    print(f"Для сравнения calculate_range на год (оценка для всех): "
+          f"{(time.perf_counter() - started) * 10:8.1f} с без поиска событий")
+
+
+if __name__ == '__main__':
+    main()
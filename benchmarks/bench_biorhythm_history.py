@@ -0,0 +1,113 @@
+"""
+Запись истории биоритмов: JSON-строки против типизированной таблицы через COPY.
+
+Создает временных пользователей, пишет одинаковый объем пользователе-дней
+    1. прежним способом - INSERT JSON-результата calculate_biorhythms на строку
+       (во временную таблицу той же формы, что biorhythms, но с ключом по дате);
+    2. write_biorhythm_history - calculate_range + COPY в biorhythm_history,
+проверяет чтение диапазона по первичному ключу и удаляет временных пользователей.
+Нужна рабочая БД из DATABASE_URL с таблицей biorhythm_history.
+
+Запуск:
+    python -m benchmarks.bench_biorhythm_history [пользователе_дней]
+"""
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from datetime import date, time as dt_time, timedelta
+
+from backend.biorhythm_calculator import BiorhythmCalculator
+from backend.biorhythm_history import read_biorhythm_history, write_biorhythm_history
+from backend.database import async_engine
+
+FIRST_TELEGRAM_ID = 9_000_000_000
+DAYS = 365
+
+
+async def main():
+    user_days = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    logging.disable(logging.INFO)
+    async_engine.echo = False
+    users_count = max(1, user_days // DAYS)
+    rng = random.Random(0)
+    users = [(FIRST_TELEGRAM_ID + i, date(1940, 1, 1) + timedelta(days=rng.randrange(30000)))
+             for i in range(users_count)]
+    start_date = date.today()
+    calculator = BiorhythmCalculator()
+
+    async with async_engine.connect() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id >= $1", FIRST_TELEGRAM_ID)
+        await driver_connection.copy_records_to_table(
+            'users', columns=('telegram_id', 'birth_date', 'birth_time', 'birth_city'),
+            records=[(telegram_id, birth_date, dt_time(12, 0), 'Москва') for telegram_id, birth_date in users]
+        )
+        await driver_connection.execute(
+            "CREATE TEMP TABLE bench_biorhythms_json (telegram_id BIGINT, calculation_date DATE, "
+            "biorhythm_data JSONB NOT NULL, PRIMARY KEY (telegram_id, calculation_date))"
+        )
+
+        # 1. JSON: расчет по дню и INSERT строки на пользователя-день
+        started = time.perf_counter()
+        insert_time = 0.0
+        for offset in range(0, users_count, 100):
+            rows = []
+            for telegram_id, birth_date in users[offset:offset + 100]:
+                for day in range(DAYS):
+                    target_date = start_date + timedelta(days=day)
+                    rows.append((telegram_id, target_date,
+                                 json.dumps(calculator.calculate_biorhythms(birth_date, target_date))))
+            insert_started = time.perf_counter()
+            await driver_connection.executemany(
+                "INSERT INTO bench_biorhythms_json VALUES ($1, $2, $3::jsonb)", rows)
+            insert_time += time.perf_counter() - insert_started
+        json_total = time.perf_counter() - started
+        json_size = await driver_connection.fetchval("SELECT pg_total_relation_size('bench_biorhythms_json')")
+        await conn.commit()
+
+    # 2. COPY в типизированную секционированную таблицу
+    started = time.perf_counter()
+    written = await write_biorhythm_history(users, start_date, DAYS)
+    copy_total = time.perf_counter() - started
+
+    async with async_engine.connect() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        copy_size = await driver_connection.fetchval(
+            "SELECT sum(pg_total_relation_size(inhrelid)) FROM pg_inherits "
+            "WHERE inhparent = 'biorhythm_history'::regclass")
+        plan = await driver_connection.fetch(
+            "EXPLAIN SELECT * FROM biorhythm_history WHERE telegram_id = $1 "
+            "AND calculation_date BETWEEN $2 AND $3", users[0][0], start_date, start_date + timedelta(days=6))
+
+    rows = users_count * DAYS
+    print(f"{users_count} пользователей x {DAYS} дней = {rows} строк")
+    print(f"JSON INSERT:  {json_total:7.1f} с всего, из них запись {insert_time:6.1f} с, "
+          f"{json_size / 2 ** 20:7.1f} МБ")
+    print(f"COPY:         {copy_total:7.1f} с всего (расчет + запись), {copy_size / 2 ** 20:7.1f} МБ, "
+          f"{written} строк")
+    print(f"Ускорение записи с расчетом: x{json_total / copy_total:.1f}")
+
+    # Чтение недели совпадает с прогнозом калькулятора
+    started = time.perf_counter()
+    history = await read_biorhythm_history(users[0][0], start_date, start_date + timedelta(days=6))
+    read_time = time.perf_counter() - started
+    forecast = calculator.calculate_weekly_forecast(users[0][1], start_date, 7)
+    for day, expected in zip(history, forecast):
+        assert {key: day[key] for key in expected} == expected, (day, expected)
+    assert len(history) == 7
+    print(f"Чтение недели: {read_time * 1e3:.1f} мс, совпадает с calculate_weekly_forecast")
+    print("План чтения:")
+    for line in plan:
+        print(f"    {line[0]}")
+
+    async with async_engine.begin() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id >= $1", FIRST_TELEGRAM_ID)
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
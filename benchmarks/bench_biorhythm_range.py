@@ -0,0 +1,54 @@
+"""
+Векторизованный расчет биоритмов для всех пользователей на месяц и год.
+
+Сверяет calculate_range с calculate_biorhythms на выборке и сравнивает
+время с поштучным расчетом.
+
+Запуск:
+    python -m benchmarks.bench_biorhythm_range [число_пользователей]
+"""
+import logging
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from backend.biorhythm_calculator import BiorhythmCalculator, CYCLE_NAMES
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    logging.disable(logging.INFO)
+    rng = random.Random(0)
+    birth_dates = [date(1940, 1, 1) + timedelta(days=rng.randrange(30000)) for _ in range(users)]
+    start_date = date.today()
+    calculator = BiorhythmCalculator()
+
+    for days in (30, 365):
+        started = time.perf_counter()
+        range_data = calculator.calculate_range(birth_dates, start_date, days)
+        elapsed = time.perf_counter() - started
+        print(f"{users} пользователей x {days} дней: {elapsed * 1e3:8.1f} мс "
+              f"({elapsed / (users * days) * 1e9:.0f} нс на пользователя-день)")
+
+    sample = range(0, users, max(1, users // 100))
+    for user_index in sample:
+        for day in (0, days // 2, days - 1):
+            expected = calculator.calculate_biorhythms(birth_dates[user_index], start_date + timedelta(days=day))
+            for cycle_index, name in enumerate(CYCLE_NAMES):
+                cycle = expected['cycles'][name]
+                assert range_data['value'][user_index, day, cycle_index] == cycle['value']
+                assert range_data['percentage'][user_index, day, cycle_index] == cycle['percentage']
+            assert range_data['overall_percentage'][user_index, day] == expected['overall_energy']['percentage']
+
+    started = time.perf_counter()
+    for user_index in sample:
+        for day in range(30):
+            calculator.calculate_biorhythms(birth_dates[user_index], start_date + timedelta(days=day))
+    per_user_day = (time.perf_counter() - started) / (len(sample) * 30)
+    print(f"Поштучный расчет (оценка): {per_user_day * users * 365:8.1f} с на год для всех пользователей")
+    print(f"Сверка с calculate_biorhythms: {len(sample)} пользователей совпали")
+
+
+if __name__ == '__main__':
+    main()
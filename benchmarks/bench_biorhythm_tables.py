@@ -0,0 +1,40 @@
+"""
+Микро-бенчмарк таблиц фаз биоритмов.
+
+Сравнивает прежний расчет четырех циклов через тригонометрию (_calculate_cycle)
+с выборкой из CYCLE_TABLES и замеряет полный вызов calculate_biorhythms.
+
+Запуск:
+    python -m benchmarks.bench_biorhythm_tables [число_вызовов]
+"""
+import logging
+import sys
+import timeit
+from datetime import date
+
+from backend.biorhythm_calculator import BiorhythmCalculator, CYCLE_PERIODS
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    logging.disable(logging.INFO)
+    calculator = BiorhythmCalculator()
+    birth_date, target_date = date(1990, 5, 1), date.today()
+    days_lived = (target_date - birth_date).days
+
+    for period in CYCLE_PERIODS:
+        for residue in range(period):
+            assert calculator._calculate_cycle(days_lived - days_lived % period + residue, period) == \
+                calculator._lookup_cycle(residue, period)
+
+    trig = timeit.timeit(lambda: [calculator._calculate_cycle(days_lived, p) for p in CYCLE_PERIODS], number=calls)
+    table = timeit.timeit(lambda: [calculator._lookup_cycle(days_lived, p) for p in CYCLE_PERIODS], number=calls)
+    full = timeit.timeit(lambda: calculator.calculate_biorhythms(birth_date, target_date), number=calls // 10)
+
+    print(f"Четыре цикла через sin/cos:      {trig / calls * 1e6:6.2f} мкс")
+    print(f"Четыре цикла из таблиц:          {table / calls * 1e6:6.2f} мкс  (x{trig / table:.1f})")
+    print(f"calculate_biorhythms целиком:    {full / (calls // 10) * 1e6:6.2f} мкс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Статус данных пользователя: четыре запроса против маски полноты.
+
+Для тестового пользователя на каждом этапе сбора данных (нет данных ->
+профиль -> натальная карта -> психоматрица) сравнивает
+    1. прежнюю проверку - профиль, натальная карта, психоматрица и биоритмы
+       четырьмя сессиями, биоритмы рассчитываются;
+    2. get_data_status_mask без кэша - один запрос EXISTS;
+    3. get_data_status_mask из кэша процесса;
+проверяет совпадение статусов, сброс кэша при создании данных и отсутствие
+расчетов и записи при проверке статуса. Нужна рабочая БД из DATABASE_URL.
+
+Запуск:
+    python -m benchmarks.bench_data_status [число_повторов]
+"""
+import asyncio
+import logging
+import sys
+import time
+from datetime import date, datetime, time as dt_time
+
+from sqlalchemy import event
+
+from backend.biorhythm_cache import biorhythm_cache
+from backend.biorhythm_services import get_user_biorhythms
+from backend.chart_services import create_and_save_natal_chart, get_user_natal_chart
+from backend.data_status import data_status_cache, get_data_status_mask, status_from_mask
+from backend.database import async_engine
+from backend.matrix_services import calculate_and_save_psyho_matrix, get_user_matrix
+from backend.user_services import create_or_update_user, get_user_profile
+
+TELEGRAM_ID = 9_000_000_002
+
+statements = []
+
+
+@event.listens_for(async_engine.sync_engine, 'before_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+async def four_queries_status():
+    """Прежний PersonalAssistant.get_user_data_status"""
+    user_profile = await get_user_profile(TELEGRAM_ID)
+    natal_chart = await get_user_natal_chart(TELEGRAM_ID)
+    psyho_matrix = await get_user_matrix(TELEGRAM_ID)
+    biorhythms = await get_user_biorhythms(TELEGRAM_ID)
+    return (user_profile is not None, natal_chart is not None, psyho_matrix is not None,
+            biorhythms is not None)
+
+
+async def uncached_mask():
+    data_status_cache.clear()
+    return await get_data_status_mask(TELEGRAM_ID)
+
+
+async def timed(scenario, repeats: int):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        result = await scenario()
+    return result, (time.perf_counter() - started) / repeats * 1e3
+
+
+def comparable(mask: int):
+    status = status_from_mask(mask)
+    return status['has_basic_data'], status['has_natal_chart'], status['has_psyho_matrix'], status['has_biorhythms']
+
+
+async def check_stage(title: str, repeats: int):
+    old_status, old_ms = await timed(four_queries_status, repeats)
+    mask, uncached_ms = await timed(uncached_mask, repeats)
+
+    # Проверка статуса из кэша: ни запросов, ни расчета биоритмов
+    statements.clear()
+    biorhythm_misses = biorhythm_cache.misses
+    cached, cached_ms = await timed(lambda: get_data_status_mask(TELEGRAM_ID), repeats)
+    assert not statements and biorhythm_cache.misses == biorhythm_misses
+
+    assert old_status == comparable(mask) == comparable(cached), (old_status, mask, cached)
+    print(f"{title:22} маска {mask:2d} | 4 запроса {old_ms:6.2f} мс | EXISTS {uncached_ms:6.2f} мс | "
+          f"кэш {cached_ms * 1e3:6.1f} мкс")
+
+
+async def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    logging.disable(logging.INFO)
+    async_engine.echo = False
+
+    async with async_engine.begin() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id = $1", TELEGRAM_ID)
+
+    # Без кэша проверка статуса - один запрос только на чтение
+    data_status_cache.clear()
+    statements.clear()
+    await get_data_status_mask(TELEGRAM_ID)
+    assert len(statements) == 1 and statements[0].lstrip().upper().startswith('SELECT'), statements
+
+    print(f"Статус данных, {repeats} повторов")
+    await check_stage('Нет данных', repeats)
+    # Каждый этап создает данные, сброс кэша виден сразу без ожидания DATA_STATUS_CACHE_TTL
+    await get_data_status_mask(TELEGRAM_ID)
+    await create_or_update_user(TELEGRAM_ID, date(1990, 5, 1), dt_time(12, 0), 'Москва')
+    await check_stage('Профиль', repeats)
+    await create_and_save_natal_chart(TELEGRAM_ID, 'Москва', datetime(1990, 5, 1, 12, 0))
+    await check_stage('Натальная карта', repeats)
+    await calculate_and_save_psyho_matrix(TELEGRAM_ID)
+    await check_stage('Все данные', repeats)
+    print(f"Кэш статусов: {data_status_cache.get_stats()}")
+
+    async with async_engine.begin() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id = $1", TELEGRAM_ID)
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
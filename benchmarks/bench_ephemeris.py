@@ -0,0 +1,61 @@
+"""
+Сравнение бэкендов эфемерид: swisseph и сегменты Чебышёва.
+
+Запуск (после python -m backend.chebyshev_ephemeris build):
+    python -m benchmarks.bench_ephemeris
+"""
+import time
+
+import numpy as np
+import swisseph as swe
+
+from backend.chebyshev_ephemeris import ChebyshevEphemeris, FIT_FLAGS
+from backend.natal_chart import configure_ephemeris
+from backend.transit_cache import TRANSIT_PLANETS
+
+
+def _best_of(func, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    configure_ephemeris()
+    ephemeris = ChebyshevEphemeris()
+    jd_one = swe.julday(2026, 10, 18, 12.0)
+    jd_many = jd_one + np.arange(1000, dtype=np.float64)
+
+    def swisseph_dates(jds):
+        for jd in jds:
+            for planet_id in TRANSIT_PLANETS:
+                swe.calc_ut(float(jd), planet_id, FIT_FLAGS)
+
+    def chebyshev_dates(jds):
+        ephemeris.positions(jds, TRANSIT_PLANETS)
+
+    def chebyshev_one_date():
+        ephemeris.positions(jd_one, TRANSIT_PLANETS)
+
+    ephemeris.positions(jd_many, TRANSIT_PLANETS)  # прогрев memory-map
+
+    # swisseph кэширует последний момент, поэтому для одной даты берем каждый раз новую
+    jd_fresh = iter(jd_one + 0.37 * np.arange(1, 100))
+
+    results = {
+        'swisseph, 1 дата': _best_of(lambda: swisseph_dates([next(jd_fresh)])),
+        'chebyshev, 1 дата': _best_of(chebyshev_one_date),
+        'swisseph, 1000 дат': _best_of(lambda: swisseph_dates(jd_many)),
+        'chebyshev, 1000 дат': _best_of(lambda: chebyshev_dates(jd_many)),
+    }
+
+    print(f"Планет на дату: {len(TRANSIT_PLANETS)}")
+    for name, seconds in results.items():
+        print(f"{name:22s} {seconds * 1e3:10.3f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Задержка цикла событий при параллельных расчетах натальных карт.
+
+Фоновая корутина каждые 5 мс замеряет, насколько позже она просыпается.
+Сравниваются синхронный расчет прямо в цикле событий и пул процессов.
+
+Запуск:
+    python -m benchmarks.bench_event_loop [число_карт]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+
+from backend.compute_executor import ComputeExecutor
+from backend.natal_chart import MLNatalChartCalculator
+
+TICK = 0.005
+
+
+async def _measure_lag(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started - TICK)
+
+
+async def _run_scenario(name: str, jobs) -> None:
+    stop = asyncio.Event()
+    lags = []
+    monitor = asyncio.create_task(_measure_lag(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*jobs)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+    print(f"{name:10s} всего {elapsed:7.3f} с | задержка цикла: "
+          f"макс {max(lags, default=0) * 1e3:8.2f} мс, p99 {p99 * 1e3:8.2f} мс")
+
+
+async def main():
+    charts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    births = [datetime(1950, 1, 1, 12, 0) + timedelta(days=37 * i, minutes=13 * i) for i in range(charts)]
+    calculator = MLNatalChartCalculator()
+
+    async def inline_job(birth):
+        calculator.calculate_natal_chart_ml("москва", birth, "Europe/Moscow")
+
+    executor = ComputeExecutor()
+    await executor.start()
+
+    await _run_scenario("inline", [inline_job(birth) for birth in births])
+    await _run_scenario("pool", [executor.calculate_natal_chart("москва", birth, "Europe/Moscow") for birth in births])
+
+    print(f"Метрики пула: {executor.get_stats()}")
+    await executor.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
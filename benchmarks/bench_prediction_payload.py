@@ -0,0 +1,122 @@
+"""
+Объем записи данных на дату: копии натальной карты и психоматрицы против ссылок.
+
+Строит данные на дату для реальной натальной карты в прежнем формате (с
+копиями natal_chart и psyho_matrix) и в новом (references), затем для каждого
+формата делает upsert строк prediction_history временных пользователей по
+одной транзакции, как конвейер, и замеряет время, объем WAL и размер строк.
+В конце сверяет, что resolve_prediction_payload собирает те же данные для модели.
+Нужна рабочая БД из DATABASE_URL с таблицей prediction_history.
+
+Запуск:
+    python -m benchmarks.bench_prediction_payload [число_строк]
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+from backend.biorhythm_calculator import BiorhythmCalculator
+from backend.chart_cache import user_chart_cache, user_chart_key
+from backend.database import async_engine, async_session
+from backend.natal_chart import DEFAULT_COORDINATES, MLNatalChartCalculator
+from backend.partitions import ensure_monthly_partitions
+from backend.prediction_services import DataCombiner, PREDICTION_HISTORY_TABLE, prediction_history_upsert, \
+    prediction_references, resolve_prediction_payload
+from backend.predictions import AstroPredictor
+from backend.psyho_matrix import PsyhoMatrixCalculator
+
+FIRST_TELEGRAM_ID = 9_000_000_000
+BIRTH_DATE = date(1990, 5, 1)
+NATAL_VERSION = 'bench'
+
+
+async def write_rows(driver_connection, rows, target_date: date):
+    """Upsert строк по одной транзакции; (секунды, байт WAL, байт в строках)"""
+    wal_before = await driver_connection.fetchval("SELECT pg_current_wal_lsn()")
+    started = time.perf_counter()
+    for telegram_id, prediction_data in rows:
+        async with async_session() as session:
+            await session.execute(prediction_history_upsert(telegram_id, target_date, prediction_data))
+            await session.commit()
+    elapsed = time.perf_counter() - started
+    wal_bytes = await driver_connection.fetchval(
+        "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), $1)", wal_before)
+    stored_bytes = await driver_connection.fetchval(
+        "SELECT sum(pg_column_size(predictions)) FROM prediction_history WHERE target_date = $1 "
+        "AND telegram_id >= $2", target_date, FIRST_TELEGRAM_ID)
+    return elapsed, int(wal_bytes), int(stored_bytes)
+
+
+async def main():
+    rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    logging.disable(logging.INFO)
+    async_engine.echo = False
+
+    natal_data = MLNatalChartCalculator().calculate_natal_chart_ml(
+        "Москва", datetime.combine(BIRTH_DATE, dt_time(12, 0)), 'Europe/Moscow', DEFAULT_COORDINATES)
+    matrix_data = PsyhoMatrixCalculator().calculate_matrix(BIRTH_DATE)
+    target_date = date.today()
+    combined_data = DataCombiner().combine_calculation_data(
+        AstroPredictor(natal_data).generate_prediction(target_date),
+        BiorhythmCalculator().calculate_biorhythms(BIRTH_DATE, target_date))
+
+    def payload(telegram_id: int, embedded: bool):
+        data = {
+            'calculation_date': datetime.now().isoformat(),
+            'target_date': target_date.isoformat(),
+            'daily_calculations': combined_data
+        }
+        if embedded:
+            data.update(natal_chart=natal_data, psyho_matrix=matrix_data)
+        else:
+            data['references'] = prediction_references(telegram_id, NATAL_VERSION, BIRTH_DATE)
+        return data
+
+    telegram_ids = [FIRST_TELEGRAM_ID + i for i in range(rows_count)]
+    embedded_size = len(json.dumps(payload(telegram_ids[0], True), ensure_ascii=False).encode())
+    reference_size = len(json.dumps(payload(telegram_ids[0], False), ensure_ascii=False).encode())
+    print(f"JSON одной строки: с копиями {embedded_size} байт, со ссылками {reference_size} байт "
+          f"(x{embedded_size / reference_size:.1f})")
+
+    # Две даты одного месяца (или соседних), чтобы форматы не перезаписывали друг друга
+    dates = {'embedded': target_date, 'references': target_date + timedelta(days=1)}
+    await ensure_monthly_partitions(PREDICTION_HISTORY_TABLE, min(dates.values()), max(dates.values()))
+
+    async with async_engine.connect() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id >= $1", FIRST_TELEGRAM_ID)
+        await driver_connection.copy_records_to_table(
+            'users', columns=('telegram_id', 'birth_date', 'birth_time', 'birth_city'),
+            records=[(telegram_id, BIRTH_DATE, dt_time(12, 0), 'Москва') for telegram_id in telegram_ids])
+
+        results = {}
+        for name, embedded in (('embedded', True), ('references', False)):
+            rows = [(telegram_id, payload(telegram_id, embedded)) for telegram_id in telegram_ids]
+            results[name] = await write_rows(driver_connection, rows, dates[name])
+
+        for name, title in (('embedded', 'С копиями карты и матрицы'), ('references', 'Со ссылками')):
+            elapsed, wal_bytes, stored_bytes = results[name]
+            print(f"{title:27} {elapsed / rows_count * 1e3:6.2f} мс на upsert, "
+                  f"WAL {wal_bytes / rows_count / 1024:7.1f} КБ на строку, "
+                  f"в таблице {stored_bytes / rows_count / 1024:6.1f} КБ на строку")
+        print(f"Снижение WAL: x{results['embedded'][1] / results['references'][1]:.1f}")
+
+        # Сборка данных для модели по ссылкам совпадает с прежними копиями
+        user_chart_cache.put(user_chart_key(telegram_ids[0], NATAL_VERSION), natal_data)
+        started = time.perf_counter()
+        resolved = await resolve_prediction_payload(payload(telegram_ids[0], False))
+        resolve_time = time.perf_counter() - started
+        assert resolved['natal_chart'] == natal_data and resolved['natal_chart_status'] == 'resolved'
+        for field in ('basic_numbers', 'pythagoras_matrix', 'digit_counts'):
+            assert resolved['psyho_matrix'][field] == matrix_data[field]
+        print(f"Сборка данных для модели по ссылкам: {resolve_time * 1e3:.2f} мс, совпадает с копиями")
+
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id >= $1", FIRST_TELEGRAM_ID)
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""
+Таблица психоматриц для всех дат рождения 1900-2100.
+
+Сверяет calculate_matrix (выборка из таблицы) с прежним расчетом по цифрам
+для каждой даты диапазона и сравнивает время одного вызова и пакетной выборки.
+
+Запуск:
+    python -m benchmarks.bench_psyho_matrix_table [число_вызовов]
+"""
+import logging
+import random
+import sys
+import time
+import timeit
+from datetime import date, timedelta
+
+from backend.psyho_matrix import MATRIX_FIRST_DATE, MATRIX_LAST_DATE, PsyhoMatrixCalculator, get_matrix_table
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logging.disable(logging.INFO)
+    calculator = PsyhoMatrixCalculator()
+
+    started = time.perf_counter()
+    table = get_matrix_table()
+    print(f"Построение таблицы: {(time.perf_counter() - started) * 1e3:.1f} мс, "
+          f"{len(table)} дат, {table.nbytes / 2 ** 20:.2f} МБ")
+
+    checked = 0
+    current = MATRIX_FIRST_DATE
+    while current <= MATRIX_LAST_DATE:
+        expected = calculator._calculate_matrix_direct(current)
+        actual = calculator.calculate_matrix(current)
+        expected.pop('calculated_at')
+        actual.pop('calculated_at')
+        assert actual == expected, current
+        checked += 1
+        current += timedelta(days=1)
+    print(f"Сверка с расчетом по цифрам: {checked} дат совпали")
+
+    birth_date = date(1990, 5, 1)
+    direct = timeit.timeit(lambda: calculator._calculate_matrix_direct(birth_date), number=calls)
+    lookup = timeit.timeit(lambda: calculator.lookup(birth_date), number=calls)
+    full = timeit.timeit(lambda: calculator.calculate_matrix(birth_date), number=calls)
+    print(f"Расчет по цифрам:            {direct / calls * 1e6:6.2f} мкс")
+    print(f"Выборка записи из таблицы:   {lookup / calls * 1e6:6.2f} мкс  (x{direct / lookup:.1f})")
+    print(f"Выборка + словарь:           {full / calls * 1e6:6.2f} мкс  (x{direct / full:.1f})")
+
+    rng = random.Random(0)
+    birth_dates = [date(1940, 1, 1) + timedelta(days=rng.randrange(30000)) for _ in range(100000)]
+    started = time.perf_counter()
+    records = calculator.lookup_batch(birth_dates)
+    print(f"Пакетная выборка {len(records)} дат: {(time.perf_counter() - started) * 1e3:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
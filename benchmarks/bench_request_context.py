@@ -0,0 +1,113 @@
+"""
+Чтения одного обновления: отдельные сессии сервисов против контекста обновления.
+
+Для тестового пользователя читает профиль, натальную карту, психоматрицу и
+биоритмы (прежний набор запросов проверки статуса данных)
+    1. без контекста - каждая функция в собственной сессии, биоритмы еще раз
+       читают профиль;
+    2. с RequestContext, как в обработчике за RequestContextMiddleware;
+считает выдачи соединений из пула, SQL-запросы и среднюю задержку.
+Сценарий обработчика "📅 Получить данные" -> "📅 Сегодня" проверяет, что
+конвейер в контексте обновления не читает профиль повторно.
+Нужна рабочая БД из DATABASE_URL.
+
+Запуск:
+    python -m benchmarks.bench_request_context [число_повторов]
+"""
+import asyncio
+import logging
+import sys
+import time
+from datetime import date, time as dt_time
+
+from sqlalchemy import event
+
+from backend.assistant import assistant
+from backend.biorhythm_services import get_user_biorhythms
+from backend.chart_services import get_user_natal_chart
+from backend.database import async_engine
+from backend.matrix_services import get_user_matrix
+from backend.request_context import RequestContext
+from backend.user_services import get_user_profile
+
+TELEGRAM_ID = 9_000_000_001
+
+counters = {'checkouts': 0, 'statements': 0}
+
+
+@event.listens_for(async_engine.sync_engine.pool, 'checkout')
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    counters['checkouts'] += 1
+
+
+@event.listens_for(async_engine.sync_engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counters['statements'] += 1
+
+
+async def reads_separate_sessions():
+    """Каждая функция открывает свою сессию"""
+    await get_user_profile(TELEGRAM_ID)
+    await get_user_natal_chart(TELEGRAM_ID)
+    await get_user_matrix(TELEGRAM_ID)
+    await get_user_biorhythms(TELEGRAM_ID)
+
+
+async def reads_request_context():
+    ctx = RequestContext(TELEGRAM_ID)
+    try:
+        await get_user_profile(TELEGRAM_ID, ctx)
+        await get_user_natal_chart(TELEGRAM_ID, ctx)
+        await get_user_matrix(TELEGRAM_ID, ctx)
+        await get_user_biorhythms(TELEGRAM_ID, ctx=ctx)
+    finally:
+        await ctx.close()
+
+
+async def measure(scenario, repeats: int):
+    await scenario()
+    counters.update(checkouts=0, statements=0)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        await scenario()
+    elapsed_ms = (time.perf_counter() - started) / repeats * 1e3
+    return counters['checkouts'] / repeats, counters['statements'] / repeats, elapsed_ms
+
+
+async def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    logging.disable(logging.INFO)
+    async_engine.echo = False
+
+    result = await assistant.collect_user_data(TELEGRAM_ID, date(1990, 5, 1), dt_time(12, 0), 'Москва',
+                                               current_city='Москва', profession='Инженер')
+    assert result['success'], result
+
+    print(f"Чтения обновления, {repeats} повторов")
+    for title, scenario in (('Отдельные сессии', reads_separate_sessions),
+                            ('RequestContext', reads_request_context)):
+        checkouts, statements, elapsed_ms = await measure(scenario, repeats)
+        print(f"{title:18} соединений: {checkouts:.0f}, запросов: {statements:.0f}, {elapsed_ms:6.2f} мс")
+
+    # Обновление "📅 Сегодня" (повторное, секции и кэши уже готовы): конвейер в сессии
+    # контекста, профиль после него - из контекста без запроса
+    await assistant.get_recommendations(TELEGRAM_ID, date.today())
+    ctx = RequestContext(TELEGRAM_ID)
+    counters.update(checkouts=0, statements=0)
+    recommendations = await assistant.get_recommendations(TELEGRAM_ID, date.today(), ctx)
+    assert recommendations['success'], recommendations
+    profile = await get_user_profile(TELEGRAM_ID, ctx)
+    await ctx.close()
+    assert profile['telegram_id'] == TELEGRAM_ID
+    print(f"Данные на сегодня с контекстом: соединений {counters['checkouts']}, "
+          f"запросов {counters['statements']} (включая повторное чтение профиля)")
+    assert counters['checkouts'] == 1 and counters['statements'] == 1
+
+    async with async_engine.begin() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id = $1", TELEGRAM_ID)
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
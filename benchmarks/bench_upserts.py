@@ -0,0 +1,133 @@
+"""
+Запись строк: SELECT + изменение в ORM + commit против INSERT ... ON CONFLICT.
+
+Для временных пользователей пишет психоматрицу (JSON, как matrix_services)
+    1. прежним способом - SELECT строки в ORM, изменение или add, commit;
+    2. upsert_row - один INSERT ... ON CONFLICT DO UPDATE ... RETURNING;
+    3. bulk_upsert - пакетами по 1000 строк в одной транзакции;
+замеряет задержку одной записи (вставка и обновление), пропускную способность
+при параллельных запросах и проверяет "двойное нажатие": два одновременных
+сохранения нового пользователя прежним способом приводят к ошибке первичного
+ключа, upsert - нет. Нужна рабочая БД из DATABASE_URL.
+
+Запуск:
+    python -m benchmarks.bench_upserts [число_пользователей]
+"""
+import asyncio
+import logging
+import sys
+import time
+from datetime import date, time as dt_time
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import select
+
+from backend.database import async_engine, async_session, PsyhoMatrix
+from backend.psyho_matrix import PsyhoMatrixCalculator
+from backend.upserts import bulk_upsert, upsert_row
+
+FIRST_TELEGRAM_ID = 9_000_000_000
+CONCURRENCY = 8
+
+
+async def save_select_mutate(telegram_id: int, matrix_data: dict):
+    """Прежний способ matrix_services.calculate_and_save_psyho_matrix"""
+    async with async_session() as session:
+        result = await session.execute(select(PsyhoMatrix).where(PsyhoMatrix.telegram_id == telegram_id))
+        psyho_matrix = result.scalar_one_or_none()
+        if psyho_matrix:
+            psyho_matrix.matrix_data = matrix_data
+        else:
+            session.add(PsyhoMatrix(telegram_id=telegram_id, matrix_data=matrix_data))
+        await session.commit()
+
+
+async def save_upsert(telegram_id: int, matrix_data: dict):
+    async with async_session() as session:
+        await upsert_row(session, PsyhoMatrix, {'telegram_id': telegram_id, 'matrix_data': matrix_data})
+        await session.commit()
+
+
+async def sequential(save, telegram_ids, matrix_data) -> float:
+    """Средняя задержка одной записи, мс"""
+    started = time.perf_counter()
+    for telegram_id in telegram_ids:
+        await save(telegram_id, matrix_data)
+    return (time.perf_counter() - started) / len(telegram_ids) * 1e3
+
+
+async def concurrent(save, telegram_ids, matrix_data) -> float:
+    """Записей в секунду при CONCURRENCY одновременных запросах"""
+    queue = list(telegram_ids)
+
+    async def worker():
+        while queue:
+            await save(queue.pop(), matrix_data)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    return len(telegram_ids) / (time.perf_counter() - started)
+
+
+async def double_tap(save, telegram_ids, matrix_data) -> int:
+    """Число ошибок при двух одновременных сохранениях для каждого нового пользователя"""
+    errors = 0
+    for telegram_id in telegram_ids:
+        results = await asyncio.gather(save(telegram_id, matrix_data), save(telegram_id, matrix_data),
+                                       return_exceptions=True)
+        errors += sum(isinstance(result, IntegrityError) for result in results)
+    return errors
+
+
+async def clear_matrices(driver_connection):
+    await driver_connection.execute("DELETE FROM psyho_matrix WHERE telegram_id >= $1", FIRST_TELEGRAM_ID)
+
+
+async def main():
+    users_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    logging.disable(logging.INFO)
+    async_engine.echo = False
+    matrix_data = PsyhoMatrixCalculator().calculate_matrix(date(1990, 5, 1))
+    telegram_ids = [FIRST_TELEGRAM_ID + i for i in range(users_count)]
+    race_ids = telegram_ids[:min(200, users_count)]
+
+    async with async_engine.connect() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id >= $1", FIRST_TELEGRAM_ID)
+        await driver_connection.copy_records_to_table(
+            'users', columns=('telegram_id', 'birth_date', 'birth_time', 'birth_city'),
+            records=[(telegram_id, date(1990, 5, 1), dt_time(12, 0), 'Москва') for telegram_id in telegram_ids])
+
+        results = {}
+        for name, save in (('select', save_select_mutate), ('upsert', save_upsert)):
+            await clear_matrices(driver_connection)
+            # Каждый проход пишет другие данные, иначе ORM не выполнит UPDATE неизмененной строки
+            insert_ms = await sequential(save, telegram_ids, {**matrix_data, 'pass': 1})
+            update_ms = await sequential(save, telegram_ids, {**matrix_data, 'pass': 2})
+            throughput = await concurrent(save, telegram_ids, {**matrix_data, 'pass': 3})
+            await clear_matrices(driver_connection)
+            errors = await double_tap(save, race_ids, matrix_data)
+            results[name] = (insert_ms, update_ms, throughput, errors)
+
+        await clear_matrices(driver_connection)
+        rows = [{'telegram_id': telegram_id, 'matrix_data': matrix_data} for telegram_id in telegram_ids]
+        started = time.perf_counter()
+        await bulk_upsert(PsyhoMatrix, rows)
+        await bulk_upsert(PsyhoMatrix, rows)
+        bulk_throughput = 2 * users_count / (time.perf_counter() - started)
+
+        print(f"{users_count} пользователей, параллельно {CONCURRENCY} запросов")
+        for name, title in (('select', 'SELECT + ORM + commit'), ('upsert', 'INSERT ON CONFLICT')):
+            insert_ms, update_ms, throughput, errors = results[name]
+            print(f"{title:22} вставка {insert_ms:5.2f} мс, обновление {update_ms:5.2f} мс, "
+                  f"{throughput:7.0f} записей/с параллельно, ошибок при двойном нажатии: {errors}/{len(race_ids)}")
+        print(f"{'bulk_upsert':22} {bulk_throughput:7.0f} записей/с")
+        print(f"Ускорение обновления: x{results['select'][1] / results['upsert'][1]:.1f}, "
+              f"пропускной способности: x{results['upsert'][2] / results['select'][2]:.1f}")
+
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id >= $1", FIRST_TELEGRAM_ID)
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
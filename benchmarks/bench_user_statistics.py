@@ -0,0 +1,103 @@
+"""
+Статистика пользователей: загрузка всех строк против агрегата и счетчиков.
+
+Загружает временных пользователей через COPY (счетчики обновляет триггер
+уровня оператора), затем сравнивает
+    1. прежний get_users_statistics - два select(User) с len(all()) и AVG;
+    2. aggregate_user_statistics - один запрос COUNT/AVG ... FILTER;
+    3. counter_user_statistics - сумма 16 строк user_stats_counters;
+проверяет совпадение результатов, в том числе после пакетной записи счетчиков
+обращений (request_counters) и удаления пользователей.
+Нужна рабочая БД из DATABASE_URL с установленным db_user_statistics.sql.
+
+Запуск:
+    python -m benchmarks.bench_user_statistics [число_пользователей]
+"""
+import asyncio
+import logging
+import random
+import sys
+import time
+from datetime import date, time as dt_time
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from backend.database import async_engine, async_session, User
+from backend.request_counters import RequestCounterBuffer
+from backend.user_statistics import aggregate_user_statistics, counter_user_statistics
+
+FIRST_TELEGRAM_ID = 9_000_000_000
+REPEATS = 5
+
+
+async def load_all_statistics():
+    """Прежний способ: каждый пользователь загружается в ORM"""
+    async with async_session() as session:
+        total_users = len((await session.execute(select(User).where(User.telegram_id.isnot(None)))).scalars().all())
+        users_with_gender = len((await session.execute(select(User).where(User.gender.isnot(None)))).scalars().all())
+        average_requests = (await session.execute(
+            select(func.avg(User.request_count)).where(User.request_count > 0))).scalar() or 0
+    return total_users, users_with_gender, round(float(average_requests), 2)
+
+
+async def timed(func_, repeats: int = REPEATS):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        result = await func_()
+    return result, (time.perf_counter() - started) / repeats * 1e3
+
+
+def comparable(statistics: dict):
+    return statistics['total_users'], statistics['users_with_gender'], statistics['average_requests']
+
+
+async def main():
+    users_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    logging.disable(logging.INFO)
+    async_engine.echo = False
+    rng = random.Random(0)
+    genders = ('male', 'female', None)
+
+    async with async_engine.connect() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id >= $1", FIRST_TELEGRAM_ID)
+        started = time.perf_counter()
+        await driver_connection.copy_records_to_table(
+            'users', columns=('telegram_id', 'birth_date', 'birth_time', 'birth_city', 'gender', 'request_count'),
+            records=[(FIRST_TELEGRAM_ID + i, date(1990, 5, 1), dt_time(12, 0), 'Москва', rng.choice(genders),
+                      rng.choice((0, 0, rng.randrange(1, 50)))) for i in range(users_count)])
+        print(f"COPY {users_count} пользователей с триггером счетчиков: {time.perf_counter() - started:.1f} с")
+
+    counters = await counter_user_statistics()
+    assert counters is not None, "Счетчики не установлены: выполните db_user_statistics.sql"
+
+    old_result, old_ms = await timed(load_all_statistics, 1)
+    aggregate, aggregate_ms = await timed(aggregate_user_statistics)
+    counters, counters_ms = await timed(counter_user_statistics)
+    assert old_result == comparable(aggregate) == comparable(counters), (old_result, aggregate, counters)
+    print(f"Загрузка всех строк:   {old_ms:9.1f} мс")
+    print(f"COUNT ... FILTER:      {aggregate_ms:9.1f} мс")
+    print(f"Счетчики (16 строк):   {counters_ms:9.2f} мс")
+    print(f"Результаты совпадают: {comparable(counters)}")
+
+    # Пакетная запись счетчиков обращений проходит через триггер UPDATE одним оператором
+    buffer = RequestCounterBuffer()
+    for i in range(0, users_count, 7):
+        buffer.increment(FIRST_TELEGRAM_ID + i, rng.randrange(1, 4))
+    started = time.perf_counter()
+    flushed = await buffer.flush()
+    flush_ms = (time.perf_counter() - started) * 1e3
+    assert comparable(await aggregate_user_statistics()) == comparable(await counter_user_statistics())
+    print(f"Запись счетчиков обращений {flushed} пользователей: {flush_ms:.0f} мс, счетчики совпадают")
+
+    async with async_engine.begin() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await driver_connection.execute("DELETE FROM users WHERE telegram_id >= $1", FIRST_TELEGRAM_ID)
+    assert comparable(await aggregate_user_statistics()) == comparable(await counter_user_statistics())
+    print("После удаления пользователей счетчики совпадают")
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
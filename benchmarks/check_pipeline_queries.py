@@ -0,0 +1,60 @@
+"""
+Проверка числа SQL-запросов конвейера get_recommendations.
+
+Создает тестового пользователя (если его нет), выполняет конвейер на сегодня
+и завтра и проверяет, что каждый вызов укладывается в MAX_PIPELINE_STATEMENTS
+запросов. Нужна рабочая БД из DATABASE_URL; без БД тот же предел проверяет
+tests/test_prediction_pipeline.py.
+
+Запуск:
+    python -m benchmarks.check_pipeline_queries [telegram_id]
+"""
+import asyncio
+import sys
+import time
+from datetime import date, time as dt_time, timedelta
+
+from sqlalchemy import event
+
+from backend.assistant import PersonalAssistant
+from backend.compute_executor import compute_executor
+from backend.database import async_engine
+from backend.prediction_pipeline import MAX_PIPELINE_STATEMENTS, prepare_pipeline_partitions, run_prediction_pipeline
+from backend.request_counters import request_counters
+from backend.user_services import get_user_profile
+
+TEST_TELEGRAM_ID = 999000001
+
+
+async def main():
+    telegram_id = int(sys.argv[1]) if len(sys.argv) > 1 else TEST_TELEGRAM_ID
+    if await get_user_profile(telegram_id) is None:
+        await PersonalAssistant().collect_user_data(telegram_id, date(1990, 5, 1), dt_time(12, 0), "Новосибирск")
+
+    # Секции создаются при старте бота, до запросов пользователей
+    await prepare_pipeline_partitions()
+
+    statements = []
+    event.listen(async_engine.sync_engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    for target_date in (date.today(), date.today() + timedelta(days=1)):
+        statements.clear()
+        started = time.perf_counter()
+        await run_prediction_pipeline(telegram_id, target_date)
+        elapsed = time.perf_counter() - started
+        print(f"{target_date}: {len(statements)} запросов, {elapsed * 1e3:.1f} мс")
+        for statement in statements:
+            print(f"    {' '.join(statement.split())[:110]}")
+        assert len(statements) <= MAX_PIPELINE_STATEMENTS, \
+            f"Конвейер выполнил {len(statements)} запросов, допустимо {MAX_PIPELINE_STATEMENTS}"
+
+    print(f"✅ Конвейер укладывается в {MAX_PIPELINE_STATEMENTS} запроса")
+    # Счетчики обращений пишутся вне конвейера
+    await request_counters.flush()
+    await compute_executor.shutdown()
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -7,6 +7,7 @@ from datetime import datetime, date, timedelta
 import logging
 
 from backend.assistant import assistant
+from backend.request_context import RequestContext
 
 logger = logging.getLogger(__name__)
 
@@ -83,11 +84,11 @@ async def cmd_start(message: types.Message):
 
 
 @router.message(lambda message: message.text == "📊 Расчет натальной карты")
-async def start_data_collection(message: types.Message, state: FSMContext):
+async def start_data_collection(message: types.Message, state: FSMContext, ctx: RequestContext):
     """Начало сбора данных пользователя"""
 
     # Проверяем статус данных пользователя
-    status = await assistant.get_user_data_status(message.from_user.id)
+    status = await assistant.get_user_data_status(message.from_user.id, ctx)
 
     if status['is_complete']:
         await message.answer(
@@ -195,7 +196,7 @@ async def process_job_position(message: types.Message, state: FSMContext):
 
 
 @router.message(DataCollectionStates.waiting_for_gender)
-async def process_gender(message: types.Message, state: FSMContext):
+async def process_gender(message: types.Message, state: FSMContext, ctx: RequestContext):
     """Обработка пола и завершение сбора данных"""
     gender_map = {
         "👨 мужской": "male",
@@ -234,7 +235,8 @@ async def process_gender(message: types.Message, state: FSMContext):
             current_city=user_data['current_city'],
             profession=user_data['profession'],
             job_position=user_data.get('job_position'),
-            gender=gender  # ПЕРЕДАЕМ ПОЛ
+            gender=gender,  # ПЕРЕДАЕМ ПОЛ
+            ctx=ctx
         )
 
         if result['success']:
@@ -262,10 +264,10 @@ async def process_gender(message: types.Message, state: FSMContext):
 
 
 @router.message(lambda message: message.text == "📅 Получить данные")
-async def select_date_option(message: types.Message):
+async def select_date_option(message: types.Message, ctx: RequestContext):
     """Выбор даты для получения данных"""
     # Проверяем наличие данных
-    status = await assistant.get_user_data_status(message.from_user.id)
+    status = await assistant.get_user_data_status(message.from_user.id, ctx)
     if not status['is_complete']:
         await message.answer(
             "❌ Сначала необходимо собрать данные!\n"
@@ -281,16 +283,16 @@ async def select_date_option(message: types.Message):
 
 
 @router.message(lambda message: message.text == "📅 Сегодня")
-async def get_todays_data(message: types.Message):
+async def get_todays_data(message: types.Message, ctx: RequestContext):
     """Получение данных на сегодня"""
-    await process_date_selection(message, date.today())
+    await process_date_selection(message, date.today(), ctx)
 
 
 @router.message(lambda message: message.text == "📅 Завтра")
-async def get_tomorrows_data(message: types.Message):
+async def get_tomorrows_data(message: types.Message, ctx: RequestContext):
     """Получение данных на завтра"""
     tomorrow = date.today() + timedelta(days=1)
-    await process_date_selection(message, tomorrow)
+    await process_date_selection(message, tomorrow, ctx)
 
 
 @router.message(lambda message: message.text == "📅 Выбрать дату")
@@ -304,7 +306,7 @@ async def request_custom_date(message: types.Message, state: FSMContext):
 
 
 @router.message(DateSelectionStates.waiting_for_custom_date)
-async def process_custom_date(message: types.Message, state: FSMContext):
+async def process_custom_date(message: types.Message, state: FSMContext, ctx: RequestContext):
     """Обработка введенной пользователем даты"""
     try:
         target_date = datetime.strptime(message.text, "%Y-%m-%d").date()
@@ -317,7 +319,7 @@ async def process_custom_date(message: types.Message, state: FSMContext):
             )
             return
 
-        await process_date_selection(message, target_date)
+        await process_date_selection(message, target_date, ctx)
 
     except ValueError:
         await message.answer(
@@ -337,12 +339,12 @@ async def go_back_to_main(message: types.Message):
     )
 
 
-async def process_date_selection(message: types.Message, target_date: date):
+async def process_date_selection(message: types.Message, target_date: date, ctx: RequestContext = None):
     """Общая обработка выбранной даты"""
     processing_msg = await message.answer(f"🔄 Формирую данные на {target_date.strftime('%d.%m.%Y')}...")
 
     try:
-        result = await assistant.get_recommendations(message.from_user.id, target_date)
+        result = await assistant.get_recommendations(message.from_user.id, target_date, ctx)
 
         if result['success']:
             # Отправляем пользователю форматированные данные
@@ -373,10 +375,10 @@ async def process_date_selection(message: types.Message, target_date: date):
 
 
 @router.message(Command("status"))
-async def cmd_status(message: types.Message):
+async def cmd_status(message: types.Message, ctx: RequestContext):
     """Проверка статуса данных пользователя"""
     try:
-        status = await assistant.get_user_data_status(message.from_user.id)
+        status = await assistant.get_user_data_status(message.from_user.id, ctx)
 
         status_text = "📊 **Статус ваших данных:**\n\n"
 
@@ -4,7 +4,15 @@ import logging
 
 from bot.config import TOKEN
 from bot.handlers import router
+from bot.middlewares import RequestContextMiddleware
 from backend.db_connection import check_db_connection
+from backend.compute_executor import compute_executor
+from backend.geocoding import geocoder
+from backend.prediction_cache import prediction_cache
+from backend.data_status import data_status_cache
+from backend.precompute_scheduler import precompute_scheduler
+from backend.prediction_pipeline import prepare_pipeline_partitions
+from backend.request_counters import request_counters
 import math
 from datetime import date, datetime, timedelta
 from typing import Dict, List, Tuple
@@ -302,9 +310,27 @@ async def main():
             logger.error("❌ Не удалось подключиться к базе данных. Завершение работы.")
             return
 
+        # Секции таблиц конвейера создаются до запросов пользователей, а не в конвейере
+        await prepare_pipeline_partitions()
+
+        # Индекс газеттира открывается (или строится) до первого поиска города
+        await geocoder.preload()
+
+        # Запускаем пул процессов для расчетов натальных карт и транзитов
+        await compute_executor.start()
+
+        # Счетчики обращений пишутся в БД пакетно
+        request_counters.start()
+
+        # Ночной предрасчет данных на сегодня и завтра в часы низкой нагрузки
+        precompute_scheduler.start()
+
         bot = Bot(token=TOKEN)
         dp = Dispatcher()
 
+        # Одна сессия БД и один профиль пользователя на обновление
+        dp.update.outer_middleware(RequestContextMiddleware())
+
         # Подключаем роутер
         dp.include_router(router)
 
@@ -320,6 +346,15 @@ async def main():
     finally:
         if 'bot' in locals():
             await bot.close()
+        await precompute_scheduler.stop()
+        await request_counters.stop()
+        logger.info(f"📊 Статистика счетчиков обращений: {request_counters.get_stats()}")
+        await compute_executor.shutdown()
+        await geocoder.close()
+        logger.info(f"📊 Статистика геокодинга: {geocoder.get_stats()}")
+        logger.info(f"📊 Статистика кэшей транзитов рабочих процессов: {compute_executor.transit_cache_stats}")
+        logger.info(f"📊 Статистика кэша данных на дату: {prediction_cache.get_stats()}")
+        logger.info(f"📊 Статистика кэша статусов данных: {data_status_cache.get_stats()}")
         logger.info("🛑 Бот остановлен")
 
 
@@ -0,0 +1,34 @@
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from typing import Any, Awaitable, Callable, Dict
+import logging
+
+from backend.request_context import RequestContext
+
+logger = logging.getLogger(__name__)
+
+
+class RequestContextMiddleware(BaseMiddleware):
+    """
+    Outer-middleware обновлений: один RequestContext (сессия БД и лениво
+    загружаемый профиль) на обновление. Обработчики получают его аргументом ctx
+    и передают в сервисы ассистента; сессия закрывается после обработки.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        # Пользователя события определяет встроенный UserContextMiddleware
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        ctx = RequestContext(user.id)
+        data['ctx'] = ctx
+        try:
+            return await handler(event, data)
+        finally:
+            await ctx.close()
@@ -0,0 +1,56 @@
+-- Типизированная история биоритмов (backend/biorhythm_history.py)
+-- Заменяет JSON-записи в biorhythms; развитие наброска biorhythm_full из Script-6.sql
+-- Скрипт можно запускать многократно
+
+CREATE TABLE IF NOT EXISTS biorhythm_history (
+    telegram_id BIGINT NOT NULL REFERENCES users(telegram_id) ON DELETE CASCADE,
+    calculation_date DATE NOT NULL,
+    days_lived INTEGER NOT NULL,
+
+    physical_value REAL NOT NULL,
+    physical_percentage REAL NOT NULL,
+    physical_trend SMALLINT NOT NULL,        -- 1 растет, -1 падает, 0 стабильно
+
+    emotional_value REAL NOT NULL,
+    emotional_percentage REAL NOT NULL,
+    emotional_trend SMALLINT NOT NULL,
+
+    intellectual_value REAL NOT NULL,
+    intellectual_percentage REAL NOT NULL,
+    intellectual_trend SMALLINT NOT NULL,
+
+    intuitive_value REAL NOT NULL,
+    intuitive_percentage REAL NOT NULL,
+    intuitive_trend SMALLINT NOT NULL,
+
+    overall_value REAL NOT NULL,
+    overall_percentage REAL NOT NULL,
+    is_critical BOOLEAN NOT NULL,
+    is_peak BOOLEAN NOT NULL,
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    -- Первичный ключ служит индексом для чтения диапазона дат пользователя
+    PRIMARY KEY (telegram_id, calculation_date)
+) PARTITION BY RANGE (calculation_date);
+
+-- Секции по месяцам: текущий год и следующий. Остальные создаются приложением
+-- перед записью (ensure_history_partitions)
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(date_trunc('year', CURRENT_DATE), date_trunc('year', CURRENT_DATE) + INTERVAL '23 months',
+                               INTERVAL '1 month')::DATE
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF biorhythm_history FOR VALUES FROM (%L) TO (%L)',
+            'biorhythm_history_' || to_char(month_start, 'YYYY_MM'),
+            month_start,
+            (month_start + INTERVAL '1 month')::DATE
+        );
+    END LOOP;
+END $$;
+
+GRANT ALL PRIVILEGES ON biorhythm_history TO pers_assist;
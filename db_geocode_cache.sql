@@ -0,0 +1,18 @@
+-- Кэш геокодинга городов (backend/geocoding.py)
+-- Скрипт можно запускать многократно
+
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    query_key VARCHAR(200) PRIMARY KEY,
+    lat DOUBLE PRECISION,
+    lon DOUBLE PRECISION,
+    elevation DOUBLE PRECISION,
+    source VARCHAR(20) NOT NULL,
+    expires_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Отрицательные записи (город не найден) живут ограниченное время
+CREATE INDEX IF NOT EXISTS idx_geocode_cache_expires_at ON geocode_cache(expires_at) WHERE expires_at IS NOT NULL;
+
+GRANT ALL PRIVILEGES ON geocode_cache TO pers_assist;
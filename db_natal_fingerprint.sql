@@ -0,0 +1,7 @@
+-- Отпечаток входных данных натальной карты (backend/natal_chart.py: chart_fingerprint)
+-- Скрипт можно запускать многократно
+
+ALTER TABLE user_natal_charts ADD COLUMN IF NOT EXISTS input_fingerprint VARCHAR(64);
+
+-- Поиск готовой карты с такими же входными данными у других пользователей
+CREATE INDEX IF NOT EXISTS idx_user_natal_charts_input_fingerprint ON user_natal_charts(input_fingerprint);
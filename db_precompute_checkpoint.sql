@@ -0,0 +1,15 @@
+-- Точки продолжения ночного предрасчета данных на дату (backend/precompute_scheduler.py)
+-- Скрипт можно запускать многократно
+
+CREATE TABLE IF NOT EXISTS precompute_checkpoints (
+    job_name VARCHAR(50) NOT NULL,
+    target_date DATE NOT NULL,
+    last_telegram_id BIGINT NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (job_name, target_date)
+);
+
+GRANT ALL PRIVILEGES ON precompute_checkpoints TO pers_assist;
@@ -0,0 +1,35 @@
+-- История данных на дату (backend/prediction_services.py, backend/prediction_pipeline.py)
+-- Вместо одной перезаписываемой строки natal_predictions - строка на пользователя и дату
+-- Скрипт можно запускать многократно
+
+CREATE TABLE IF NOT EXISTS prediction_history (
+    telegram_id BIGINT NOT NULL REFERENCES users(telegram_id) ON DELETE CASCADE,
+    target_date DATE NOT NULL,
+    predictions JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    -- Первичный ключ служит индексом для чтения данных пользователя на дату
+    PRIMARY KEY (telegram_id, target_date)
+) PARTITION BY RANGE (target_date);
+
+-- Секции по месяцам: с начала текущего месяца на год вперед. Остальные создаются
+-- приложением перед записью, старые удаляются целиком (cleanup_old_predictions)
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(date_trunc('month', CURRENT_DATE), date_trunc('month', CURRENT_DATE) + INTERVAL '12 months',
+                               INTERVAL '1 month')::DATE
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF prediction_history FOR VALUES FROM (%L) TO (%L)',
+            'prediction_history_' || to_char(month_start, 'YYYY_MM'),
+            month_start,
+            (month_start + INTERVAL '1 month')::DATE
+        );
+    END LOOP;
+END $$;
+
+GRANT ALL PRIVILEGES ON prediction_history TO pers_assist;
@@ -0,0 +1,107 @@
+-- Счетчики статистики пользователей (backend/user_statistics.py)
+-- Поддерживаются триггерами на users, чтение панели - сумма 16 строк вместо прохода по users
+-- Скрипт можно запускать многократно: счетчики пересчитываются по текущим данным
+
+-- Строки-сегменты по telegram_id % 16, чтобы параллельные записи в users не ждали одну строку
+CREATE TABLE IF NOT EXISTS user_stats_counters (
+    shard SMALLINT PRIMARY KEY,
+    total_users BIGINT NOT NULL DEFAULT 0,
+    users_with_gender BIGINT NOT NULL DEFAULT 0,
+    -- Пользователи с request_count > 0 и сумма их обращений (для среднего)
+    active_users BIGINT NOT NULL DEFAULT 0,
+    total_requests BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Применение изменений одного запроса к users. Триггеры уровня оператора с
+-- таблицами переходов: пакетный UPDATE счетчиков обращений или COPY обновляет
+-- каждый сегмент один раз, а не по разу на строку
+CREATE OR REPLACE FUNCTION user_stats_counters_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE user_stats_counters c SET
+            total_users = c.total_users + d.total_users,
+            users_with_gender = c.users_with_gender + d.users_with_gender,
+            active_users = c.active_users + d.active_users,
+            total_requests = c.total_requests + d.total_requests,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT telegram_id % 16 AS shard,
+                   count(*) AS total_users,
+                   count(*) FILTER (WHERE gender IS NOT NULL) AS users_with_gender,
+                   count(*) FILTER (WHERE request_count > 0) AS active_users,
+                   COALESCE(sum(request_count) FILTER (WHERE request_count > 0), 0) AS total_requests
+            FROM new_users GROUP BY 1
+        ) d
+        WHERE c.shard = d.shard;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE user_stats_counters c SET
+            total_users = c.total_users - d.total_users,
+            users_with_gender = c.users_with_gender - d.users_with_gender,
+            active_users = c.active_users - d.active_users,
+            total_requests = c.total_requests - d.total_requests,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT telegram_id % 16 AS shard,
+                   count(*) AS total_users,
+                   count(*) FILTER (WHERE gender IS NOT NULL) AS users_with_gender,
+                   count(*) FILTER (WHERE request_count > 0) AS active_users,
+                   COALESCE(sum(request_count) FILTER (WHERE request_count > 0), 0) AS total_requests
+            FROM old_users GROUP BY 1
+        ) d
+        WHERE c.shard = d.shard;
+    ELSE
+        -- UPDATE: telegram_id - первичный ключ и не меняется, разница считается по паре строк
+        UPDATE user_stats_counters c SET
+            users_with_gender = c.users_with_gender + d.users_with_gender,
+            active_users = c.active_users + d.active_users,
+            total_requests = c.total_requests + d.total_requests,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT n.telegram_id % 16 AS shard,
+                   sum((n.gender IS NOT NULL)::INT - (o.gender IS NOT NULL)::INT) AS users_with_gender,
+                   sum((COALESCE(n.request_count, 0) > 0)::INT - (COALESCE(o.request_count, 0) > 0)::INT)
+                       AS active_users,
+                   sum(GREATEST(COALESCE(n.request_count, 0), 0) - GREATEST(COALESCE(o.request_count, 0), 0))
+                       AS total_requests
+            FROM new_users n JOIN old_users o ON o.telegram_id = n.telegram_id
+            GROUP BY 1
+        ) d
+        WHERE c.shard = d.shard
+          AND (d.users_with_gender <> 0 OR d.active_users <> 0 OR d.total_requests <> 0);
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+-- Таблицы переходов нельзя объявить у триггера на несколько событий - по триггеру на событие
+DROP TRIGGER IF EXISTS user_stats_counters_insert ON users;
+CREATE TRIGGER user_stats_counters_insert AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_users
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_counters_apply();
+
+DROP TRIGGER IF EXISTS user_stats_counters_update ON users;
+CREATE TRIGGER user_stats_counters_update AFTER UPDATE ON users
+    REFERENCING OLD TABLE AS old_users NEW TABLE AS new_users
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_counters_apply();
+
+DROP TRIGGER IF EXISTS user_stats_counters_delete ON users;
+CREATE TRIGGER user_stats_counters_delete AFTER DELETE ON users
+    REFERENCING OLD TABLE AS old_users
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_counters_apply();
+
+-- Пересчет по текущим данным; блокировка не дает записям в users пройти мимо счетчиков
+BEGIN;
+LOCK TABLE users IN SHARE MODE;
+DELETE FROM user_stats_counters;
+INSERT INTO user_stats_counters (shard, total_users, users_with_gender, active_users, total_requests)
+SELECT s.shard,
+       count(u.telegram_id),
+       count(u.telegram_id) FILTER (WHERE u.gender IS NOT NULL),
+       count(u.telegram_id) FILTER (WHERE u.request_count > 0),
+       COALESCE(sum(u.request_count) FILTER (WHERE u.request_count > 0), 0)
+FROM generate_series(0, 15) AS s(shard)
+LEFT JOIN users u ON u.telegram_id % 16 = s.shard
+GROUP BY s.shard;
+COMMIT;
+
+GRANT ALL PRIVILEGES ON user_stats_counters TO pers_assist;
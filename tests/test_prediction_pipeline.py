@@ -0,0 +1,158 @@
+"""
+Число SQL-запросов конвейера get_recommendations без рабочей БД.
+
+Сессия контекста обновления заменяется поддельной, которая считает вызовы
+execute; натальная карта и данные на дату рассчитываются в этом процессе.
+Любое обращение конвейера к БД мимо сессии (например, DDL секций через
+async_engine) тоже считается ошибкой.
+
+Запуск:
+    python -m pytest tests
+"""
+import asyncio
+from datetime import date, datetime, time as dt_time
+from types import SimpleNamespace
+
+import pytest
+
+from backend import partitions, prediction_pipeline
+from backend.biorhythm_history import HISTORY_TABLE
+from backend.natal_chart import MLNatalChartCalculator, configure_ephemeris
+from backend.prediction_cache import PredictionCache
+from backend.prediction_pipeline import MAX_PIPELINE_STATEMENTS, run_prediction_pipeline
+from backend.prediction_services import PREDICTION_HISTORY_TABLE
+from backend.predictions import AstroPredictor
+from backend.request_context import RequestContext
+
+TELEGRAM_ID = 999_000_101
+TARGET_DATE = date(2031, 3, 15)
+BIRTH_DATE = date(1990, 5, 1)
+
+
+class _FakeResult:
+    def __init__(self, row):
+        self._row = row
+
+    def mappings(self):
+        return self
+
+    def one_or_none(self):
+        return self._row
+
+
+class _FakeTransaction:
+    def __init__(self, session):
+        self._session = session
+
+    async def __aenter__(self):
+        self._session.active = True
+
+    async def __aexit__(self, *exc_info):
+        self._session.active = False
+
+
+class FakeSession:
+    """AsyncSession конвейера: первый запрос возвращает строку профиля, все запросы считаются"""
+
+    def __init__(self, row):
+        self._row = row
+        self.statements = []
+        self.active = False
+
+    def in_transaction(self):
+        return self.active
+
+    def begin(self):
+        return _FakeTransaction(self)
+
+    async def connection(self):
+        return SimpleNamespace(info={})
+
+    async def execute(self, statement):
+        assert self.active, "Запрос конвейера вне транзакции"
+        self.statements.append(str(statement))
+        return _FakeResult(self._row if len(self.statements) == 1 else None)
+
+    async def commit(self):
+        self.active = False
+
+    async def rollback(self):
+        self.active = False
+
+    async def close(self):
+        self.active = False
+
+
+class FakeContext(RequestContext):
+    def __init__(self, session: FakeSession):
+        super().__init__(TELEGRAM_ID)
+        self._fake_session = session
+
+    @property
+    def session(self):
+        return self._fake_session
+
+
+class _NoEngine:
+    def begin(self):
+        raise AssertionError("Конвейер обратился к БД мимо сессии")
+
+    connect = begin
+
+
+@pytest.fixture(scope='module')
+def profile_row():
+    configure_ephemeris()
+    natal_data = MLNatalChartCalculator().calculate_natal_chart_ml(
+        'Москва', datetime(1990, 5, 1, 12, 0), 'Europe/Moscow', (55.7558, 37.6173, 144))
+    return {
+        'telegram_id': TELEGRAM_ID, 'birth_date': BIRTH_DATE, 'birth_time': dt_time(12, 0),
+        'birth_city': 'Москва', 'profession': None, 'job_position': None, 'current_city': 'Москва',
+        'gender': None, 'request_count': 0, 'created_at': datetime(2024, 1, 1),
+        'natal_data': natal_data, 'input_fingerprint': 'test-fingerprint', 'natal_updated_at': None,
+        'stored_predictions': None
+    }
+
+
+@pytest.fixture(autouse=True)
+def offline_pipeline(monkeypatch):
+    async def generate_prediction(natal_data, target_date):
+        return AstroPredictor(natal_data).generate_prediction(target_date)
+
+    monkeypatch.setattr(prediction_pipeline.compute_executor, 'generate_prediction', generate_prediction)
+    monkeypatch.setattr(partitions, 'async_engine', _NoEngine())
+    monkeypatch.setattr(partitions, '_known_partitions', set())
+    monkeypatch.setattr(prediction_pipeline, 'prediction_cache', PredictionCache())
+
+
+def run_pipeline(row, target_date: date = TARGET_DATE):
+    session = FakeSession(row)
+    asyncio.run(run_prediction_pipeline(TELEGRAM_ID, target_date, FakeContext(session)))
+    return session.statements
+
+
+def prepare_partitions():
+    for table in (PREDICTION_HISTORY_TABLE, HISTORY_TABLE):
+        partitions.mark_partitions_known(table, [partitions.month_start(TARGET_DATE)])
+
+
+def test_new_date_within_statement_budget(profile_row):
+    prepare_partitions()
+    statements = run_pipeline(profile_row)
+    assert len(statements) <= MAX_PIPELINE_STATEMENTS, statements
+    assert not any('CREATE TABLE' in statement for statement in statements)
+
+
+def test_repeated_date_reads_only(profile_row):
+    prepare_partitions()
+    run_pipeline(profile_row)
+    assert len(run_pipeline(profile_row)) == 1
+
+
+def test_missing_partition_is_counted(profile_row):
+    statements = run_pipeline(profile_row)
+    assert any('CREATE TABLE IF NOT EXISTS prediction_history_2031_03' in statement for statement in statements)
+    assert len(statements) == MAX_PIPELINE_STATEMENTS + 1
+    # После фиксации секция известна процессу, следующая дата месяца пишется без DDL
+    statements = run_pipeline(profile_row, TARGET_DATE.replace(day=16))
+    assert len(statements) <= MAX_PIPELINE_STATEMENTS, statements